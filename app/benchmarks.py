@@ -0,0 +1,198 @@
+"""Benchmarks das etapas de processamento de dados.
+
+Uso (dentro da pasta /app):
+    python benchmarks.py equalizer
+    python benchmarks.py export
+    python benchmarks.py gif
+"""
+import copy
+import io
+import sys
+import time
+
+import numpy as np
+
+import exporters
+import image_utils
+import utils
+
+# Quantidade de observações (mancha x dia) usada em cada rodada
+SIZES = (10, 100, 1_000, 10_000, 100_000)
+# Manchas visíveis por dia e duração de cada mancha nos dados sintéticos
+REGIONS_PER_DAY = 10
+REGION_LIFETIME = 14
+
+
+def _timed(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+def _synthetic_tables(observations):
+    """Gera tabelas diárias no formato do scrapping com `observations` linhas no total."""
+    tables, days = [], []
+    day = 0
+    while sum(len(table) for table in tables) < observations:
+        first_region = day * REGIONS_PER_DAY // REGION_LIFETIME
+        table = [{
+            'NOAA Number': str(10000 + region),
+            'Latest Position': 'N10W20(300",150")',
+            'Coordinate X': '20',
+            'Coordinate Y': '-10',
+            'Hale Class': 'beta',
+            'McIntosh Class': 'Dao',
+            'Sunspot Area [millionths]': '0100',
+            'Number of Spots': '5',
+            'Date': f'day-{day}',
+        } for region in range(first_region, first_region + REGIONS_PER_DAY)]
+        tables.append(table[:observations - sum(len(t) for t in tables)])
+        days.append(f'day-{day}')
+        day += 1
+    return tables, days
+
+
+def benchmark_equalizer():
+    """Mede process_positions (por dia, como no cache) e data_equalizer em todo o intervalo."""
+    print(f"{'observações':>12} {'process_positions':>18} {'data_equalizer':>15}")
+    for size in SIZES:
+        tables, days = _synthetic_tables(size)
+        full_content = {}
+
+        def process_all():
+            for count, (table, day) in enumerate(zip(tables, days)):
+                full_content[count] = []
+                utils.process_positions([table], full_content[count], [day])
+
+        # Uma única chamada com todos os dias exercita o índice por número NOAA
+        merged = []
+        process_time = _timed(utils.process_positions, tables, merged, days)
+        process_all()
+        equalizer_time = _timed(utils.data_equalizer, copy.deepcopy(full_content))
+        print(f"{size:>12} {process_time * 1000:>16.1f}ms {equalizer_time * 1000:>13.1f}ms")
+
+
+def _synthetic_content(observations, duplicates=0.25):
+    """Conteúdo no formato de data_equalizer com várias regiões; uma fração das posições se repete."""
+    content, total, region = [], 0, 0
+    while total < observations:
+        positions = [{
+            'position': f'N{region % 40:02d}W{day:02d}',
+            'day': f'2024-01-{day + 1:02d}',
+            'x_coordinate': str(day * 10),
+            'y_coordinate': str(region % 40),
+            'longitude': day * 10,
+            'latitude': region % 40,
+        } for day in range(min(REGION_LIFETIME, observations - total))]
+        positions += positions[:int(len(positions) * duplicates)]
+        content.append({'noaaNumber': str(10000 + region), 'latestPositions': positions})
+        total += len(positions)
+        region += 1
+    return content
+
+
+def _list_scan_rows(content):
+    # Deduplicação anterior, com busca linear na lista de linhas já vistas
+    table_data = []
+    for row in _all_rows(content):
+        if row not in table_data:
+            table_data.append(row)
+    return table_data
+
+
+def _all_rows(content):
+    for item in content:
+        for pos in item['latestPositions']:
+            yield [item['noaaNumber'], pos['position'], pos['day'], pos['x_coordinate'],
+                   pos['y_coordinate'], pos['longitude'], pos['latitude']]
+
+
+def benchmark_export():
+    """Mede a deduplicação das linhas e a geração da tabela e do CSV; o tempo por linha deve ficar constante."""
+    print(f"{'linhas':>8} {'regiões':>8} {'dedup':>10} {'busca linear':>13} {'tabela':>10} {'csv':>10} {'µs/linha':>9}")
+    for size in SIZES:
+        content = _synthetic_content(size)
+        dedup_time = _timed(lambda: list(exporters.rows(content)))
+        # A busca linear é quadrática: só é medida nos tamanhos menores
+        scan_time = _timed(_list_scan_rows, content) if size <= 10_000 else None
+        table_time = _timed(utils.create_text_table, content, io.BytesIO())
+        csv_time = _timed(utils.create_csv, content, io.BytesIO())
+        scan = f"{scan_time * 1000:>11.1f}ms" if scan_time is not None else f"{'-':>13}"
+        print(f"{size:>8} {len(content):>8} {dedup_time * 1000:>8.1f}ms {scan} {table_time * 1000:>8.1f}ms "
+              f"{csv_time * 1000:>8.1f}ms {csv_time / size * 1e6:>9.2f}")
+
+
+# Quadros e resolução dos GIFs sintéticos
+GIF_FRAMES = 15
+GIF_RESOLUTION = 1024
+
+
+def _synthetic_magnetograms(frames=GIF_FRAMES, resolution=GIF_RESOLUTION):
+    """Quadros BGR parecidos com os magnetogramas: fundo fixo, disco com ruído e manchas que giram."""
+    rng = np.random.default_rng(0)
+    yy, xx = np.mgrid[:resolution, :resolution]
+    center, radius = resolution // 2, resolution * 0.45
+    disk = (yy - center) ** 2 + (xx - center) ** 2 < radius ** 2
+    spots = rng.uniform(-0.8, 0.8, (12, 2)) * radius
+    result = []
+    for day in range(frames):
+        gray = np.full((resolution, resolution), 255, dtype=np.uint8)
+        noise = rng.normal(128, 12, disk.sum()).clip(0, 255).astype(np.uint8)
+        gray[disk] = noise
+        for index, (dx, dy) in enumerate(spots):
+            x = int(center + dx + day * resolution * 0.01)
+            y = int(center + dy)
+            gray[max(0, y - 8):y + 8, max(0, x - 8):x + 8] = 0 if index % 2 else 255
+        result.append(np.repeat(gray[:, :, None], 3, axis=2))
+    return result
+
+
+def _encode_gif(frames, options):
+    frames = [image_utils.downscale(frame, options.max_size) for frame in frames]
+    palette = image_utils.gif_palette(frames[:8]) if options.global_palette or options.delta else None
+    size, block = image_utils.gif_frame(frames[0], palette=palette)
+    blocks = [image_utils.gif_header(size, palette=palette), block]
+    for previous, frame in zip(frames, frames[1:]):
+        blocks.append(image_utils.gif_frame(frame, size, palette=palette,
+                                            previous=previous if options.delta else None)[1])
+    return b''.join(blocks) + image_utils.GIF_TRAILER
+
+
+def benchmark_gif():
+    """Mede o tamanho e o tempo de codificação de cada modo de saída da animação."""
+    frames = _synthetic_magnetograms()
+    modes = [
+        ('gif', image_utils.GifOptions()),
+        ('gif max_size=512', image_utils.GifOptions(max_size=512)),
+        ('gif global_palette', image_utils.GifOptions(global_palette=True)),
+        ('gif delta', image_utils.GifOptions(delta=True)),
+        ('gif delta max_size=512', image_utils.GifOptions(max_size=512, delta=True)),
+    ]
+    print(f"{GIF_FRAMES} quadros de {GIF_RESOLUTION}x{GIF_RESOLUTION}")
+    print(f"{'modo':>24} {'tamanho':>10} {'codificação':>12}")
+    for name, options in modes:
+        start = time.perf_counter()
+        data = _encode_gif(frames, options)
+        print(f"{name:>24} {len(data) / 1024:>8.0f}KB {(time.perf_counter() - start) * 1000:>10.0f}ms")
+    for format in image_utils.ANIMATION_FORMATS:
+        for max_size in (None, 512):
+            name = format if max_size is None else f"{format} max_size={max_size}"
+            if not image_utils.animation_available(format):
+                print(f"{name:>24} {'indisponível':>10}")
+                continue
+            start = time.perf_counter()
+            data = image_utils.create_animation([image_utils.downscale(frame, max_size) for frame in frames], format)
+            print(f"{name:>24} {len(data) / 1024:>8.0f}KB {(time.perf_counter() - start) * 1000:>10.0f}ms")
+
+
+BENCHMARKS = {
+    'equalizer': benchmark_equalizer,
+    'export': benchmark_export,
+    'gif': benchmark_gif,
+}
+
+if __name__ == '__main__':
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        print(f"== {name}")
+        BENCHMARKS[name]()
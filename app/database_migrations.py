@@ -0,0 +1,150 @@
+import json
+import sqlite3
+import sunspot_codec
+
+
+def _create_sunspots_data(conn):
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS sunspots_data (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        sunspot_date VARCHAR(10) NOT NULL,
+        sunspot_info JSON NOT NULL
+    )
+    ''')
+
+
+def _add_image_url(conn):
+    columns = [row[1] for row in conn.execute('PRAGMA table_info(sunspots_data)')]
+    if 'image_url' not in columns:
+        conn.execute('ALTER TABLE sunspots_data ADD COLUMN image_url TEXT')
+
+
+def _create_sunspot_regions(conn):
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS sunspot_regions (
+        noaa_number VARCHAR(10) NOT NULL,
+        sunspot_date VARCHAR(10) NOT NULL,
+        position TEXT,
+        x_coordinate VARCHAR(4),
+        y_coordinate VARCHAR(4),
+        longitude INTEGER,
+        latitude INTEGER,
+        observed_date VARCHAR(10)
+    )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_sunspot_regions_noaa_date '
+                 'ON sunspot_regions (noaa_number, sunspot_date)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_sunspot_regions_date '
+                 'ON sunspot_regions (sunspot_date)')
+
+
+def _unique_sunspot_date(conn):
+    # Mantém a linha mais recente de cada dia, preservando a URL da imagem de qualquer duplicata
+    conn.execute('''
+    UPDATE sunspots_data
+    SET image_url = (
+        SELECT d.image_url FROM sunspots_data d
+        WHERE d.sunspot_date = sunspots_data.sunspot_date AND d.image_url IS NOT NULL
+        ORDER BY d.id DESC LIMIT 1
+    )
+    WHERE image_url IS NULL
+    ''')
+    conn.execute('''
+    DELETE FROM sunspots_data
+    WHERE id NOT IN (SELECT MAX(id) FROM sunspots_data GROUP BY sunspot_date)
+    ''')
+    conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_sunspots_data_date ON sunspots_data (sunspot_date)')
+
+
+def _compact_sunspot_info(conn):
+    # Reconstrói a tabela para permitir sunspot_info nulo quando o dia é salvo no formato compacto
+    conn.execute('''
+    CREATE TABLE sunspots_data_new (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        sunspot_date VARCHAR(10) NOT NULL,
+        sunspot_info JSON,
+        image_url TEXT,
+        sunspot_blob BLOB,
+        CHECK (sunspot_info IS NOT NULL OR sunspot_blob IS NOT NULL)
+    )
+    ''')
+    conn.execute('''
+    INSERT INTO sunspots_data_new (id, sunspot_date, sunspot_info, image_url)
+    SELECT id, sunspot_date, sunspot_info, image_url FROM sunspots_data
+    ''')
+    conn.execute('DROP TABLE sunspots_data')
+    conn.execute('ALTER TABLE sunspots_data_new RENAME TO sunspots_data')
+    conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_sunspots_data_date ON sunspots_data (sunspot_date)')
+
+
+def _backfill_sunspot_regions(conn):
+    # Indexa os dias salvos antes de o índice existir; o armazenamento colunar depende dele
+    conn.execute('DELETE FROM sunspot_regions')
+    rows = conn.execute('SELECT sunspot_date, sunspot_info, sunspot_blob FROM sunspots_data ORDER BY sunspot_date')
+    for sunspot_date, sunspot_info, sunspot_blob in rows.fetchall():
+        if sunspot_blob is not None:
+            day = sunspot_codec.decode_day(sunspot_blob)
+        else:
+            day = json.loads(sunspot_info)
+        conn.executemany(
+            'INSERT INTO sunspot_regions (noaa_number, sunspot_date, position, x_coordinate, y_coordinate, '
+            'longitude, latitude, observed_date) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            [(item['noaaNumber'], sunspot_date, pos['position'], pos['x_coordinate'], pos['y_coordinate'],
+              pos['longitude'], pos['latitude'], pos['date'])
+             for item in day or [] for pos in item['latestPositions']])
+
+
+def _add_updated_at(conn):
+    # Momento da última gravação de cada dia; compõe a versão dos dados usada pelo cache de gráficos
+    columns = [row[1] for row in conn.execute('PRAGMA table_info(sunspots_data)')]
+    if 'updated_at' not in columns:
+        conn.execute('ALTER TABLE sunspots_data ADD COLUMN updated_at REAL')
+
+
+def _create_leases(conn):
+    # Tarefas de segundo plano que só um processo (worker do uvicorn) deve executar por vez
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS leases (
+        name TEXT PRIMARY KEY,
+        owner TEXT NOT NULL,
+        expires_at REAL NOT NULL
+    )
+    ''')
+
+
+# Lista ordenada de migrações: a versão do esquema é a posição na lista (PRAGMA user_version)
+MIGRATIONS = [
+    _create_sunspots_data,
+    _add_image_url,
+    _create_sunspot_regions,
+    _unique_sunspot_date,
+    _compact_sunspot_info,
+    _backfill_sunspot_regions,
+    _add_updated_at,
+    _create_leases,
+]
+
+
+def schema_version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def migrate(db_name: str):
+    """Aplica as migrações pendentes e retorna a versão final do esquema."""
+    conn = sqlite3.connect(db_name, isolation_level=None)
+    try:
+        # BEGIN IMMEDIATE impede que dois processos apliquem a mesma migração ao mesmo tempo
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            version = schema_version(conn)
+            for migration in MIGRATIONS[version:]:
+                migration(conn)
+                version += 1
+            conn.execute(f'PRAGMA user_version = {version}')
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return version
+    finally:
+        conn.close()
@@ -0,0 +1,75 @@
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+POOL_SIZE = int(os.environ.get("SOLAIRE_DB_POOL_SIZE", 8))
+
+# Pragmas aplicados a cada nova conexão
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA cache_size = -20000",  # ~20 MB por conexão
+    "PRAGMA mmap_size = 268435456",  # 256 MB
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA busy_timeout = 5000",
+)
+
+
+class ConnectionPool:
+    """Pool de conexões SQLite seguro para uso entre threads.
+
+    As conexões são reaproveitadas entre requisições, o que mantém o cache de
+    páginas e o cache de instruções preparadas (`cached_statements`) de cada uma.
+    """
+
+    def __init__(self, db_name: str, size: int = POOL_SIZE):
+        self.db_name = db_name
+        self.size = size
+        self._idle = queue.LifoQueue(maxsize=size)
+        self._lock = threading.Lock()
+        self._created = 0
+
+    def _new_connection(self):
+        conn = sqlite3.connect(self.db_name, check_same_thread=False, cached_statements=256, timeout=5)
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                return self._new_connection()
+        return self._idle.get()
+
+    def _release(self, conn):
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        """Empresta uma conexão do pool; desfaz a transação aberta em caso de erro."""
+        conn = self._acquire()
+        try:
+            yield conn
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self._release(conn)
+
+    def close(self):
+        """Fecha todas as conexões ociosas do pool."""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._created -= 1
@@ -0,0 +1,61 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+
+import lazy_imports
+
+# Threads para chamadas bloqueantes (SQLite, disco, parsing de HTML) feitas pelas rotas assíncronas
+IO_THREADS = int(os.environ.get("SOLAIRE_IO_THREADS", 32))
+# Processos para o trabalho pesado de CPU (gráficos, OpenCV, imagens); 0 executa nas threads de I/O
+CPU_WORKERS = int(os.environ.get("SOLAIRE_CPU_WORKERS", min(4, os.cpu_count() or 1)))
+
+io_executor = ThreadPoolExecutor(max_workers=IO_THREADS, thread_name_prefix="solaire-io")
+_cpu_executor = None
+_cpu_lock = threading.Lock()
+
+
+def cpu_executor():
+    """Retorna o pool de processos, criado na primeira utilização."""
+    global _cpu_executor
+    with _cpu_lock:
+        if _cpu_executor is None:
+            # 'spawn' evita herdar conexões SQLite e threads do processo da API
+            _cpu_executor = ProcessPoolExecutor(max_workers=CPU_WORKERS,
+                                                mp_context=multiprocessing.get_context("spawn"),
+                                                initializer=lazy_imports.preload_worker)
+        return _cpu_executor
+
+
+async def run_io(func, *args, **kwargs):
+    """Executa uma função bloqueante no pool de threads sem travar o event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(io_executor, partial(func, *args, **kwargs))
+
+
+async def run_cpu(func, *args, **kwargs):
+    """Executa uma função pesada de CPU no pool de processos.
+
+    A função e os argumentos precisam ser serializáveis (funções de módulo,
+    bytes, listas e dicionários).
+    """
+    if CPU_WORKERS <= 0:
+        return await run_io(func, *args, **kwargs)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(cpu_executor(), partial(func, *args, **kwargs))
+
+
+def reset_cpu_executor():
+    """Descarta o pool de processos; o próximo uso cria um novo (ex.: após um processo morrer)."""
+    global _cpu_executor
+    with _cpu_lock:
+        if _cpu_executor is not None:
+            _cpu_executor.shutdown(wait=False, cancel_futures=True)
+            _cpu_executor = None
+
+
+def shutdown():
+    reset_cpu_executor()
+    io_executor.shutdown(wait=False, cancel_futures=True)
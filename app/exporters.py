@@ -0,0 +1,149 @@
+"""Exportação das posições das manchas em CSV, tabela de texto, JSON Lines e Parquet.
+
+Os arquivos são gerados em memória, em blocos de bytes: `chunks` alimenta uma
+resposta em streaming e `write` grava direto em um buffer (ex.: membro do ZIP).
+"""
+import csv
+import importlib.util
+import io
+import json
+
+from fastapi import HTTPException
+from tabulate import tabulate
+
+from lazy_imports import lazy_import
+
+pa = lazy_import("pyarrow")
+pq = lazy_import("pyarrow.parquet")
+
+COLUMNS = ['Mancha', 'Posição', 'Dia', 'Coordenada X', 'Coordenada Y', 'Longitude', 'Latitude']
+# Linhas acumuladas antes de cada bloco de bytes produzido
+CHUNK_ROWS = 1000
+
+
+def rows(content):
+    """Uma linha por posição de cada mancha, na ordem de COLUMNS.
+
+    Linhas repetidas (a mesma posição lida em mais de uma busca) são omitidas,
+    mantendo a ordem da primeira ocorrência.
+    """
+    seen = set()
+    for item in content:
+        noaa_number = item['noaaNumber']
+        for pos in item['latestPositions']:
+            # 'day' é a data (busca por manchas) ou a posição do dia no período (/api/v2)
+            row = (noaa_number, pos['position'], str(pos['day']), pos['x_coordinate'],
+                   pos['y_coordinate'], pos['longitude'], pos['latitude'])
+            if row not in seen:
+                seen.add(row)
+                yield row
+
+
+def _batches(content, size=CHUNK_ROWS):
+    batch = []
+    for row in rows(content):
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class Exporter:
+    name = None
+    extension = None
+    media_type = None
+
+    @classmethod
+    def available(cls):
+        return True
+
+    def chunks(self, content):
+        """Gera o arquivo em blocos de bytes."""
+        raise NotImplementedError
+
+    def write(self, content, out):
+        """Grava o arquivo em um objeto binário com `write` (ex.: BytesIO)."""
+        for chunk in self.chunks(content):
+            out.write(chunk)
+
+    def to_bytes(self, content):
+        out = io.BytesIO()
+        self.write(content, out)
+        return out.getvalue()
+
+
+class CsvExporter(Exporter):
+    name = 'csv'
+    extension = 'csv'
+    media_type = 'text/csv; charset=utf-8'
+
+    def chunks(self, content):
+        buffer = io.StringIO(newline='')
+        writer = csv.writer(buffer)
+        writer.writerow(COLUMNS)
+        for batch in _batches(content):
+            writer.writerows(batch)
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue().encode('utf-8')
+
+
+class TableExporter(Exporter):
+    name = 'txt'
+    extension = 'txt'
+    media_type = 'text/plain; charset=utf-8'
+
+    def chunks(self, content):
+        # O tabulate precisa de todas as linhas para calcular a largura das colunas
+        yield tabulate(list(rows(content)), headers=COLUMNS, tablefmt="plain").encode('utf-8')
+
+
+class JsonLinesExporter(Exporter):
+    name = 'jsonl'
+    extension = 'jsonl'
+    media_type = 'application/x-ndjson'
+
+    def chunks(self, content):
+        for batch in _batches(content):
+            yield ''.join(json.dumps(dict(zip(COLUMNS, row)), ensure_ascii=False) + '\n'
+                          for row in batch).encode('utf-8')
+
+
+class ParquetExporter(Exporter):
+    """Gerado com o pyarrow."""
+    name = 'parquet'
+    extension = 'parquet'
+    media_type = 'application/vnd.apache.parquet'
+
+    @classmethod
+    def available(cls):
+        return importlib.util.find_spec("pyarrow") is not None
+
+    def chunks(self, content):
+        # O rodapé do Parquet aponta para a posição de cada grupo de linhas, então o
+        # arquivo é montado em um buffer e entregue ao final
+        schema = pa.schema([(column, pa.int64() if column in ('Longitude', 'Latitude') else pa.string())
+                            for column in COLUMNS])
+        out = io.BytesIO()
+        with pq.ParquetWriter(out, schema) as writer:
+            for batch in _batches(content):
+                columns = [list(values) for values in zip(*batch)]
+                writer.write_batch(pa.record_batch(columns, schema=schema))
+        yield out.getvalue()
+
+
+EXPORTERS = {exporter.name: exporter() for exporter in
+             (CsvExporter, TableExporter, JsonLinesExporter, ParquetExporter)}
+
+
+def get_exporter(name):
+    exporter = EXPORTERS.get(name)
+    if exporter is None:
+        raise HTTPException(status_code=400, detail=f"Unknown export format. Options: {', '.join(EXPORTERS)}.")
+    if not exporter.available():
+        raise HTTPException(status_code=501, detail=f"The {name} format is not available on this server.")
+    return exporter
@@ -1,12 +1,14 @@
-import matplotlib
-matplotlib.use("Agg")
-import matplotlib.pyplot as plt
+import io
 import re
 import numpy as np
 from datetime import datetime
-import matplotlib.dates as mdates
-from scipy.optimize import curve_fit
-from matplotlib.ticker import MaxNLocator, FuncFormatter
+from lazy_imports import lazy_import
+
+# matplotlib e scipy são importados no primeiro gráfico (o pyplot já com o backend Agg)
+plt = lazy_import("matplotlib.pyplot")
+mdates = lazy_import("matplotlib.dates")
+ticker = lazy_import("matplotlib.ticker")
+optimize = lazy_import("scipy.optimize")
 
 
 # ============================================================
@@ -34,7 +36,7 @@ def _pt_month_formatter(fmt):
         for en, pt in _MONTHS_PT.items():
             label = label.replace(en, pt)
         return label
-    return FuncFormatter(_format)
+    return ticker.FuncFormatter(_format)
 
 
 def _apply_base_style(ax, fontsize_tick=12):
@@ -73,6 +75,14 @@ def date_format(data, pattern):
     return date_formatted
 
 
+def render_to_bytes(create_graphic, content, *args):
+    """Executa uma das funções de gráfico deste módulo e retorna os bytes do PNG.
+    Usada para renderizar em um processo separado."""
+    img_bytes = io.BytesIO()
+    create_graphic(content, img_bytes, *args)
+    return img_bytes.getvalue()
+
+
 def extract_x_value(position):
     """Extrai o valor 'x' da posição no formato cddcdd(xxx, -yyy)."""
     x_value = re.search(r'\(([-+]?\d+)', position).group(1)
@@ -146,41 +156,6 @@ def create_graphic(result, img_bytes, initial_date, final_date, do_adjustment):
 # 2) Gráfico: Quantidade de manchas por período
 # ============================================================
 
-def _build_sunspot_series(result, search_type):
-    """Extrai períodos e contagens de manchas a partir dos dados brutos."""
-    noaa_by_period = {}
-    for entry in result:
-        for pos in entry['latestPositions']:
-            pos_date = datetime.strptime(pos['date'], '%Y-%m-%d')
-            noaa_number = int(entry['noaaNumber'])
-            fmt = '%Y-%m' if search_type == 'MONTHLY' else '%Y'
-            key = pos_date.strftime(fmt)
-            noaa_by_period.setdefault(key, [])
-            noaa_by_period[key].append((pos_date, noaa_number))
-
-    for period in noaa_by_period:
-        noaa_by_period[period].sort(key=lambda x: x[0])
-
-    periods = sorted(noaa_by_period.keys())
-
-    if search_type == 'MONTHLY':
-        counts = [
-            0 if len(noaa_by_period[p]) == 1
-            else len(noaa_by_period[p])
-            for p in periods
-        ]
-    else:
-        counts = [
-            abs(noaa_by_period[p][0][1] - noaa_by_period[p][-1][1])
-            for p in periods
-        ]
-
-    fmt = '%Y-%m' if search_type == 'MONTHLY' else '%Y'
-    period_dates = [datetime.strptime(p, fmt) for p in periods]
-
-    return periods, counts, period_dates
-
-
 def _configure_period_axis(ax, search_type, n_points):
     """Configura o eixo x para períodos mensais ou anuais em PT-BR."""
     if search_type == 'MONTHLY':
@@ -190,12 +165,15 @@ def _configure_period_axis(ax, search_type, n_points):
     else:
         ax.xaxis.set_major_locator(mdates.YearLocator(base=1))
         ax.xaxis.set_major_formatter(mdates.DateFormatter('%Y'))
-    ax.yaxis.set_major_locator(MaxNLocator(integer=True))
+    ax.yaxis.set_major_locator(ticker.MaxNLocator(integer=True))
     plt.setp(ax.get_xticklabels(), rotation=55, ha='right')
 
-def create_sunspots_amount_graphic(result, img_bytes, initial_date, final_date, search_type):
-    """Gráfico de dispersão: quantidade de manchas solares por período."""
-    periods, counts, period_dates = _build_sunspot_series(result, search_type)
+def create_sunspots_amount_graphic(series, img_bytes, initial_date, final_date, search_type):
+    """Gráfico de dispersão: quantidade de manchas solares por período.
+
+    `series` é a série agregada por período (sunspot_store.PeriodSeries).
+    """
+    periods, counts, period_dates = series.periods, series.counts, series.period_dates
 
     figsize = (28, 13) if search_type == "MONTHLY" else (20, 10)
     fig, ax = plt.subplots(figsize=figsize)
@@ -257,29 +235,20 @@ def _fit_sinusoidal(x, y):
         return amp * np.sin(omega * x + fase) + offset
 
     p0 = [(np.max(y) - np.min(y)) / 2, omega_ini, 0, np.mean(y)]
-    popt, _ = curve_fit(senoide, x, y, p0=p0, maxfev=10000)
+    popt, _ = optimize.curve_fit(senoide, x, y, p0=p0, maxfev=10000)
     return popt, senoide
 
 
 def create_sunspots_amount_fourier_graphic(
-    result, img_bytes, initial_date, final_date, search_type,
+    series, img_bytes, initial_date, final_date, search_type,
 ):
-    """Gráfico com ajuste senoidal suave sobre contagem de manchas por período."""
-    # --- Construir série temporal (via set para evitar duplicatas) ---
-    noaa_by_period = {}
-    for entry in result:
-        for pos in entry["latestPositions"]:
-            pos_date = datetime.strptime(pos["date"], "%Y-%m-%d")
-            fmt = "%Y-%m" if search_type == "MONTHLY" else "%Y"
-            key = pos_date.strftime(fmt)
-            noaa_by_period.setdefault(key, set())
-            noaa_by_period[key].add(entry["noaaNumber"])
-
-    periods = sorted(noaa_by_period.keys())
-    y = np.array([len(noaa_by_period[p]) for p in periods], dtype=float)
-
-    fmt = "%Y-%m" if search_type == "MONTHLY" else "%Y"
-    period_dates = [datetime.strptime(p, fmt) for p in periods]
+    """Gráfico com ajuste senoidal suave sobre contagem de manchas por período.
+
+    Usa a quantidade de números NOAA distintos de cada período de `series`
+    (sunspot_store.PeriodSeries).
+    """
+    periods, period_dates = series.periods, series.period_dates
+    y = np.array(series.unique_counts, dtype=float)
 
     x = np.arange(len(y))
     if len(x) < 6:
@@ -0,0 +1,137 @@
+import hashlib
+import os
+import threading
+import time
+from database_pool import ConnectionPool
+
+IMAGE_CACHE_DIR = os.environ.get("SOLAIRE_IMAGE_CACHE_DIR", "image_cache")
+IMAGE_CACHE_MAX_BYTES = int(os.environ.get("SOLAIRE_IMAGE_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+
+
+class ImageCache:
+    """Cache em disco das imagens originais (JPEG) baixadas do SolarMonitor.
+
+    Os arquivos são endereçados pelo conteúdo (sha256) e um índice SQLite
+    associa cada par (data, tipo de imagem) ao seu hash. Quando o tamanho
+    total passa de `max_bytes`, os arquivos menos usados recentemente são
+    removidos.
+    """
+
+    def __init__(self, directory: str = IMAGE_CACHE_DIR, max_bytes: int = IMAGE_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._open_lock = threading.Lock()
+        self.pool = None
+
+    def _create_connection(self):
+        """Empresta uma conexão do pool do índice do cache. A pasta e o índice são criados no
+        primeiro uso, e não ao importar o módulo."""
+        with self._open_lock:
+            if self.pool is None:
+                os.makedirs(self.directory, exist_ok=True)
+                pool = ConnectionPool(os.path.join(self.directory, "index.db"), size=2)
+                self.create_tables(pool)
+                self.pool = pool
+        return self.pool.connection()
+
+    def create_tables(self, pool):
+        with pool.connection() as conn:
+            conn.execute('''
+            CREATE TABLE IF NOT EXISTS image_index (
+                image_date VARCHAR(10) NOT NULL,
+                image_type VARCHAR(32) NOT NULL,
+                content_hash CHAR(64) NOT NULL,
+                PRIMARY KEY (image_date, image_type)
+            )
+            ''')
+            conn.execute('''
+            CREATE TABLE IF NOT EXISTS image_blobs (
+                content_hash CHAR(64) PRIMARY KEY,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL
+            )
+            ''')
+            conn.commit()
+
+    def _blob_path(self, content_hash: str):
+        return os.path.join(self.directory, content_hash[:2], content_hash + ".jpg")
+
+    def get(self, date: str, image_type: str):
+        """Retorna os bytes originais da imagem ou None se não estiver no cache."""
+        with self._lock, self._create_connection() as conn:
+            row = conn.execute(
+                'SELECT content_hash FROM image_index WHERE image_date = ? AND image_type = ?',
+                (date, image_type)).fetchone()
+            data = None
+            if row:
+                try:
+                    with open(self._blob_path(row[0]), 'rb') as file:
+                        data = file.read()
+                except FileNotFoundError:
+                    conn.execute('DELETE FROM image_index WHERE content_hash = ?', (row[0],))
+                    conn.execute('DELETE FROM image_blobs WHERE content_hash = ?', (row[0],))
+            if data is None:
+                conn.commit()
+                self.misses += 1
+                return None
+            conn.execute('UPDATE image_blobs SET last_access = ? WHERE content_hash = ?',
+                         (time.time(), row[0]))
+            conn.commit()
+            self.hits += 1
+            return data
+
+    def put(self, date: str, image_type: str, data: bytes):
+        """Armazena os bytes da imagem e aplica a política de remoção LRU."""
+        content_hash = hashlib.sha256(data).hexdigest()
+        path = self._blob_path(content_hash)
+        with self._lock, self._create_connection() as conn:
+            if not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp_path = path + ".tmp"
+                with open(tmp_path, 'wb') as file:
+                    file.write(data)
+                os.replace(tmp_path, path)
+            conn.execute(
+                'INSERT OR REPLACE INTO image_blobs (content_hash, size, last_access) VALUES (?, ?, ?)',
+                (content_hash, len(data), time.time()))
+            conn.execute(
+                'INSERT OR REPLACE INTO image_index (image_date, image_type, content_hash) VALUES (?, ?, ?)',
+                (date, image_type, content_hash))
+            self._evict(conn)
+            conn.commit()
+        return content_hash
+
+    def _evict(self, conn):
+        total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM image_blobs').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = conn.execute(
+            'SELECT content_hash, size FROM image_blobs ORDER BY last_access ASC').fetchall()
+        for content_hash, size in rows:
+            if total <= self.max_bytes:
+                break
+            conn.execute('DELETE FROM image_index WHERE content_hash = ?', (content_hash,))
+            conn.execute('DELETE FROM image_blobs WHERE content_hash = ?', (content_hash,))
+            try:
+                os.remove(self._blob_path(content_hash))
+            except FileNotFoundError:
+                pass
+            total -= size
+            self.evictions += 1
+
+    def stats(self):
+        with self._create_connection() as conn:
+            entries, total = conn.execute(
+                'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM image_blobs').fetchone()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": entries,
+            "size_bytes": total,
+            "max_bytes": self.max_bytes,
+        }
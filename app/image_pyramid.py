@@ -0,0 +1,76 @@
+import hashlib
+import os
+import threading
+
+import executors
+import image_utils
+import scrapping
+import utils
+
+# Maior lado, em pixels, de cada resolução; "full" é o JPEG original do SolarMonitor
+PYRAMID_SIZES = {
+    "thumbnail": int(os.environ.get("SOLAIRE_THUMBNAIL_SIZE", 256)),
+    "medium": int(os.environ.get("SOLAIRE_MEDIUM_SIZE", 768)),
+    "full": None,
+}
+# Dias em uma folha de contato
+CONTACT_SHEET_MAX_DAYS = 31
+# Validade (s) no navegador das imagens de dias que não mudam mais e das de hoje e ontem
+IMAGE_MAX_AGE = 365 * 24 * 3600
+RECENT_IMAGE_MAX_AGE = 300
+
+
+def cache_control(days):
+    """Cache-Control para imagens dos dias informados: longo, a menos que inclua hoje ou ontem."""
+    recent = set(utils.recent_dates())
+    if any(day in recent for day in days):
+        return f"public, max-age={RECENT_IMAGE_MAX_AGE}"
+    return f"public, max-age={IMAGE_MAX_AGE}, immutable"
+
+
+class ImagePyramid:
+    """Versões reduzidas (miniatura, média) dos magnetogramas, geradas uma vez e guardadas no
+    cache de imagens.
+
+    Cada versão é identificada pelo hash do JPEG original, então uma imagem de hoje baixada de
+    novo gera versões novas e as antigas saem pelo LRU do cache.
+    """
+
+    def __init__(self, cache):
+        self.cache = cache
+        self.generated = 0
+        self.reused = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _image_type(size, source_hash):
+        return f"{scrapping.image_type}@{size}:{source_hash[:16]}"
+
+    def _lookup(self, date, original, size):
+        source_hash = hashlib.sha256(original).hexdigest()
+        if size == "full":
+            return original, source_hash
+        return self.cache.get(date, self._image_type(size, source_hash)), source_hash
+
+    async def get(self, date, original: bytes, size="thumbnail"):
+        """Retorna (JPEG na resolução `size`, ETag) da imagem `original` do dia `date`;
+        (None, None) quando o dia não tem imagem."""
+        if original is None:
+            return None, None
+        data, source_hash = await executors.run_io(self._lookup, date, original, size)
+        if data is None:
+            data = await executors.run_cpu(image_utils.create_thumbnail, original, PYRAMID_SIZES[size])
+            await executors.run_io(self.cache.put, date, self._image_type(size, source_hash), data)
+            with self._lock:
+                self.generated += 1
+        elif size != "full":
+            with self._lock:
+                self.reused += 1
+        return data, f"{size}-{source_hash[:32]}"
+
+    def stats(self):
+        with self._lock:
+            return {"sizes": PYRAMID_SIZES, "generated": self.generated, "reused": self.reused}
+
+
+image_pyramid = ImagePyramid(utils.image_cache)
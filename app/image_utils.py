@@ -1,11 +1,38 @@
-import easyocr
-import cv2
 import numpy as np
+import importlib.util
 import io
-import imageio
+import os
+import tempfile
+import struct
+from collections import namedtuple
+from lazy_imports import lazy_import
 
-def image_encode(img_data):
-    return cv2.imencode('.jpeg', img_data)[1].tobytes()
+# OpenCV, imageio e EasyOCR (torch) são importados apenas quando usados
+cv2 = lazy_import("cv2")
+imageio = lazy_import("imageio")
+easyocr = lazy_import("easyocr")
+PILImage = lazy_import("PIL.Image")
+PILFeatures = lazy_import("PIL.features")
+
+# Fim do arquivo GIF
+GIF_TRAILER = b'\x3b'
+
+# Cores da paleta global dos GIFs; o último índice fica reservado para a transparência
+GIF_PALETTE_COLORS = 255
+TRANSPARENT_INDEX = 255
+
+# Opções de codificação: maior lado em pixels (None mantém a resolução original), paleta
+# compartilhada por todos os quadros e quadros delta (só o que mudou; implica a paleta global)
+GifOptions = namedtuple('GifOptions', ['max_size', 'global_palette', 'delta'], defaults=(None, False, False))
+# Qualidade dos JPEGs gerados aqui (miniaturas, folhas de contato)
+DERIVED_JPEG_QUALITY = 85
+# Formatos alternativos ao GIF e seus tipos MIME
+ANIMATION_FORMATS = {'webp': 'image/webp', 'mp4': 'video/mp4'}
+
+# Retângulo de recorte do magnetograma para quadros de resolução `shape` (altura, largura)
+Crop = namedtuple('Crop', ['shape', 'rectangle'])
+# O enquadramento quase não muda de um dia para outro: um retângulo por (instrumento, resolução)
+_crop_cache = {}
 
 def image_decode(image):
     image_array = np.frombuffer(image, dtype=np.uint8)
@@ -17,11 +44,252 @@ def create_image(image):
     image_bytes.seek(0)
     return image_bytes
 
-def create_gif(images):
-    gif_bytes = io.BytesIO()
-    imageio.mimsave(gif_bytes, images, format='gif', fps=1, loop=0)
-    gif_bytes.seek(0)
-    return gif_bytes
+class Frame:
+    """Imagem de um dia como veio do SolarMonitor: guarda os bytes originais (JPEG) e só os
+    decodifica, uma única vez, quando os pixels são usados (pré-processamento, OCR, GIF)."""
+
+    def __init__(self, data: bytes, label=None, crop=None):
+        self.data = data
+        # Rótulo escrito pelo pré-processamento; None mantém a imagem original
+        self.label = label
+        # Retângulo de recorte já conhecido (detect_crop); None procura no próprio quadro
+        self.crop = crop
+        self._pixels = None
+
+    @property
+    def pixels(self):
+        """Quadro BGR, já pré-processado quando há `label`."""
+        if self._pixels is None:
+            frame = image_decode(self.data)
+            if self.label is not None:
+                frame = preprocess_image(frame, self.label, self.crop)
+            self._pixels = frame
+        return self._pixels
+
+    def jpeg(self):
+        """Bytes do JPEG: os originais, sem recodificar, quando não há pré-processamento."""
+        if self.label is None:
+            return self.data
+        return create_image([self.pixels]).getvalue()
+
+def create_image_from_jpeg(image, label=None, crop=None, max_size=None):
+    """Retorna o JPEG do dia, pré-processado quando há `label` e reduzido para `max_size`.
+    Usada para processar a imagem em um processo separado."""
+    frame = Frame(image, label, crop)
+    if max_size is None:
+        return frame.jpeg()
+    return encode_jpeg(downscale(frame.pixels, max_size))
+
+def encode_jpeg(frame, quality=DERIVED_JPEG_QUALITY):
+    return cv2.imencode('.jpeg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])[1].tobytes()
+
+def create_thumbnail(image, max_size):
+    """JPEG reduzido para que o maior lado tenha no máximo `max_size` pixels (o próprio
+    `image` se já for menor)."""
+    frame = Frame(image).pixels
+    if max(frame.shape[:2]) <= max_size:
+        return image
+    return encode_jpeg(downscale(frame, max_size))
+
+def create_contact_sheet(images, labels, columns):
+    """Compõe os JPEGs `images` em uma grade com `columns` colunas, com o rótulo de cada dia
+    no canto inferior esquerdo, e retorna o JPEG. Dias sem imagem (None) ficam cinza."""
+    frames = [Frame(image).pixels if image is not None else None for image in images]
+    available = [frame for frame in frames if frame is not None]
+    height = max((frame.shape[0] for frame in available), default=256)
+    width = max((frame.shape[1] for frame in available), default=256)
+    columns = max(1, min(columns, len(frames)))
+    rows = -(-len(frames) // columns)
+    sheet = np.full((rows * height, columns * width, 3), 64, dtype=np.uint8)
+    for index, (frame, label) in enumerate(zip(frames, labels)):
+        top, left = (index // columns) * height, (index % columns) * width
+        if frame is not None:
+            sheet[top:top + height, left:left + width] = _fit(frame, (width, height))
+        cv2.putText(sheet, str(label), (left + 8, top + height - 10), cv2.FONT_HERSHEY_SIMPLEX,
+                    max(0.4, width / 640), (255, 255, 255), 1, cv2.LINE_AA)
+    return encode_jpeg(sheet)
+
+def gif_header(size, loop=0, palette=None):
+    """Cabeçalho de um GIF animado de `size` (largura, altura), repetindo `loop` vezes (0 = sempre).
+
+    Sem `palette` cada quadro traz a sua paleta; com ela (768 bytes, de gif_palette) a paleta
+    é global e compartilhada pelos quadros. Os quadros vêm de gif_frame e o arquivo termina
+    com GIF_TRAILER.
+    """
+    width, height = size
+    if palette is None:
+        screen = struct.pack('<6sHHBBB', b'GIF89a', width, height, 0, 0, 0)
+    else:
+        screen = struct.pack('<6sHHBBB', b'GIF89a', width, height, 0xf7, 0, 0) + bytes(palette)
+    netscape = b'\x21\xff\x0bNETSCAPE2.0\x03\x01' + struct.pack('<H', loop) + b'\x00'
+    return screen + netscape
+
+def _skip_sub_blocks(data, position):
+    while data[position]:
+        position += data[position] + 1
+    return position + 1
+
+def _fit(frame, size):
+    """Recorta ou completa o quadro com preto para caber em `size` (largura, altura)."""
+    width, height = size
+    if frame.shape[:2] == (height, width):
+        return frame
+    canvas = np.zeros((height, width, 3), dtype=np.uint8)
+    canvas[:min(height, frame.shape[0]), :min(width, frame.shape[1])] = frame[:height, :width]
+    return canvas
+
+def downscale(frame, max_size=None):
+    """Reduz o quadro para que o maior lado tenha no máximo `max_size` pixels."""
+    if not max_size or max(frame.shape[:2]) <= max_size:
+        return frame
+    scale = max_size / max(frame.shape[:2])
+    width, height = max(1, round(frame.shape[1] * scale)), max(1, round(frame.shape[0] * scale))
+    return cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+
+def _to_pil(frame):
+    return PILImage.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+
+def gif_palette(frames, colors=GIF_PALETTE_COLORS):
+    """Paleta compartilhada (768 bytes) calculada uma vez a partir de uma amostra dos quadros.
+
+    Usa no máximo `colors` cores; o índice TRANSPARENT_INDEX fica livre para o modo delta.
+    """
+    # Uma cópia reduzida de cada quadro basta para encontrar as cores predominantes
+    sample = [downscale(frame, 256) for frame in frames]
+    width = max(frame.shape[1] for frame in sample)
+    stacked = np.vstack([_fit(frame, (width, frame.shape[0])) for frame in sample])
+    palette = _to_pil(stacked).quantize(colors=colors, method=PILImage.Quantize.MEDIANCUT).getpalette()
+    palette = bytes(palette[:3 * colors])
+    return palette + bytes(768 - len(palette))
+
+def _quantize(frame, palette):
+    target = PILImage.new('P', (1, 1))
+    target.putpalette(palette[:3 * GIF_PALETTE_COLORS])
+    return np.asarray(_to_pil(frame).quantize(palette=target, dither=PILImage.Dither.NONE))
+
+def _indexed_block(indexes, palette, left=0, top=0):
+    """Descritor de imagem (sem paleta local) e dados LZW dos índices, na posição (left, top)."""
+    image = PILImage.fromarray(np.ascontiguousarray(indexes), 'P')
+    image.putpalette(palette)
+    single = io.BytesIO()
+    # Sem otimização o Pillow mantém os índices e a paleta de 256 cores
+    image.save(single, format='GIF', optimize=False)
+    data = single.getvalue()
+    position = 13 + 768
+    while data[position] == 0x21:
+        position = _skip_sub_blocks(data, position + 2)
+    descriptor = bytearray(data[position:position + 10])
+    descriptor[1:5] = struct.pack('<HH', left, top)
+    descriptor[9] &= 0x40
+    image_end = _skip_sub_blocks(data, position + 11)
+    return bytes(descriptor) + data[position + 10:image_end]
+
+def gif_frame(frame, size=None, fps=1, palette=None, previous=None):
+    """Codifica um quadro BGR como bloco de GIF animado (controle + descritor + imagem LZW).
+
+    Com `size`, o quadro é recortado ou completado com preto para caber na tela do GIF.
+    Sem `palette` o bloco leva a sua própria paleta; com ela os pixels usam a paleta global.
+    Com `previous` (o quadro anterior, também BGR) só o retângulo que mudou é gravado e os
+    pixels iguais ao anterior ficam transparentes. Retorna ((largura, altura), bytes do bloco).
+    """
+    if size is not None:
+        frame = _fit(frame, size)
+    height, width = frame.shape[:2]
+    delay = round(100 / fps)
+
+    if palette is None:
+        image = _to_pil(frame).convert('P', palette=PILImage.Palette.ADAPTIVE)
+        single = io.BytesIO()
+        image.save(single, format='GIF')
+        data = single.getvalue()
+
+        # Move a paleta global do GIF de um quadro para a paleta local do bloco
+        packed = data[10]
+        palette_size = 3 * 2 ** ((packed & 0x07) + 1) if packed & 0x80 else 0
+        local_palette = data[13:13 + palette_size]
+        position = 13 + palette_size
+        while data[position] == 0x21:
+            position = _skip_sub_blocks(data, position + 2)
+        descriptor = bytearray(data[position:position + 10])
+        if palette_size:
+            descriptor[9] = (descriptor[9] & 0x40) | 0x80 | (packed & 0x07)
+        else:
+            local_palette = data[position + 10:position + 10 + 3 * 2 ** ((descriptor[9] & 0x07) + 1)]
+        image_start = position + 10 + (0 if palette_size else len(local_palette))
+        image_end = _skip_sub_blocks(data, image_start + 1)
+
+        control = b'\x21\xf9\x04\x04' + struct.pack('<H', delay) + b'\x00\x00'
+        return (width, height), control + bytes(descriptor) + local_palette + data[image_start:image_end]
+
+    indexes = _quantize(frame, palette)
+    if previous is None:
+        control = b'\x21\xf9\x04\x04' + struct.pack('<H', delay) + b'\x00\x00'
+        return (width, height), control + _indexed_block(indexes, palette)
+
+    # Modo delta: o quadro anterior permanece na tela (disposal 1) e só o que mudou é desenhado
+    changed = indexes != _quantize(_fit(previous, (width, height)), palette)
+    rows, columns = np.any(changed, axis=1), np.any(changed, axis=0)
+    if rows.any():
+        top, bottom = np.argmax(rows), height - np.argmax(rows[::-1])
+        left, right = np.argmax(columns), width - np.argmax(columns[::-1])
+    else:
+        top, bottom, left, right = 0, 1, 0, 1
+    region = np.where(changed[top:bottom, left:right], indexes[top:bottom, left:right], TRANSPARENT_INDEX)
+    control = b'\x21\xf9\x04\x05' + struct.pack('<HB', delay, TRANSPARENT_INDEX) + b'\x00'
+    return (width, height), control + _indexed_block(region.astype(np.uint8), palette, int(left), int(top))
+
+def render_frame(image, label=None, detections=None, texts=None, crop=None, max_size=None):
+    """Decodifica um JPEG, aplica o pré-processamento (quando há `label`), destaca os textos `texts`
+    nas caixas do OCR (quando há `detections`) e reduz o quadro para `max_size`. Retorna o quadro BGR."""
+    frame = Frame(image, label, crop).pixels
+    if detections is not None:
+        frame = draw_text_boxes(frame, detections, texts)
+    return downscale(frame, max_size)
+
+def create_gif_frame(image, label=None, detections=None, texts=None, size=None, crop=None,
+                     options=None, palette=None):
+    """Monta o quadro com render_frame e retorna gif_frame(quadro, size).
+
+    No modo delta o quadro anterior também é necessário: stream_gif chama render_frame e
+    gif_frame separadamente, para montar cada quadro uma única vez.
+    """
+    options = options or GifOptions()
+    frame = render_frame(image, label, detections, texts, crop, options.max_size)
+    return gif_frame(frame, size, palette=palette)
+
+def create_gif_palette(frames, texts=None, crop=None, options=None):
+    """Paleta global a partir de uma amostra de quadros [(JPEG, rótulo, caixas)]."""
+    options = options or GifOptions()
+    return gif_palette([render_frame(image, label, detections, texts, crop, options.max_size)
+                        for image, label, detections in frames])
+
+def animation_available(format):
+    """WebP requer o Pillow com libwebp; MP4, o imageio-ffmpeg (em requirements.txt)."""
+    if format == 'webp':
+        return PILFeatures.check('webp')
+    if format == 'mp4':
+        return importlib.util.find_spec("imageio_ffmpeg") is not None
+    return False
+
+def create_animation(frames, format, fps=1):
+    """Codifica quadros BGR (de render_frame) como WebP animado ou MP4 (H.264) e retorna os bytes."""
+    size = (max(frame.shape[1] for frame in frames), max(frame.shape[0] for frame in frames))
+    if format == 'mp4':
+        # yuv420p exige largura e altura pares
+        size = (size[0] + size[0] % 2, size[1] + size[1] % 2)
+        rgb = [cv2.cvtColor(_fit(frame, size), cv2.COLOR_BGR2RGB) for frame in frames]
+        # O ffmpeg precisa de um arquivo com seek para gravar o índice do MP4; a pasta é removida ao final
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'animation.mp4')
+            imageio.mimwrite(path, rgb, format='FFMPEG', fps=fps, codec='libx264',
+                             pixelformat='yuv420p', macro_block_size=2)
+            with open(path, 'rb') as file:
+                return file.read()
+    images = [_to_pil(_fit(frame, size)) for frame in frames]
+    output = io.BytesIO()
+    images[0].save(output, format='WEBP', save_all=True, append_images=images[1:],
+                   duration=round(1000 / fps), loop=0, quality=80)
+    return output.getvalue()
 
 class EasyOCRReader:
     _instance = None
@@ -32,40 +300,42 @@ class EasyOCRReader:
             cls._instance.reader = easyocr.Reader(['en'])
         return cls._instance
 
-def highlight_text_in_image(image, texts, easyocr_reader):
-    # Convert the image to a NumPy array
-    image_np = np.array(image)
-
-    # Convert the image to a format compatible with EasyOCR
-    image_np_rgb = cv2.cvtColor(image_np, cv2.COLOR_BGR2RGB)
-
-    # Extract the text from the image using EasyOCR
-    result = easyocr_reader.reader.readtext(image_np_rgb)
+def _detections(result):
+    # Converte o resultado do EasyOCR (com tipos NumPy) em listas simples, serializáveis em JSON
+    return [([[int(x), int(y)] for x, y in bbox], text, float(confidence)) for bbox, text, confidence in result]
 
-    # Highlight the specified text
-    for detection in result:
-        detected_text = detection[1]
-        for text in texts:
-            if text in detected_text:
-                # Highlight the text in the original image
-                bbox = detection[0]
-                cv2.rectangle(image_np_rgb, tuple(map(int, bbox[0])), tuple(map(int, bbox[2])), (0, 255, 0), 2)
+def detect_text(image, easyocr_reader):
+    """Retorna as caixas de texto [(bbox, texto, confiança)] encontradas pelo OCR na imagem."""
+    image_np_rgb = cv2.cvtColor(np.array(image), cv2.COLOR_BGR2RGB)
+    return _detections(easyocr_reader.reader.readtext(image_np_rgb))
 
-    # Convert the image back to the original format
-    image_highlighted = cv2.cvtColor(image_np_rgb, cv2.COLOR_RGB2BGR)
-    return image_highlighted
+def detect_text_batched(images, easyocr_reader):
+    """Como detect_text para várias imagens; as de mesmo tamanho passam juntas pelo modelo."""
+    by_shape = {}
+    for index, image in enumerate(images):
+        by_shape.setdefault(image.shape, []).append(index)
 
-def highlight_text_in_images(images, texts):
-    # Create an instance of EasyOCRReader
-    easyocr_reader = EasyOCRReader()
+    detections = [None] * len(images)
+    for indexes in by_shape.values():
+        if len(indexes) == 1:
+            detections[indexes[0]] = detect_text(images[indexes[0]], easyocr_reader)
+            continue
+        batch = [cv2.cvtColor(np.array(images[index]), cv2.COLOR_BGR2RGB) for index in indexes]
+        for index, result in zip(indexes, easyocr_reader.reader.readtext_batched(batch)):
+            detections[index] = _detections(result)
+    return detections
 
-    processed_images = []
-    for image in images:
-        processed_images.append(highlight_text_in_image(image, texts, easyocr_reader))
-    
-    return processed_images
+def draw_text_boxes(image, detections, texts):
+    """Desenha um retângulo verde em cada caixa detectada que contém algum dos textos."""
+    image = np.array(image)
+    for bbox, detected_text, _ in detections:
+        for text in texts or []:
+            if text in detected_text:
+                cv2.rectangle(image, tuple(map(int, bbox[0])), tuple(map(int, bbox[2])), (0, 255, 0), 2)
+    return image
 
-def preprocess_image(image, day):
+def crop_rectangle(image):
+    """Retângulo (x, y, largura, altura) do maior contorno escuro (o quadro do magnetograma), ou None."""
     # Convert the image to grayscale
     gray_image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
 
@@ -77,29 +347,49 @@ def preprocess_image(image, day):
 
     # Find contours in the binarized image
     contours, _ = cv2.findContours(binary_image, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if not contours:
+        return None
 
-    largest_contour = None
-    largest_area = 0
+    # The largest inner contour is presumably the black rectangle inside the white area
+    areas = [cv2.contourArea(contour) for contour in contours]
+    largest = int(np.argmax(areas))
+    if areas[largest] <= 0:
+        return None
+    return cv2.boundingRect(contours[largest])
 
-    # Find the largest inner contour (presumably the black rectangle inside the white area)
-    for contour in contours:
-        area = cv2.contourArea(contour)
-        if area > largest_area:
-            largest_area = area
-            largest_contour = contour
+def detect_crop(image, instrument=None):
+    """Decodifica um JPEG e retorna o Crop do seu enquadramento, reaproveitando o já
+    encontrado para o mesmo instrumento e resolução neste processo."""
+    frame = image_decode(image)
+    key = (instrument, frame.shape[:2])
+    if key not in _crop_cache:
+        rectangle = crop_rectangle(frame)
+        _crop_cache[key] = Crop(frame.shape[:2], rectangle) if rectangle is not None else None
+    return _crop_cache[key]
 
-    # If a contour is identified as the largest, crop the corresponding rectangular region
-    if largest_contour is not None:
-        x, y, w, h = cv2.boundingRect(largest_contour)
-        cropped_image = image[y:y+h, x:x+w]
+def preprocess_image(image, day, crop=None):
+    """Recorta o magnetograma e escreve `day` no canto superior esquerdo.
 
-        # Add the 'day' content to the top left corner of the cropped image
-        font = cv2.FONT_HERSHEY_SIMPLEX
-        day = str(day)
-        day = day.replace("00:00:00", "")
-        cv2.putText(cropped_image, day, (10, 30), font, 1, (255, 255, 255), 2, cv2.LINE_AA)
-
-        return cropped_image
+    Com `crop` (de detect_crop) da mesma resolução, o retângulo é reaproveitado em vez de
+    procurado no quadro.
+    """
+    if crop is not None and crop.shape == image.shape[:2]:
+        rectangle = crop.rectangle
+    else:
+        rectangle = crop_rectangle(image)
 
     # If no contour is found, return the original image
-    return image
+    if rectangle is None:
+        return image
+
+    # Crop the corresponding rectangular region
+    x, y, w, h = rectangle
+    cropped_image = image[y:y+h, x:x+w]
+
+    # Add the 'day' content to the top left corner of the cropped image
+    font = cv2.FONT_HERSHEY_SIMPLEX
+    day = str(day)
+    day = day.replace("00:00:00", "")
+    cv2.putText(cropped_image, day, (10, 30), font, 1, (255, 255, 255), 2, cv2.LINE_AA)
+
+    return cropped_image
@@ -0,0 +1,157 @@
+"""Importação sob demanda das dependências pesadas (matplotlib, scipy, OpenCV, EasyOCR).
+
+Uso (dentro da pasta /app), para medir o custo de importação de cada grupo:
+    python lazy_imports.py
+"""
+import importlib
+import os
+import resource
+import subprocess
+import sys
+import threading
+import time
+
+# Grupos que podem ser pré-carregados com SOLAIRE_PRELOAD / SOLAIRE_WORKER_PRELOAD (separados por vírgula)
+PRELOAD_GROUPS = {
+    "graphics": ("matplotlib.pyplot", "matplotlib.dates", "matplotlib.ticker", "scipy.optimize"),
+    "images": ("cv2", "imageio"),
+    "ocr": ("easyocr",),
+}
+PRELOAD = os.environ.get("SOLAIRE_PRELOAD", "")
+# Os processos de CPU renderizam os gráficos, então por padrão já começam com o matplotlib e as fontes
+WORKER_PRELOAD = os.environ.get("SOLAIRE_WORKER_PRELOAD", "graphics,images")
+
+# Ajustes que precisam acontecer antes da importação de um módulo
+_SETUP = {
+    "matplotlib.pyplot": lambda: importlib.import_module("matplotlib").use("Agg"),
+}
+
+_lock = threading.RLock()
+_import_costs = {}
+
+
+def load(name):
+    """Importa o módulo (uma única vez) e registra quanto tempo a importação levou."""
+    module = sys.modules.get(name)
+    if module is not None and name in _import_costs:
+        return module
+    with _lock:
+        if name not in _import_costs:
+            start = time.perf_counter()
+            if name in _SETUP:
+                _SETUP[name]()
+            module = importlib.import_module(name)
+            _import_costs[name] = time.perf_counter() - start
+        return sys.modules[name]
+
+
+class LazyModule:
+    """Substituto de um módulo que só é importado no primeiro acesso a um atributo."""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = load(self._name)
+        return getattr(self._module, attr)
+
+    def __repr__(self):
+        state = "carregado" if self._module is not None else "não carregado"
+        return f"<módulo sob demanda '{self._name}' ({state})>"
+
+
+def lazy_import(name):
+    return LazyModule(name)
+
+
+def _groups(spec):
+    return [group.strip() for group in spec.split(",") if group.strip()]
+
+
+def preload_groups(spec=PRELOAD):
+    """Grupos escolhidos em SOLAIRE_PRELOAD."""
+    return _groups(spec)
+
+
+def preload(spec=PRELOAD):
+    """Importa os módulos dos grupos informados ('graphics,images,ocr'). Retorna {módulo: segundos}."""
+    loaded = {}
+    for group in _groups(spec):
+        for name in PRELOAD_GROUPS[group]:
+            load(name)
+            loaded[name] = _import_costs[name]
+    return loaded
+
+
+def _warm_graphics():
+    # Desenha uma figura com texto para carregar as fontes antes do primeiro gráfico
+    plt = load("matplotlib.pyplot")
+    fig, ax = plt.subplots(figsize=(1, 1))
+    ax.plot([0, 1], [0, 1])
+    ax.set_title("Solaire")
+    fig.canvas.draw()
+    plt.close(fig)
+
+
+# Preparação feita nos processos de CPU depois de importar o grupo
+_WARM_UP = {
+    "graphics": _warm_graphics,
+}
+
+
+def preload_worker(spec=None):
+    """Inicializador dos processos de CPU: pré-carrega os grupos de SOLAIRE_WORKER_PRELOAD e,
+    com 'graphics', desenha uma figura para que o primeiro gráfico de cada processo já encontre
+    as fontes carregadas."""
+    spec = WORKER_PRELOAD if spec is None else spec
+    preload(spec)
+    for group in _groups(spec):
+        if group in _WARM_UP:
+            _WARM_UP[group]()
+
+
+def startup_report(startup_seconds=None):
+    """Tempo de inicialização, memória máxima do processo e custo das importações já feitas."""
+    heavy = [name for names in PRELOAD_GROUPS.values() for name in names]
+    return {
+        "startup_seconds": round(startup_seconds, 3) if startup_seconds is not None else None,
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "import_ms": {name: round(cost * 1000, 1) for name, cost in _import_costs.items()},
+        "loaded": [name for name in heavy if name in sys.modules],
+        "not_loaded": [name for name in heavy if name not in sys.modules],
+    }
+
+
+def measure_import_costs():
+    """Mede, em um processo novo para cada grupo, o tempo e a memória da importação."""
+    code = (
+        "import resource, time, lazy_imports\n"
+        "start = time.perf_counter()\n"
+        "lazy_imports.preload({!r})\n"
+        "print(time.perf_counter() - start, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)\n"
+    )
+    base_rss = None
+    results = {}
+    for group in [""] + list(PRELOAD_GROUPS):
+        output = subprocess.run([sys.executable, "-c", code.format(group)], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)))
+        if output.returncode != 0:
+            results[group] = None
+            continue
+        seconds, rss = output.stdout.split()
+        if not group:
+            base_rss = int(rss)
+            continue
+        results[group] = (float(seconds), (int(rss) - base_rss) / 1024)
+    return results
+
+
+if __name__ == '__main__':
+    print(f"{'grupo':>10} {'importação':>12} {'memória':>10}")
+    for group, result in measure_import_costs().items():
+        if result is None:
+            print(f"{group:>10} {'indisponível':>12}")
+        else:
+            print(f"{group:>10} {result[0] * 1000:>10.0f}ms {result[1]:>8.1f}MB")
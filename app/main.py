@@ -1,11 +1,25 @@
+import time
+_startup_began = time.perf_counter()
+
 from typing import List, Optional
-from fastapi import FastAPI, Query
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.responses import StreamingResponse, Response
 import image_utils
 import graphic_utils
 import utils
-import io
-import zipfile
+import asyncio
+import collections
+import contextlib
+import executors
+import exporters
+import lazy_imports
+import scrapping
+from zip_stream import ZipStream
+from render_service import render_service
+from ocr_service import ocr_service
+from prefetch import prefetch_scheduler
+from image_pyramid import CONTACT_SHEET_MAX_DAYS, PYRAMID_SIZES, cache_control, image_pyramid
+from render_cache import make_key
 from fastapi.middleware.cors import CORSMiddleware
 
 app = FastAPI(
@@ -31,6 +45,25 @@ app.add_middleware(
 )
 
 
+@app.on_event("startup")
+async def startup():
+    await executors.run_io(utils.db_dao.migrate)
+    # Pré-carrega as dependências pesadas escolhidas em SOLAIRE_PRELOAD (por padrão nenhuma)
+    await executors.run_io(lazy_imports.preload)
+    # Com 'graphics' em SOLAIRE_PRELOAD, os processos de CPU também são criados e aquecidos agora
+    await executors.run_io(render_service.start)
+    prefetch_scheduler.start()
+    app.state.startup_seconds = time.perf_counter() - _startup_began
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    prefetch_scheduler.shutdown()
+    await scrapping.close_async_client()
+    ocr_service.shutdown()
+    executors.shutdown()
+
+
 @app.get(
     "/api/v1/solar-monitor/jpeg",
     summary="Retrieve a JPEG image from the solar monitor by date",
@@ -40,7 +73,8 @@ app.add_middleware(
         "`pre_process` flag applies preprocessing to the image if set to True."
     ),
 )
-def get_solar_monitor_jpeg_from_date(
+async def get_solar_monitor_jpeg_from_date(
+    request: Request,
     date: Optional[str] = Query(
         None, 
         description="Date for which the JPEG is to be fetched, in YYYY-MM-DD format."
@@ -52,23 +86,92 @@ def get_solar_monitor_jpeg_from_date(
     pre_process: bool = Query(
         False, 
         description="Set to True to apply preprocessing to the image before returning it."
+    ),
+    size: str = Query(
+        "full",
+        description="Image resolution. Options: 'thumbnail', 'medium' or 'full'.",
+        regex="^(thumbnail|medium|full)$"
     )
 ):
     # Get the date array
     days_arr = utils.get_days_arr(date, 0)
 
     # Retrieve and process images
-    _, images = get_content(days_arr[0], pre_process)
-    image_bytes = image_utils.create_image([images])
+    day = days_arr[0]
+    days_content = await utils.cache_and_get_solar_monitor_info_from_days_async([day])
+    if days_content[day][1] is None:
+        raise HTTPException(status_code=404, detail=f"No image available for {day}.")
+    headers = {"Cache-Control": cache_control([day])}
+    if pre_process:
+        image_bytes = await executors.run_cpu(image_utils.create_image_from_jpeg, days_content[day][1],
+                                              image_label(day), None, PYRAMID_SIZES[size])
+    else:
+        # As versões reduzidas são geradas uma vez e servidas do cache de imagens
+        image_bytes, etag = await image_pyramid.get(day, days_content[day][1], size)
+        headers["ETag"] = f'"{etag}"'
+        if etag_matches(request, headers["ETag"]):
+            return Response(status_code=304, headers=headers)
 
     # Return the image, with download option if selected
     if download:
-        response = StreamingResponse(image_bytes, media_type="image/jpeg")
+        response = Response(image_bytes, media_type="image/jpeg", headers=headers)
         filename = f"solar_monitor_{date}.jpeg"
         response.headers["Content-Disposition"] = f'attachment; filename="{filename}"'
         return response
 
-    return StreamingResponse(image_bytes, media_type="image/jpeg")
+    return Response(image_bytes, media_type="image/jpeg", headers=headers)
+
+
+@app.get(
+    "/api/v1/solar-monitor/contact-sheet",
+    summary="Retrieve a grid with the solar monitor images of several days",
+    description=(
+        "Compose the magnetograms of `number_of_days` consecutive days, starting at `date`, "
+        "into a single JPEG grid with `columns` columns. Each tile is labeled with its day."
+    ),
+)
+async def get_solar_monitor_contact_sheet(
+    request: Request,
+    date: Optional[str] = Query(
+        None,
+        description="First day of the grid, in YYYY-MM-DD format."
+    ),
+    number_of_days: int = Query(
+        7,
+        ge=1,
+        le=CONTACT_SHEET_MAX_DAYS,
+        description=f"Number of days in the grid (at most {CONTACT_SHEET_MAX_DAYS})."
+    ),
+    columns: int = Query(
+        7,
+        ge=1,
+        le=CONTACT_SHEET_MAX_DAYS,
+        description="Number of columns of the grid."
+    ),
+    size: str = Query(
+        "thumbnail",
+        description="Resolution of each tile. Options: 'thumbnail' or 'medium'.",
+        regex="^(thumbnail|medium)$"
+    ),
+    download: bool = Query(
+        False,
+        description="Set to True to download the image instead of displaying it in the browser."
+    )
+):
+    days_arr = utils.get_days_arr(date, number_of_days - 1)
+    days_content = await utils.cache_and_get_solar_monitor_info_from_days_async(days_arr)
+    # Dias sem imagem recebem (None, None) e ficam cinza na folha
+    tiles = await asyncio.gather(*(image_pyramid.get(day, days_content[day][1], size) for day in days_arr))
+
+    # A folha muda apenas quando alguma das imagens muda
+    key = make_key("contact-sheet", {"columns": columns, "size": size, "days": days_arr},
+                   ",".join(etag or "" for _, etag in tiles))
+    render_sheet = lambda: executors.run_cpu(image_utils.create_contact_sheet, [image for image, _ in tiles],
+                                             [image_label(day) for day in days_arr], columns)
+    filename = f"solar_monitor_{days_arr[0]}_{days_arr[-1]}.jpeg" if download else None
+    response = await graphic_response(request, key, render_sheet, filename)
+    response.headers["Cache-Control"] = cache_control(days_arr)
+    return response
 
 
 @app.get(
@@ -80,7 +183,7 @@ def get_solar_monitor_jpeg_from_date(
         "to extract text data from the image."
     ),
 )
-def get_solar_monitor_spot_info(
+async def get_solar_monitor_spot_info(
     date: Optional[str] = Query(
         None,
         description="Date for which the sunspots GIF is to be fetched, in YYYY-MM-DD format."
@@ -96,23 +199,49 @@ def get_solar_monitor_spot_info(
     ocr: bool = Query(
         False,
         description="Set to True to perform OCR on the GIF to highlight text data from the image."
+    ),
+    format: str = Query(
+        "gif",
+        description="Animation format. Options: 'gif', 'webp' or 'mp4'.",
+        regex="^(gif|webp|mp4)$"
+    ),
+    max_size: Optional[int] = Query(
+        None,
+        ge=16,
+        description="Downscale the frames so that their largest side has at most this many pixels."
+    ),
+    global_palette: bool = Query(
+        False,
+        description="Set to True to encode every GIF frame with a single shared palette."
+    ),
+    delta: bool = Query(
+        False,
+        description="Set to True to store only the pixels that changed since the previous GIF frame."
     )
 ):
-    initial_date, final_date, full_content = utils.sunspot_backtracking(
-        date, sunspots)
+    if format != "gif" and not image_utils.animation_available(format):
+        raise HTTPException(status_code=501, detail=f"The {format} format is not available on this server.")
 
-    days_arr = list(full_content.keys())
-    days_arr.reverse()
+    initial_date, final_date, full_content = await utils.sunspot_backtracking_async(
+        date, sunspots)
+    number_of_days = utils.how_many_days_between(initial_date, final_date)
+    options = image_utils.GifOptions(max_size, global_palette, delta)
+
+    if format != "gif":
+        content = await create_animation(initial_date, number_of_days, sunspots, True, format, ocr, options)
+        response = Response(content, media_type=image_utils.ANIMATION_FORMATS[format])
+        if download:
+            response.headers["Content-Disposition"] = f'attachment; filename="solar_monitor.{format}"'
+        return response
 
-    gif_bytes = get_images_to_gif(initial_date, utils.how_many_days_between(
-        initial_date, final_date), sunspots, True, ocr)
+    gif_chunks = await primed(stream_gif(initial_date, number_of_days, sunspots, True, ocr, options))
 
     if download:
-        response = StreamingResponse(gif_bytes, media_type="image/gif")
+        response = StreamingResponse(gif_chunks, media_type="image/gif")
         response.headers["Content-Disposition"] = 'attachment; filename="solar_monitor.gif"'
         return response
     else:
-        return StreamingResponse(gif_bytes, media_type="image/gif")
+        return StreamingResponse(gif_chunks, media_type="image/gif")
 
 
 @app.get(
@@ -123,7 +252,8 @@ def get_solar_monitor_spot_info(
         "You can choose to group the data monthly or yearly using the `search_type` parameter."
     ),
 )
-def get_solar_monitor_sunspots_amount(
+async def get_solar_monitor_sunspots_amount(
+    request: Request,
     search_type: str = Query(
         "MONTHLY", 
         description="Specify the aggregation type for sunspot count. Options: 'MONTHLY' or 'YEARLY'.",
@@ -142,23 +272,20 @@ def get_solar_monitor_sunspots_amount(
         description="Set to True to generate a Fourier analysis graph of the sunspot data."
     )
 ):
-    full_content = {}
-    count = 0
     dates = utils.get_days_arr_between_dates(initial_date, final_date, search_type)
-    for date in dates:
-        full_content[count], _ = utils.cache_and_get_solar_monitor_info_from_day(
-            date, data_only=True)
-        count += 1
-
-    full_content = utils.data_equalizer(full_content)
-    img_bytes = io.BytesIO()
     if fourier:
-        graphic_utils.create_sunspots_amount_fourier_graphic(full_content, img_bytes, initial_date, final_date, search_type)
+        endpoint, create = "sunspots-amount-fourier", graphic_utils.create_sunspots_amount_fourier_graphic
     else:
-        graphic_utils.create_sunspots_amount_graphic(full_content, img_bytes, initial_date, final_date, search_type)
-    full_content = {}
-    img_bytes.seek(0)
-    return StreamingResponse(img_bytes, media_type="image/jpeg")
+        endpoint, create = "sunspots-amount", graphic_utils.create_sunspots_amount_graphic
+
+    # Revalidação (If-None-Match) respondida antes de carregar o período
+    cached = not_modified(request, await amount_graphic_key(endpoint, search_type, initial_date, final_date))
+    if cached is not None:
+        return cached
+
+    series = await utils.get_period_series_async(dates, search_type)
+    key = await amount_graphic_key(endpoint, search_type, initial_date, final_date)
+    return await graphic_response(request, key, lambda: render(create, series, initial_date, final_date, search_type))
 
 
 @app.get(
@@ -170,7 +297,8 @@ def get_solar_monitor_sunspots_amount(
         "to the data points, and download the result as a file if desired."
     ),
 )
-def get_solar_monitor_spot_info(
+async def get_solar_monitor_spot_info(
+    request: Request,
     date: Optional[str] = Query(
         None,
         description="The date for which sunspot analysis is requested, in YYYY-MM-DD format."
@@ -192,76 +320,53 @@ def get_solar_monitor_spot_info(
         description="Set to True to generate a Fourier analysis graph of the sunspot data."
     )
 ):
-    initial_date, final_date, full_content = utils.sunspot_backtracking(
+    initial_date, final_date, full_content = await utils.sunspot_backtracking_async(
         date, sunspots)
 
-    days_arr = list(full_content.keys())
-    days_arr.reverse()
-
-    full_content = utils.data_equalizer(full_content)
-
-    img_bytes = io.BytesIO()
-
     if fourier:
-        graphic_utils.create_fourier_graphic(full_content, img_bytes, initial_date, final_date)
+        key = await sunspots_graphic_key("fourier", sunspots, initial_date, final_date)
+        render_graphic = lambda: render(graphic_utils.create_fourier_graphic,
+                                        utils.data_equalizer(full_content), initial_date, final_date)
     else:
-        graphic_utils.create_graphic(full_content, img_bytes, initial_date, final_date, linear_adjustment)
+        key = await sunspots_graphic_key("graphic", sunspots, initial_date, final_date, linear_adjustment)
+        render_graphic = lambda: render(graphic_utils.create_graphic,
+                                        utils.data_equalizer(full_content), initial_date, final_date, linear_adjustment)
 
-    img_bytes.seek(0)
-
-    if download:
-        response = StreamingResponse(img_bytes, media_type="image/jpeg")
-        response.headers["Content-Disposition"] = 'attachment; filename="solar_monitor.jpeg"'
-        return response
-
-    return StreamingResponse(img_bytes, media_type="image/jpeg")
+    filename = "solar_monitor.jpeg" if download else None
+    return await graphic_response(request, key, render_graphic, filename)
 
 
 @app.get("/api/v1/solar-monitor/sunspots/zip", include_in_schema=True)
-def get_raw_content(date: str = Query(None), sunspots: List[str] = Query(None)):
-    initial_date, final_date, full_content = utils.sunspot_backtracking(
+async def get_raw_content(date: str = Query(None), sunspots: List[str] = Query(None)):
+    initial_date, final_date, full_content = await utils.sunspot_backtracking_async(
         date, sunspots)
 
-    days_arr = list(full_content.keys())
-    days_arr.reverse()
-
     full_content = utils.data_equalizer(full_content)
 
-    gif_bytes = get_images_to_gif(initial_date, utils.how_many_days_between(
-        initial_date, final_date), sunspots, True)
-
-    table_bytes = io.BytesIO()
-    csv_bytes = io.BytesIO()
-    img_bytes = io.BytesIO()
-    fourier_bytes = io.BytesIO()
-
-    graphic_utils.create_fourier_graphic(
-        full_content, fourier_bytes, initial_date, final_date)
-
-    graphic_utils.create_graphic(
-        full_content, img_bytes, initial_date, final_date, False)
-
-    img_bytes.seek(0)
-    utils.create_text_table(full_content, table_bytes)
-    utils.create_csv(full_content, csv_bytes)
-
-    # Create a ZIP file to store the bytes
-    zip_buffer = io.BytesIO()
-    with zipfile.ZipFile(zip_buffer, 'w') as zip_file:
-        zip_file.writestr('gif.gif', gif_bytes.getvalue())
-        zip_file.writestr('tabela.txt', table_bytes.getvalue())
-        zip_file.writestr('planilha.csv', csv_bytes.getvalue())
-        zip_file.writestr('grafico.png', img_bytes.getvalue())
-        zip_file.writestr('fourier.png', fourier_bytes.getvalue())
+    fourier_key = await sunspots_graphic_key("fourier", sunspots, initial_date, final_date)
+    graphic_key = await sunspots_graphic_key("graphic", sunspots, initial_date, final_date, False)
+    gif_chunks = await primed(stream_gif(
+        initial_date, utils.how_many_days_between(initial_date, final_date), sunspots, True))
+
+    # O GIF é escrito no ZIP enquanto os demais arquivos são gerados em paralelo
+    zip_chunks = stream_zip({
+        'tabela.txt': export_bytes(exporters.EXPORTERS['txt'], full_content),
+        'planilha.csv': export_bytes(exporters.EXPORTERS['csv'], full_content),
+        'grafico.png': utils.render_cache.get_or_render_async(graphic_key, lambda: render(
+            graphic_utils.create_graphic, full_content, initial_date, final_date, False)),
+        'fourier.png': utils.render_cache.get_or_render_async(fourier_key, lambda: render(
+            graphic_utils.create_fourier_graphic, full_content, initial_date, final_date)),
+    }, streamed=('gif.gif', gif_chunks))
 
     # Configure the response for the ZIP file
-    response = Response(zip_buffer.getvalue(), media_type='application/zip')
+    response = StreamingResponse(zip_chunks, media_type='application/zip')
     response.headers["Content-Disposition"] = 'attachment; filename="analise.zip"'
 
     return response
 
 @app.get("/api/v2/solar-monitor/sunspots/zip", include_in_schema=True)
-def get_raw_content_v2(
+async def get_raw_content_v2(
+    request: Request,
     search_type: str = Query(
         "MONTHLY", 
         description="Specify the aggregation type for sunspot count. Options: 'MONTHLY' or 'YEARLY'.",
@@ -276,53 +381,351 @@ def get_raw_content_v2(
         description="The end date for the data search range, in YYYY-MM-DD format."
     )
 ):
-    full_content = {}
-    count = 0
     dates = utils.get_days_arr_between_dates(initial_date, final_date, search_type)
-    for date in dates:
-        full_content[count], _ = utils.cache_and_get_solar_monitor_info_from_day(
-            date, data_only=True)
-        count += 1
+    cached = not_modified(request, await amount_graphic_key("sunspots-zip", search_type, initial_date, final_date))
+    if cached is not None:
+        return cached
+
+    series = await utils.get_period_series_async(dates, search_type)
+    full_content = await utils.get_days_content_async(dates)
 
     full_content = utils.data_equalizer(full_content)
-    fourier_bytes = io.BytesIO()
-    img_bytes = io.BytesIO()
-    graphic_utils.create_sunspots_amount_fourier_graphic(full_content, fourier_bytes, initial_date, final_date, search_type)
-    graphic_utils.create_sunspots_amount_graphic(full_content, img_bytes, initial_date, final_date, search_type)
-
-    csv_bytes = io.BytesIO()
-    utils.create_csv(full_content, csv_bytes)
-    img_bytes.seek(0)
-    
-    zip_buffer = io.BytesIO()
-    with zipfile.ZipFile(zip_buffer, 'w') as zip_file:
-        zip_file.writestr('planilha.csv', csv_bytes.getvalue())
-        zip_file.writestr('grafico.png', img_bytes.getvalue())
-        zip_file.writestr('fourier.png', fourier_bytes.getvalue())
+
+    fourier_key = await amount_graphic_key("sunspots-amount-fourier", search_type, initial_date, final_date)
+    graphic_key = await amount_graphic_key("sunspots-amount", search_type, initial_date, final_date)
+    zip_chunks = stream_zip({
+        'planilha.csv': export_bytes(exporters.EXPORTERS['csv'], full_content),
+        'grafico.png': utils.render_cache.get_or_render_async(graphic_key, lambda: render(
+            graphic_utils.create_sunspots_amount_graphic, series, initial_date, final_date, search_type)),
+        'fourier.png': utils.render_cache.get_or_render_async(fourier_key, lambda: render(
+            graphic_utils.create_sunspots_amount_fourier_graphic, series, initial_date, final_date, search_type)),
+    })
 
     # Configure the response for the ZIP file
-    response = Response(zip_buffer.getvalue(), media_type='application/zip')
+    response = StreamingResponse(zip_chunks, media_type='application/zip')
     response.headers["Content-Disposition"] = 'attachment; filename="analise.zip"'
+    zip_key = await amount_graphic_key("sunspots-zip", search_type, initial_date, final_date)
+    if zip_key is not None:
+        response.headers["ETag"] = f'"{zip_key}"'
 
     return response
 
-def get_content(day, pre_process):
-    content, images = utils.cache_and_get_solar_monitor_info_from_day(day)
-    image = image_utils.image_decode(images)
-    if pre_process:
-        day = graphic_utils.date_format(day, "%d de %b. de %Y")
-        return content, image_utils.preprocess_image(image, day)
-    return content, image
+@app.get("/api/v1/solar-monitor/sunspots/export", include_in_schema=True)
+async def get_sunspots_export(
+    date: str = Query(None),
+    sunspots: List[str] = Query(None),
+    format: str = Query(
+        "csv",
+        description="Export format. Options: 'csv', 'txt', 'jsonl' or 'parquet'."
+    )
+):
+    exporter = exporters.get_exporter(format)
+    initial_date, final_date, full_content = await utils.sunspot_backtracking_async(
+        date, sunspots)
+
+    return await export_response(exporter, utils.data_equalizer(full_content), "posicoes")
+
+@app.get("/api/v2/solar-monitor/sunspots/export", include_in_schema=True)
+async def get_period_export(
+    request: Request,
+    search_type: str = Query(
+        "MONTHLY",
+        description="Specify the aggregation type for sunspot count. Options: 'MONTHLY' or 'YEARLY'.",
+        regex="^(MONTHLY|YEARLY)$"
+    ),
+    initial_date: Optional[str] = Query(
+        None,
+        description="The start date for the data search range, in YYYY-MM-DD format."
+    ),
+    final_date: Optional[str] = Query(
+        None,
+        description="The end date for the data search range, in YYYY-MM-DD format."
+    ),
+    format: str = Query(
+        "csv",
+        description="Export format. Options: 'csv', 'txt', 'jsonl' or 'parquet'."
+    )
+):
+    exporter = exporters.get_exporter(format)
+    dates = utils.get_days_arr_between_dates(initial_date, final_date, search_type)
+    endpoint = f"sunspots-export-{exporter.name}"
+    cached = not_modified(request, await amount_graphic_key(endpoint, search_type, initial_date, final_date))
+    if cached is not None:
+        return cached
+
+    full_content = await utils.get_days_content_async(dates)
+
+    response = await export_response(exporter, utils.data_equalizer(full_content), "posicoes")
+    key = await amount_graphic_key(endpoint, search_type, initial_date, final_date)
+    if key is not None:
+        response.headers["ETag"] = f'"{key}"'
+    return response
+
+@app.get("/api/v1/admin/image-cache", include_in_schema=False)
+def get_image_cache_stats():
+    return {**utils.image_cache.stats(), "pyramid": image_pyramid.stats()}
+
+
+@app.get("/api/v1/admin/render-cache", include_in_schema=False)
+def get_render_cache_stats():
+    return utils.render_cache.stats()
+
+
+@app.get("/api/v1/admin/startup", include_in_schema=False)
+def get_startup_report():
+    return lazy_imports.startup_report(getattr(app.state, "startup_seconds", None))
+
+
+@app.get("/api/v1/admin/ocr", include_in_schema=False)
+def get_ocr_stats():
+    return ocr_service.stats()
+
+
+@app.get("/api/v1/admin/render-service", include_in_schema=False)
+def get_render_service_stats():
+    return render_service.stats()
 
 
-def get_images_to_gif(initial_date, number_of_days, sunspot, pre_process, ocr = False):
+@app.get("/api/v1/admin/single-flight", include_in_schema=False)
+def get_single_flight_stats():
+    flights = (scrapping.http_flight, utils.day_flight, utils.render_cache.flight)
+    return {flight.name: flight.stats() for flight in flights}
+
+
+@app.get("/api/v1/admin/prefetch", include_in_schema=False)
+def get_prefetch_stats():
+    return prefetch_scheduler.stats()
+
+
+async def render(create_graphic, content, *args):
+    """Renderiza um gráfico de graphic_utils nos processos do render_service e retorna os bytes da imagem."""
+    return await render_service.render(create_graphic, content, *args)
+
+
+async def sunspots_graphic_key(endpoint, sunspots, initial_date, final_date, linear_adjustment=None):
+    params = {"sunspots": sunspots or [], "initial_date": initial_date, "final_date": final_date,
+              "linear_adjustment": linear_adjustment}
+    return await executors.run_io(utils.graphic_cache_key, endpoint, params, initial_date, final_date)
+
+
+async def amount_graphic_key(endpoint, search_type, initial_date, final_date):
+    params = {"search_type": search_type, "initial_date": initial_date, "final_date": final_date}
+    return await executors.run_io(utils.graphic_cache_key, endpoint, params, initial_date, final_date)
+
+
+def etag_matches(request, etag):
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+
+def not_modified(request, key):
+    """Resposta 304 quando o If-None-Match do pedido corresponde à chave `key`; senão None.
+
+    As chaves dependem da versão dos dados no banco, então podem ser calculadas antes de
+    carregar o período: se a chave enviada pelo navegador ainda é a atual, nada mudou.
+    """
+    etag = f'"{key}"' if key is not None else None
+    if etag is not None and etag_matches(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    return None
+
+
+async def graphic_response(request, key, render_graphic, filename=None):
+    """Responde com o gráfico do cache (ou recém renderizado), com ETag e 304 para períodos encerrados."""
+    etag = f'"{key}"' if key is not None else None
+    cached = not_modified(request, key)
+    if cached is not None:
+        return cached
+
+    # Pedidos iguais em andamento (mesma URL) compartilham a renderização mesmo sem cache
+    content = await utils.render_cache.get_or_render_async(key, render_graphic, str(request.url))
+    response = Response(content, media_type="image/jpeg")
+    if etag is not None:
+        response.headers["ETag"] = etag
+    if filename:
+        response.headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
+
+
+def image_label(day):
+    return graphic_utils.date_format(day, "%d de %b. de %Y")
+
+
+async def primed(chunks):
+    """Obtém a primeira parte de um gerador antes de responder, para que erros até ali ainda
+    virem respostas HTTP de erro em vez de uma conexão interrompida."""
+    try:
+        first = await chunks.__anext__()
+    except StopAsyncIteration:
+        first = None
+
+    async def stream():
+        if first is None:
+            return
+        yield first
+        async for chunk in chunks:
+            yield chunk
+
+    return stream()
+
+
+async def frame_windows(initial_date, number_of_days, pre_process, ocr = False):
+    """Gera os quadros [(JPEG, rótulo, caixas do OCR)] em janelas de FETCH_CONCURRENCY dias, junto
+    com o recorte do pré-processamento. A próxima janela é baixada enquanto a atual é usada, então
+    a memória usada não depende da quantidade de quadros.
+    """
     days_arr = utils.get_days_arr(initial_date, number_of_days)
-    images = []
-
-    for day in days_arr:
-        _, image = get_content(day, pre_process)
-        images.append(image)
-    if ocr:
-        images = image_utils.highlight_text_in_images(images, sunspot)
-    gif_bytes = image_utils.create_gif(images)
-    return gif_bytes
+    window = scrapping.FETCH_CONCURRENCY
+    windows = [days_arr[start:start + window] for start in range(0, len(days_arr), window)]
+    crop = None
+
+    async def load(days):
+        nonlocal crop
+        days_content = await utils.cache_and_get_solar_monitor_info_from_days_async(days)
+        images = [days_content[day][1] for day in days]
+        labels = [image_label(day) if pre_process else None for day in days]
+        if pre_process and crop is None:
+            # O recorte é encontrado no primeiro quadro e aplicado a todos os demais
+            crop = await executors.run_cpu(image_utils.detect_crop, images[0], scrapping.image_type)
+        # As caixas de texto vêm do cache do OCR; só os quadros novos passam pelo modelo
+        detections = await ocr_service.detect(images, labels, crop) if ocr else [None] * len(days)
+        return list(zip(images, labels, detections))
+
+    next_window = asyncio.ensure_future(load(windows[0]))
+    try:
+        for index in range(len(windows)):
+            frames = await next_window
+            next_window = asyncio.ensure_future(load(windows[index + 1])) if index + 1 < len(windows) else None
+            yield frames, crop
+    finally:
+        if next_window is not None:
+            next_window.cancel()
+
+
+async def stream_gif(initial_date, number_of_days, sunspot, pre_process, ocr = False,
+                     options = image_utils.GifOptions()):
+    """Gera o GIF em partes: o cabeçalho e cada quadro saem, em ordem, assim que ficam prontos."""
+    def encode(frame, size, crop):
+        image, label, detections = frame
+        return asyncio.ensure_future(executors.run_cpu(
+            image_utils.create_gif_frame, image, label, detections, sunspot, size, crop, options, palette))
+
+    def render_pixels(frame, crop):
+        image, label, detections = frame
+        return asyncio.ensure_future(executors.run_cpu(
+            image_utils.render_frame, image, label, detections, sunspot, crop, options.max_size))
+
+    async def encode_delta(pixels, size, previous):
+        # Modo delta: cada quadro é montado uma única vez e comparado com os pixels já prontos do anterior
+        frame = await pixels
+        previous = None if previous is None else await previous
+        return await executors.run_cpu(image_utils.gif_frame, frame, size, palette=palette, previous=previous)
+
+    size = palette = previous = None
+    pending = collections.deque()
+    try:
+        async with contextlib.aclosing(frame_windows(
+                initial_date, number_of_days, pre_process, ocr)) as windows:
+            async for frames, crop in windows:
+                if size is None:
+                    if options.global_palette or options.delta:
+                        # A paleta global vai no cabeçalho: é calculada com os quadros da primeira janela
+                        palette = await executors.run_cpu(
+                            image_utils.create_gif_palette, frames, sunspot, crop, options)
+                    # O primeiro quadro define o tamanho da tela do GIF
+                    first = frames.pop(0)
+                    if options.delta:
+                        previous = render_pixels(first, crop)
+                        size, block = await encode_delta(previous, None, None)
+                    else:
+                        size, block = await encode(first, None, crop)
+                    yield image_utils.gif_header(size, palette=palette)
+                    yield block
+                for frame in frames:
+                    if options.delta:
+                        pixels = render_pixels(frame, crop)
+                        pending.append(asyncio.ensure_future(encode_delta(pixels, size, previous)))
+                        previous = pixels
+                    else:
+                        pending.append(encode(frame, size, crop))
+                while pending:
+                    yield (await pending[0])[1]
+                    pending.popleft()
+        yield image_utils.GIF_TRAILER
+    finally:
+        # Cliente desconectado ou erro: descarta o trabalho ainda em andamento
+        for task in pending:
+            task.cancel()
+
+
+async def create_animation(initial_date, number_of_days, sunspot, pre_process, format, ocr = False,
+                           options = image_utils.GifOptions()):
+    """Gera a animação em WebP ou MP4. Os quadros são montados em paralelo, mas esses formatos
+    são codificados de uma vez, no final."""
+    tasks = []
+    try:
+        async with contextlib.aclosing(frame_windows(
+                initial_date, number_of_days, pre_process, ocr)) as windows:
+            async for frames, crop in windows:
+                tasks.extend(asyncio.ensure_future(executors.run_cpu(
+                    image_utils.render_frame, image, label, detections, sunspot, crop, options.max_size))
+                    for image, label, detections in frames)
+        rendered = await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+    return await executors.run_cpu(image_utils.create_animation, rendered, format)
+
+
+async def export_bytes(exporter, content):
+    return await executors.run_io(exporter.to_bytes, content)
+
+
+async def stream_export(exporter, content):
+    """Gera o arquivo exportado em blocos, produzidos no pool de threads."""
+    chunks = exporter.chunks(content)
+    while True:
+        chunk = await executors.run_io(next, chunks, None)
+        if chunk is None:
+            break
+        yield chunk
+
+
+async def export_response(exporter, content, filename):
+    # O primeiro bloco (o arquivo inteiro, no caso do Parquet) é gerado antes de responder
+    chunks = await primed(stream_export(exporter, content))
+    response = StreamingResponse(chunks, media_type=exporter.media_type)
+    response.headers["Content-Disposition"] = f'attachment; filename="{filename}.{exporter.extension}"'
+    return response
+
+
+async def stream_zip(members, streamed=None):
+    """Gera um ZIP em partes.
+
+    `streamed` é (nome, gerador assíncrono de bytes) e é escrito primeiro, à medida que é
+    produzido; `members` é {nome: corrotina que retorna bytes}: todas rodam em paralelo desde
+    o início e cada arquivo entra no ZIP assim que fica pronto.
+    """
+    archive = ZipStream()
+    tasks = {asyncio.ensure_future(member): name for name, member in members.items()}
+    try:
+        if streamed is not None:
+            name, chunks = streamed
+            yield archive.open(name)
+            async for chunk in chunks:
+                data = archive.write(chunk)
+                if data:
+                    yield data
+            yield archive.close_member()
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                yield archive.add(tasks[task], task.result())
+        yield archive.close()
+    finally:
+        for task in tasks:
+            task.cancel()
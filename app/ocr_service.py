@@ -0,0 +1,189 @@
+import asyncio
+import hashlib
+import json
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import executors
+from database_pool import ConnectionPool
+from image_cache import IMAGE_CACHE_DIR
+
+# Processos com o modelo do EasyOCR carregado (cada um ocupa centenas de MB); 0 usa as threads de I/O
+OCR_WORKERS = int(os.environ.get("SOLAIRE_OCR_WORKERS", 1))
+# Quadros enviados juntos para um processo de OCR
+OCR_BATCH_SIZE = int(os.environ.get("SOLAIRE_OCR_BATCH_SIZE", 8))
+OCR_CACHE_DB = os.environ.get("SOLAIRE_OCR_CACHE_DB", os.path.join(IMAGE_CACHE_DIR, "ocr.db"))
+
+# Incrementar quando o pré-processamento ou o modelo mudarem, para descartar as caixas já salvas
+OCR_VERSION = 1
+
+
+def image_key(image: bytes, label=None, crop=None):
+    """Identifica o quadro analisado: o JPEG original, o rótulo e o recorte do pré-processamento."""
+    prefix = f"{OCR_VERSION}:{label}:" if crop is None else f"{OCR_VERSION}:{label}:{tuple(crop.rectangle)}:"
+    digest = hashlib.sha256(prefix.encode('utf-8'))
+    digest.update(image)
+    return digest.hexdigest()
+
+
+def _warm_worker():
+    """Inicializador dos processos de OCR: carrega o modelo antes do primeiro lote."""
+    import image_utils
+
+    image_utils.EasyOCRReader()
+
+
+def _ocr_batch(items):
+    """Executado no processo de OCR: recebe [(JPEG, rótulo, recorte)] e retorna (caixas por quadro, segundos)."""
+    import image_utils
+
+    start = time.perf_counter()
+    frames = [image_utils.Frame(image, label, crop).pixels for image, label, crop in items]
+    detections = image_utils.detect_text_batched(frames, image_utils.EasyOCRReader())
+    return detections, time.perf_counter() - start
+
+
+class OcrService:
+    """Detecção de texto nos quadros dos GIFs, com cache das caixas por imagem.
+
+    As caixas encontradas em um quadro não dependem das manchas que serão
+    destacadas, então ficam salvas em SQLite pelo hash da imagem e servem para
+    qualquer lista de manchas. Os quadros ainda não analisados são divididos em
+    lotes de `batch_size` e processados em paralelo por `workers` processos.
+    """
+
+    def __init__(self, workers: int = OCR_WORKERS, batch_size: int = OCR_BATCH_SIZE, db_name: str = OCR_CACHE_DB):
+        self.workers = workers
+        self.batch_size = batch_size
+        self.hits = 0
+        self.misses = 0
+        self.batches = 0
+        self.ocr_seconds = 0.0
+        self._executor = None
+        self._lock = threading.Lock()
+        self._inline_lock = threading.Lock()
+        self._open_lock = threading.Lock()
+        self.db_name = db_name
+        self.pool = None
+
+    def _create_connection(self):
+        """Empresta uma conexão do cache de caixas, criado no primeiro uso (não ao importar o módulo)."""
+        with self._open_lock:
+            if self.pool is None:
+                directory = os.path.dirname(self.db_name)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                pool = ConnectionPool(self.db_name, size=2)
+                self.create_tables(pool)
+                self.pool = pool
+        return self.pool.connection()
+
+    def create_tables(self, pool):
+        with pool.connection() as conn:
+            conn.execute('''
+            CREATE TABLE IF NOT EXISTS ocr_results (
+                image_key CHAR(64) PRIMARY KEY,
+                detections JSON NOT NULL
+            )
+            ''')
+            conn.commit()
+
+    def _fetch(self, keys):
+        keys = list(set(keys))
+        result = {}
+        with self._create_connection() as conn:
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                placeholders = ', '.join('?' for _ in chunk)
+                query = f'SELECT image_key, detections FROM ocr_results WHERE image_key IN ({placeholders})'
+                for key, detections in conn.execute(query, chunk):
+                    result[key] = json.loads(detections)
+        return result
+
+    def _save(self, detections_by_key):
+        with self._create_connection() as conn:
+            conn.executemany(
+                'INSERT OR REPLACE INTO ocr_results (image_key, detections) VALUES (?, ?)',
+                [(key, json.dumps(detections)) for key, detections in detections_by_key.items()])
+            conn.commit()
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_warm_worker)
+            return self._executor
+
+    def _ocr_inline(self, items):
+        # Sem processos dedicados, um único modelo é compartilhado pelas threads, um lote por vez
+        with self._inline_lock:
+            return _ocr_batch(items)
+
+    async def _run_batch(self, items):
+        if self.workers <= 0:
+            return await executors.run_io(self._ocr_inline, items)
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(self._pool(), _ocr_batch, items)
+        except BrokenProcessPool:
+            self.shutdown()
+            raise
+
+    async def detect(self, images, labels=None, crop=None):
+        """Retorna as caixas de texto de cada imagem (JPEG), analisando apenas as que não estão no cache.
+
+        `crop` é o recorte (image_utils.detect_crop) usado no pré-processamento dos quadros com rótulo.
+        """
+        labels = labels if labels is not None else [None] * len(images)
+        crops = [crop if label is not None else None for label in labels]
+        keys = [image_key(image, label, frame_crop) for image, label, frame_crop in zip(images, labels, crops)]
+        found = await executors.run_io(self._fetch, keys)
+
+        pending = {}
+        for key, image, label, frame_crop in zip(keys, images, labels, crops):
+            if key not in found and key not in pending:
+                pending[key] = (image, label, frame_crop)
+        with self._lock:
+            self.hits += len(keys) - len(pending)
+            self.misses += len(pending)
+
+        if pending:
+            pending_keys = list(pending)
+            batches = [pending_keys[start:start + self.batch_size]
+                       for start in range(0, len(pending_keys), self.batch_size)]
+            results = await asyncio.gather(*(self._run_batch([pending[key] for key in batch]) for batch in batches))
+            new = {}
+            for batch, (detections, seconds) in zip(batches, results):
+                new.update(zip(batch, detections))
+                with self._lock:
+                    self.batches += 1
+                    self.ocr_seconds += seconds
+            await executors.run_io(self._save, new)
+            found.update(new)
+
+        return [found[key] for key in keys]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "batch_size": self.batch_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "batches": self.batches,
+                "ocr_seconds": round(self.ocr_seconds, 3),
+            }
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+
+ocr_service = OcrService()
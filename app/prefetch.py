@@ -0,0 +1,200 @@
+import asyncio
+import datetime
+import logging
+import os
+import time
+import uuid
+from collections import deque
+
+import executors
+import utils
+
+# Intervalo (s) entre as rodadas do agendador; 0 desativa
+PREFETCH_INTERVAL = int(os.environ.get("SOLAIRE_PREFETCH_INTERVAL", 900))
+# Últimos dias mantidos no cache, com tabelas e imagens
+PREFETCH_DAYS = int(os.environ.get("SOLAIRE_PREFETCH_DAYS", 30))
+# Dias antigos ausentes do banco baixados (só as tabelas) a cada rodada
+BACKFILL_DAYS_PER_CYCLE = int(os.environ.get("SOLAIRE_BACKFILL_DAYS_PER_CYCLE", 5))
+# Data mais antiga preenchida pelo backfill
+BACKFILL_START = os.environ.get("SOLAIRE_BACKFILL_START", "2015-01-01")
+# Quantidade de erros recentes mantidos para o endpoint de status
+PREFETCH_RECENT_ERRORS = 20
+# Espera (s) antes de tentar de novo um dia antigo que falhou; dobra a cada nova falha, até um dia
+BACKFILL_RETRY_DELAY = int(os.environ.get("SOLAIRE_BACKFILL_RETRY_DELAY", 3600))
+BACKFILL_RETRY_MAX_DELAY = 24 * 3600
+# Dias consultados no banco de cada vez ao procurar dias ausentes abaixo do cursor
+BACKFILL_SCAN_DAYS = 366
+# Nome da concessão no banco que escolhe o único processo que executa as rodadas
+PREFETCH_LEASE = "prefetch"
+
+logger = logging.getLogger(__name__)
+
+
+class PrefetchScheduler:
+    """Mantém o cache aquecido em segundo plano.
+
+    A cada `interval` segundos: baixa os últimos `days` dias que ainda não
+    estão no banco ou no cache de imagens, baixa de novo hoje e ontem antes
+    que o TTL (`SOLAIRE_RECENT_DAYS_TTL`) expire, para que nenhum visitante
+    espere pelo SolarMonitor, e preenche até `backfill_per_cycle` dias antigos
+    ausentes, do mais recente para o mais antigo. Um cursor guarda até onde o
+    histórico já foi percorrido, e um dia que falha é tentado de novo após uma
+    espera que dobra a cada falha.
+
+    Com vários workers do uvicorn, cada processo tem o seu agendador, mas só o
+    que detém a concessão "prefetch" no banco executa as rodadas; os demais
+    apenas tentam obtê-la a cada intervalo, assumindo se o dono parar.
+    """
+
+    def __init__(self, interval: int = PREFETCH_INTERVAL, days: int = PREFETCH_DAYS,
+                 backfill_per_cycle: int = BACKFILL_DAYS_PER_CYCLE, backfill_start: str = BACKFILL_START):
+        self.interval = interval
+        self.days = days
+        self.backfill_per_cycle = backfill_per_cycle
+        self.backfill_start = backfill_start
+        self.cycles = 0
+        self.last_started = None
+        self.last_duration = None
+        self.last_prefetched = []
+        self.backfilled = 0
+        self.backfill_pending = None
+        self._cursor = None
+        self._failed = {}
+        self._errors = deque(maxlen=PREFETCH_RECENT_ERRORS)
+        self._task = None
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.leader = False
+
+    def trailing_dates(self):
+        today = datetime.datetime.strptime(utils.recent_dates()[-1], "%Y-%m-%d")
+        return [str((today - datetime.timedelta(days=offset)).date()) for offset in range(self.days - 1, -1, -1)]
+
+    def _next_backfill(self, first_trailing):
+        """Próximos dias antigos a baixar: primeiro os que falharam e cuja espera acabou, depois os
+        ausentes do banco abaixo do cursor, que desce do início da janela até `backfill_start`."""
+        start = datetime.datetime.strptime(self.backfill_start, "%Y-%m-%d").date()
+        if self._cursor is None:
+            self._cursor = datetime.datetime.strptime(first_trailing, "%Y-%m-%d").date() - datetime.timedelta(days=1)
+
+        now = time.time()
+        batch = [date for date, (_, retry_at) in sorted(self._failed.items(), reverse=True) if retry_at <= now]
+        batch = batch[:self.backfill_per_cycle]
+        while len(batch) < self.backfill_per_cycle and self._cursor >= start:
+            scan_start = max(start, self._cursor - datetime.timedelta(days=BACKFILL_SCAN_DAYS - 1))
+            stored = set(utils.db_dao.fetch_stored_dates(str(scan_start), str(self._cursor)))
+            while self._cursor >= scan_start and len(batch) < self.backfill_per_cycle:
+                date = str(self._cursor)
+                if date not in stored and date not in self._failed:
+                    batch.append(date)
+                self._cursor -= datetime.timedelta(days=1)
+        return batch
+
+    def _pending_history(self):
+        """Dias ausentes que o backfill ainda precisa baixar (abaixo do cursor ou aguardando nova tentativa)."""
+        start = datetime.datetime.strptime(self.backfill_start, "%Y-%m-%d").date()
+        if self._cursor < start:
+            return len(self._failed)
+        stored = utils.db_dao.fetch_stored_dates(str(start), str(self._cursor))
+        return (self._cursor - start).days + 1 - len(stored) + len(self._failed)
+
+    def _backfill_failed(self, date):
+        attempts = self._failed.get(date, (0, 0))[0] + 1
+        delay = min(BACKFILL_RETRY_MAX_DELAY, BACKFILL_RETRY_DELAY * 2 ** (attempts - 1))
+        self._failed[date] = (attempts, time.time() + delay)
+
+    def _error(self, stage, dates, error):
+        self._errors.append({"time": time.time(), "stage": stage, "dates": dates, "error": repr(error)})
+        logger.warning("prefetch %s %s: %r", stage, dates, error)
+
+    async def _fetch(self, stage, dates, data_only=False, max_age=utils.RECENT_DAYS_TTL):
+        try:
+            await utils.cache_and_get_solar_monitor_info_from_days_async(dates, data_only, max_age)
+            return True
+        except asyncio.CancelledError:
+            raise
+        except Exception as error:
+            self._error(stage, dates, error)
+            return False
+
+    async def run_cycle(self):
+        self.last_started = time.time()
+        start = time.perf_counter()
+        trailing = self.trailing_dates()
+
+        # Hoje e ontem são renovados uma rodada antes de expirar
+        max_age = max(0, utils.RECENT_DAYS_TTL - self.interval)
+        recent = [date for date in utils.recent_dates() if date in trailing]
+        await self._fetch("recent", recent, max_age=max_age)
+
+        # Um dia por vez fora da janela recente, para que uma falha não impeça os demais
+        if not await self._fetch("trailing", trailing):
+            for date in trailing:
+                await self._fetch("trailing", [date])
+        self.last_prefetched = trailing
+
+        if self.backfill_per_cycle > 0:
+            batch = await executors.run_io(self._next_backfill, trailing[0])
+            for date in batch:
+                if await self._fetch("backfill", [date], data_only=True):
+                    self.backfilled += 1
+                    self._failed.pop(date, None)
+                else:
+                    self._backfill_failed(date)
+            self.backfill_pending = await executors.run_io(self._pending_history)
+
+        self.cycles += 1
+        self.last_duration = time.perf_counter() - start
+
+    async def _run(self):
+        while True:
+            try:
+                # A concessão dura duas rodadas: se o dono parar, outro processo assume
+                self.leader = await executors.run_io(
+                    utils.db_dao.acquire_lease, PREFETCH_LEASE, self.owner, 2 * self.interval)
+                if self.leader:
+                    await self.run_cycle()
+            except asyncio.CancelledError:
+                raise
+            except Exception as error:
+                self._error("cycle", [], error)
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self.interval <= 0 or self._task is not None:
+            return
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def shutdown(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self.leader:
+            utils.db_dao.release_lease(PREFETCH_LEASE, self.owner)
+            self.leader = False
+
+    def stats(self):
+        return {
+            "enabled": self.interval > 0,
+            "running": self._task is not None and not self._task.done(),
+            "leader": self.leader,
+            "interval_seconds": self.interval,
+            "recent_days_ttl_seconds": utils.RECENT_DAYS_TTL,
+            "trailing_days": self.days,
+            "cycles": self.cycles,
+            "last_started": self.last_started,
+            "last_duration_seconds": round(self.last_duration, 3) if self.last_duration is not None else None,
+            "last_prefetched": [self.last_prefetched[0], self.last_prefetched[-1]] if self.last_prefetched else None,
+            "backfill": {
+                "per_cycle": self.backfill_per_cycle,
+                "start": self.backfill_start,
+                "done": self.backfilled,
+                "pending": self.backfill_pending,
+                "cursor": str(self._cursor) if self._cursor is not None else None,
+                "failed": {date: {"attempts": attempts, "retry_at": retry_at}
+                           for date, (attempts, retry_at) in sorted(self._failed.items())},
+            },
+            "errors": list(self._errors),
+        }
+
+
+prefetch_scheduler = PrefetchScheduler()
@@ -0,0 +1,155 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import executors
+from single_flight import SingleFlight
+
+RENDER_CACHE_DIR = os.environ.get("SOLAIRE_RENDER_CACHE_DIR", "render_cache")
+RENDER_CACHE_MEMORY_BYTES = int(os.environ.get("SOLAIRE_RENDER_CACHE_MEMORY_BYTES", 64 * 1024 * 1024))
+RENDER_CACHE_DISK_BYTES = int(os.environ.get("SOLAIRE_RENDER_CACHE_DISK_BYTES", 512 * 1024 * 1024))
+
+# Incrementar quando a aparência dos gráficos mudar, para invalidar o que já está em disco
+RENDER_VERSION = 1
+
+
+def make_key(endpoint: str, params: dict, data_version: str):
+    """Gera a chave (e ETag) de um gráfico a partir do endpoint, dos parâmetros e da versão dos dados."""
+    normalized = {
+        name: sorted(set(value)) if isinstance(value, (list, tuple, set)) else value
+        for name, value in params.items()
+    }
+    payload = json.dumps([RENDER_VERSION, endpoint, normalized, data_version], sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class RenderCache:
+    """Cache de gráficos renderizados com duas camadas: memória e disco.
+
+    Cada camada tem um limite em bytes e remove primeiro as entradas usadas
+    há mais tempo.
+    """
+
+    def __init__(self, directory: str = RENDER_CACHE_DIR, memory_bytes: int = RENDER_CACHE_MEMORY_BYTES,
+                 disk_bytes: int = RENDER_CACHE_DISK_BYTES):
+        self.directory = directory
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self.flight = SingleFlight("render")
+        self._memory = OrderedDict()
+        self._memory_size = 0
+        # Índice do disco, lido no primeiro uso (e não ao importar o módulo)
+        self._disk = None
+        self._disk_size = 0
+
+    def _path(self, key):
+        return os.path.join(self.directory, key)
+
+    def _load_disk_index(self):
+        """Cria a pasta e carrega o índice do disco, uma única vez. Chamado com `_lock` obtido."""
+        if self._disk is not None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        self._disk = OrderedDict()
+        entries = []
+        for name in os.listdir(self.directory):
+            stat = os.stat(self._path(name))
+            entries.append((stat.st_mtime, name, stat.st_size))
+        for _, name, size in sorted(entries):
+            self._disk[name] = size
+            self._disk_size += size
+
+    def _remember(self, key, data):
+        if len(data) > self.memory_bytes:
+            return
+        if key in self._memory:
+            self._memory_size -= len(self._memory.pop(key))
+        self._memory[key] = data
+        self._memory_size += len(data)
+        while self._memory_size > self.memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_size -= len(evicted)
+
+    def get(self, key):
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return data
+            self._load_disk_index()
+            if key in self._disk:
+                try:
+                    with open(self._path(key), 'rb') as file:
+                        data = file.read()
+                    os.utime(self._path(key))
+                    self._disk.move_to_end(key)
+                    self._remember(key, data)
+                    self.disk_hits += 1
+                    return data
+                except FileNotFoundError:
+                    self._disk_size -= self._disk.pop(key)
+            self.misses += 1
+            return None
+
+    def put(self, key, data):
+        with self._lock:
+            self._remember(key, data)
+            if len(data) > self.disk_bytes:
+                return
+            self._load_disk_index()
+            tmp_path = self._path(key) + ".tmp"
+            with open(tmp_path, 'wb') as file:
+                file.write(data)
+            os.replace(tmp_path, self._path(key))
+            if key in self._disk:
+                self._disk_size -= self._disk.pop(key)
+            self._disk[key] = len(data)
+            self._disk_size += len(data)
+            while self._disk_size > self.disk_bytes:
+                evicted, size = self._disk.popitem(last=False)
+                self._disk_size -= size
+                try:
+                    os.remove(self._path(evicted))
+                except FileNotFoundError:
+                    pass
+
+    async def get_or_render_async(self, key, render, flight_key=None):
+        """Retorna o gráfico do cache ou o renderiza com a corrotina `render()` (que devolve bytes).
+        Com `key` None o gráfico é sempre renderizado e não é guardado. A leitura e a gravação
+        do cache (disco) rodam no pool de threads de I/O, fora do event loop.
+
+        Pedidos simultâneos do mesmo gráfico esperam uma única renderização: os de mesma `key`
+        e, para gráficos que não vão para o cache (`key` None), os de mesmo `flight_key`.
+        """
+        if key is None:
+            if flight_key is None:
+                return await render()
+            return await self.flight.do(("uncached", flight_key), render)
+        data = await executors.run_io(self.get, key)
+        if data is None:
+            data = await self.flight.do(key, lambda: self._render_and_put(key, render))
+        return data
+
+    async def _render_and_put(self, key, render):
+        data = await render()
+        await executors.run_io(self.put, key, data)
+        return data
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_size,
+                "disk_entries": len(self._disk or ()),
+                "disk_bytes": self._disk_size,
+            }
@@ -0,0 +1,95 @@
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures.process import BrokenProcessPool
+
+import executors
+import lazy_imports
+
+# Quantidade de jobs recentes mantidos para o endpoint de estatísticas
+RENDER_RECENT_JOBS = 50
+
+
+def _render_job(create_graphic, content, args):
+    """Executado no processo de renderização: retorna (PNG, segundos renderizando, pid)."""
+    import graphic_utils
+
+    start = time.perf_counter()
+    png = graphic_utils.render_to_bytes(create_graphic, content, *args)
+    return png, time.perf_counter() - start, os.getpid()
+
+
+class RenderService:
+    """Renderiza os gráficos de graphic_utils no pool de processos de CPU de `executors`.
+
+    Cada job registra o tempo de espera na fila, o tempo de renderização e o
+    processo que o executou; `stats` agrega esses tempos por tipo de gráfico.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._inline_lock = threading.Lock()
+        self._totals = {}
+        self._recent = deque(maxlen=RENDER_RECENT_JOBS)
+
+    def start(self):
+        """Cria os processos de CPU já na inicialização quando 'graphics' está em SOLAIRE_PRELOAD;
+        caso contrário não faz nada e o pool é criado no primeiro uso.
+
+        Cada processo é aquecido pelo inicializador do pool (lazy_imports.preload_worker, com
+        'graphics' em SOLAIRE_WORKER_PRELOAD por padrão), então nenhum começa sem o matplotlib,
+        mesmo os criados depois. Retorna os pids dos processos iniciados.
+        """
+        if executors.CPU_WORKERS <= 0 or "graphics" not in lazy_imports.preload_groups():
+            return []
+        pool = executors.cpu_executor()
+        # Jobs simultâneos fazem o pool iniciar todos os processos
+        return sorted({future.result() for future in [pool.submit(os.getpid) for _ in range(executors.CPU_WORKERS)]})
+
+    def _render_inline(self, create_graphic, content, args):
+        # O pyplot não é thread-safe: sem processos dedicados, um gráfico por vez
+        with self._inline_lock:
+            return _render_job(create_graphic, content, args)
+
+    async def render(self, create_graphic, content, *args):
+        """Renderiza `create_graphic(content, img_bytes, *args)` e retorna os bytes do PNG."""
+        submitted = time.perf_counter()
+        if executors.CPU_WORKERS <= 0:
+            png, render_time, pid = await executors.run_io(self._render_inline, create_graphic, content, args)
+        else:
+            try:
+                png, render_time, pid = await executors.run_cpu(_render_job, create_graphic, content, args)
+            except BrokenProcessPool:
+                # Um processo morreu (ex.: falta de memória); o próximo job recria o pool
+                executors.reset_cpu_executor()
+                raise
+        total_time = time.perf_counter() - submitted
+        self._record(create_graphic.__name__, render_time, total_time, pid, len(png))
+        return png
+
+    def _record(self, name, render_time, total_time, pid, size):
+        job = {
+            "graphic": name,
+            "render_ms": round(render_time * 1000, 1),
+            "queue_ms": round((total_time - render_time) * 1000, 1),
+            "pid": pid,
+            "bytes": size,
+        }
+        with self._lock:
+            self._recent.append(job)
+            totals = self._totals.setdefault(name, {"jobs": 0, "render_ms": 0.0, "max_render_ms": 0.0})
+            totals["jobs"] += 1
+            totals["render_ms"] += job["render_ms"]
+            totals["max_render_ms"] = max(totals["max_render_ms"], job["render_ms"])
+
+    def stats(self):
+        with self._lock:
+            graphics = {
+                name: {**totals, "avg_render_ms": round(totals["render_ms"] / totals["jobs"], 1)}
+                for name, totals in self._totals.items()
+            }
+            return {"workers": executors.CPU_WORKERS, "graphics": graphics, "recent": list(self._recent)}
+
+
+render_service = RenderService()
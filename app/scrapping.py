@@ -1,13 +1,77 @@
-import requests
+import asyncio
+import httpx
 from bs4 import BeautifulSoup
 import re
-import json
-import cv2
-import requests
-import numpy as np
-
-base_url = "https://www.solarmonitor.org"
-solar_monitor_url = base_url + "/full_disk.php?date={}&type=shmi_maglc&indexnum=1"
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+import executors
+from single_flight import SingleFlight
+
+base_url = os.environ.get("SOLAIRE_BASE_URL", "https://www.solarmonitor.org")
+image_type = "shmi_maglc"
+solar_monitor_url = base_url + "/full_disk.php?date={}&type=" + image_type + "&indexnum=1"
+
+# Configuração do cliente HTTP compartilhado
+FETCH_CONCURRENCY = int(os.environ.get("SOLAIRE_FETCH_CONCURRENCY", 8))
+FETCH_TIMEOUT = float(os.environ.get("SOLAIRE_FETCH_TIMEOUT", 30))
+FETCH_RETRIES = int(os.environ.get("SOLAIRE_FETCH_RETRIES", 3))
+FETCH_BACKOFF = float(os.environ.get("SOLAIRE_FETCH_BACKOFF", 0.5))
+# Requisições por segundo permitidas para cada host (0 desativa o limite)
+FETCH_RATE_LIMIT = float(os.environ.get("SOLAIRE_FETCH_RATE_LIMIT", 10))
+# Respostas que são repetidas com espera exponencial
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+
+class HostRateLimiter:
+    """Espaça as requisições para um mesmo host em pelo menos 1/rate segundos."""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next_slot = {}
+        self._lock = threading.Lock()
+
+    def _reserve(self, url):
+        """Reserva o próximo horário livre do host e retorna quantos segundos faltam para ele."""
+        host = urlsplit(url).netloc
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + self.interval
+        return slot - now
+
+    async def wait_async(self, url):
+        if not self.interval:
+            return
+        delay = self._reserve(url)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+rate_limiter = HostRateLimiter(FETCH_RATE_LIMIT)
+http_flight = SingleFlight("http")
+_async_client = None
+_async_client_loop = None
+
+
+def get_async_client():
+    """Cliente httpx assíncrono compartilhado, recriado se o event loop mudar."""
+    global _async_client, _async_client_loop
+    loop = asyncio.get_running_loop()
+    if _async_client is None or _async_client_loop is not loop:
+        limits = httpx.Limits(max_connections=FETCH_CONCURRENCY, max_keepalive_connections=FETCH_CONCURRENCY)
+        transport = httpx.AsyncHTTPTransport(retries=FETCH_RETRIES, limits=limits)
+        _async_client = httpx.AsyncClient(transport=transport, timeout=FETCH_TIMEOUT, follow_redirects=True)
+        _async_client_loop = loop
+    return _async_client
+
+
+async def close_async_client():
+    global _async_client, _async_client_loop
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = _async_client_loop = None
 
 def get_x_coordinate(coordinates_match):
     if coordinates_match[0] == "N":
@@ -21,23 +85,30 @@ def get_y_coordinate(coordinates_match):
     else:
         return coordinates_match[4:6]
 
-def get_html(url):
-    return requests.get(url)
+async def get_html_async(url):
+    """Baixa `url` com o cliente compartilhado, repetindo com espera exponencial as respostas
+    em RETRY_STATUS; se elas persistirem após FETCH_RETRIES tentativas, levanta
+    httpx.HTTPStatusError. Pedidos simultâneos para a mesma URL (página ou imagem)
+    compartilham um único download."""
+    return await http_flight.do(url, lambda: _get_html_async(url))
+
+
+async def _get_html_async(url):
+    client = get_async_client()
+    for attempt in range(FETCH_RETRIES + 1):
+        await rate_limiter.wait_async(url)
+        response = await client.get(url)
+        if response.status_code not in RETRY_STATUS:
+            return response
+        if attempt == FETCH_RETRIES:
+            response.raise_for_status()
+        await asyncio.sleep(FETCH_BACKOFF * (2 ** attempt))
 
 def get_soup(response):
     soup = BeautifulSoup(response.content, 'html.parser')
     return soup
 
-def get_image_links_from_date(year, month, day):
-    html_content = get_soup(get_html(solar_monitor_url.format(year+month+day, "")))
-    links = html_content.find_all('a', string=re.compile(r'.*fd.*'))
-    links = [link.get('href') for link in links]
-    links = [solar_monitor_url.format(year, month, day, link) for link in links]
-    return links
-
-def get_table_content_from_date(year, month, day):
-    # Supondo que você tenha a função get_soup e a URL correta definida
-    html_content = get_soup(get_html(solar_monitor_url.format(year + month + day, "")))
+def parse_table_content(html_content, year, month, day):
     tables = html_content.find_all('div', class_='noaat')
 
     data = []
@@ -65,39 +136,77 @@ def get_table_content_from_date(year, month, day):
             }
             data.append(entry)
 
-    return json.dumps(data, indent=2, ensure_ascii=False)
+    return data
 
 
-def get_table_image_from_date(year, month, day):
-    html_content = get_soup(get_html(solar_monitor_url.format(year + month + day, "")))
+def parse_table_image(html_content):
     # Encontra todas as tags de imagem <img> com a string 'shmi' no atributo src
     img_tags = html_content.find_all('img', src=lambda value: value and 'shmi_maglc_fd' in value)
 
-    # Itera sobre as tags <img> que atendem ao critério especificado acima
+    # Retorna o primeiro src encontrado que satisfaz a condição
     for img in img_tags:
-        img_src = img.get('src')
-        img_src = base_url + "/" + img_src
-  # Imprime o src da imagem que contém 'shmi' no atributo src
-        return (""+img_src)  # Retorna o primeiro src encontrado que satisfaz a condição
+        return base_url + "/" + img.get('src')
+    return None
 
 
+def parse_fd_links(html_content):
+    links = html_content.find_all('a', string=re.compile(r'.*fd.*'))
+    return [base_url + "/" + link.get('href') for link in links if link.get('href')]
 
-def download_img(url):
-    response = requests.get(url)
-    
+
+def parse_day_snapshot(response, year, month, day):
+    html_content = get_soup(response)
+    return {
+        "table": parse_table_content(html_content, year, month, day),
+        "image_url": parse_table_image(html_content),
+        "links": parse_fd_links(html_content),
+    }
+
+
+async def get_day_snapshot_async(year, month, day):
+    """Baixa e interpreta a página do dia uma única vez, retornando a tabela NOAA,
+    a URL do magnetograma e os demais links 'fd'."""
+    response = await get_html_async(solar_monitor_url.format(year + month + day))
+    # Uma página de erro não é interpretada: salvá-la gravaria o dia como "sem manchas"
+    if response.status_code != 200:
+        raise httpx.HTTPStatusError(f"Falha ao baixar a página do dia. Status code: {response.status_code}",
+                                    request=response.request, response=response)
+    # O parsing do HTML roda fora do event loop
+    return await executors.run_io(parse_day_snapshot, response, year, month, day)
+
+
+async def gather_concurrently(func, items, concurrency=None):
+    """Aguarda `func(item)` para cada item com no máximo `concurrency` chamadas em
+    andamento e retorna um dicionário {item: resultado} na ordem de entrada."""
+    items = list(dict.fromkeys(items))
+    semaphore = asyncio.Semaphore(concurrency or FETCH_CONCURRENCY)
+
+    async def limited(item):
+        async with semaphore:
+            return await func(item)
+
+    results = await asyncio.gather(*(limited(item) for item in items))
+    return dict(zip(items, results))
+
+
+async def fetch_days_async(dates, concurrency=None):
+    """Baixa as páginas de vários dias (YYYY-MM-DD) em paralelo e retorna {data: snapshot}."""
+    return await gather_concurrently(lambda date: get_day_snapshot_async(*date.split("-")), dates, concurrency)
+
+
+def _image_content(url, response):
     # Verifica se o download foi bem-sucedido
     if response.status_code == 200:
-        img_array = np.frombuffer(response.content, np.uint8)
-        
         # Verifica se o conteúdo da imagem não está vazio
-        if img_array.size > 0:
-            imagem = cv2.imdecode(img_array, cv2.IMREAD_COLOR)
-            if imagem is not None:
-                return imagem
-            else:
-                raise ValueError("Falha ao decodificar a imagem.")
+        if len(response.content) > 0:
+            return response.content
         else:
             print("error->", url)
             return None
     else:
         raise ValueError(f"Falha ao baixar a imagem. Status code: {response.status_code}")
+
+
+async def download_img_bytes_async(url):
+    return _image_content(url, await get_html_async(url))
+
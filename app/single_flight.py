@@ -0,0 +1,45 @@
+import asyncio
+import threading
+
+
+class SingleFlight:
+    """Agrupa chamadas assíncronas simultâneas com a mesma chave.
+
+    A primeira chamada executa `func()`; as que chegam enquanto ela está em
+    andamento aguardam o mesmo resultado (ou a mesma exceção) em vez de
+    repetir o trabalho. Quando uma das chamadas é cancelada (ex.: cliente
+    desconectado), o trabalho continua para as demais.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.leaders = 0
+        self.followers = 0
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    async def do(self, key, func):
+        loop = asyncio.get_running_loop()
+        task = self._inflight.get((loop, key))
+        if task is not None:
+            with self._lock:
+                self.followers += 1
+            return await asyncio.shield(task)
+
+        task = asyncio.ensure_future(func())
+        self._inflight[(loop, key)] = task
+        task.add_done_callback(lambda done: self._finished(loop, key, done))
+        with self._lock:
+            self.leaders += 1
+        return await asyncio.shield(task)
+
+    def _finished(self, loop, key, task):
+        if self._inflight.get((loop, key)) is task:
+            del self._inflight[(loop, key)]
+        # Evita o aviso de exceção não lida quando todas as chamadas foram canceladas
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self):
+        with self._lock:
+            return {"leaders": self.leaders, "followers": self.followers, "in_flight": len(self._inflight)}
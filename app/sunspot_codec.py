@@ -0,0 +1,117 @@
+import datetime
+import functools
+import struct
+
+# Formato compacto (binário) dos registros diários de manchas solares.
+#
+# Cabeçalho: b'SS' + versão (B) + quantidade de manchas (H)
+# Por mancha: número NOAA (I), dígitos do número NOAA (B), quantidade de posições (H)
+# Por posição: ordinal do dia (I), diferença entre 'date' e 'day' em dias (h),
+#   longitude (h), latitude (h), classe de Hale (B), classe de McIntosh (3s),
+#   área (H), número de manchas (H), flags (B), tamanho da posição (B) + posição (utf-8)
+_MAGIC = b'SS'
+_VERSION = 1
+_HEADER = struct.Struct('<2sBH')
+_REGION = struct.Struct('<IBH')
+_POSITION = struct.Struct('<IhhhB3sHHBB')
+
+_NEGATIVE_ZERO_X = 1
+_NEGATIVE_ZERO_Y = 2
+_HAS_CLASSES = 4
+
+_MISSING = 0xFFFF
+
+HALE_CLASSES = (
+    None, 'alpha', 'beta', 'gamma', 'delta', 'beta-gamma', 'beta-delta',
+    'gamma-delta', 'beta-gamma-delta',
+)
+_HALE_CODES = {name: code for code, name in enumerate(HALE_CLASSES)}
+
+
+@functools.lru_cache(maxsize=1024)
+def _coordinate(value, negative_zero):
+    if value < 0 or negative_zero:
+        return f"-{abs(value):02d}"
+    return f"{value:02d}"
+
+
+@functools.lru_cache(maxsize=65536)
+def _ordinal_to_date(ordinal):
+    return datetime.date.fromordinal(ordinal).isoformat()
+
+
+def _encode_position(pos):
+    day_ordinal = datetime.date.fromisoformat(pos['day']).toordinal()
+    date_delta = datetime.date.fromisoformat(pos['date']).toordinal() - day_ordinal
+    flags = 0
+    if pos['x_coordinate'] == '-00':
+        flags |= _NEGATIVE_ZERO_X
+    if pos['y_coordinate'] == '-00':
+        flags |= _NEGATIVE_ZERO_Y
+    hale, mcintosh, area, spots = 0, b'', _MISSING, _MISSING
+    if 'hale_class' in pos:
+        flags |= _HAS_CLASSES
+        hale = _HALE_CODES[pos['hale_class'] or None]
+        mcintosh = (pos['mcintosh_class'] or '').encode('ascii')
+        area = _MISSING if pos['area'] is None else pos['area']
+        spots = _MISSING if pos['spots'] is None else pos['spots']
+    position = pos['position'].encode('utf-8')
+    return _POSITION.pack(
+        day_ordinal, date_delta, pos['longitude'], pos['latitude'], hale, mcintosh,
+        area, spots, flags, len(position)) + position
+
+
+def encode_day(sunspot_info):
+    """Codifica o JSON de um dia no formato compacto.
+
+    Retorna None quando o registro não pode ser representado exatamente,
+    caso em que ele deve continuar sendo salvo como JSON.
+    """
+    try:
+        chunks = [_HEADER.pack(_MAGIC, _VERSION, len(sunspot_info))]
+        for item in sunspot_info:
+            noaa_number = item['noaaNumber']
+            chunks.append(_REGION.pack(int(noaa_number), len(noaa_number), len(item['latestPositions'])))
+            chunks.extend(_encode_position(pos) for pos in item['latestPositions'])
+        blob = b''.join(chunks)
+    except (KeyError, ValueError, TypeError, UnicodeEncodeError, struct.error):
+        return None
+    # Garante que a decodificação devolve exatamente o registro original
+    if decode_day(blob) != sunspot_info:
+        return None
+    return blob
+
+
+def decode_day(blob):
+    """Decodifica um registro compacto de volta para a estrutura JSON do dia."""
+    magic, version, regions = _HEADER.unpack_from(blob, 0)
+    if magic != _MAGIC or version != _VERSION:
+        raise ValueError("Registro compacto inválido.")
+    offset = _HEADER.size
+    sunspot_info = []
+    for _ in range(regions):
+        noaa_number, digits, count = _REGION.unpack_from(blob, offset)
+        offset += _REGION.size
+        positions = []
+        for _ in range(count):
+            (day_ordinal, date_delta, longitude, latitude, hale, mcintosh,
+             area, spots, flags, length) = _POSITION.unpack_from(blob, offset)
+            offset += _POSITION.size
+            pos = {
+                'position': blob[offset:offset + length].decode('utf-8'),
+                'day': _ordinal_to_date(day_ordinal),
+                'x_coordinate': _coordinate(longitude, bool(flags & _NEGATIVE_ZERO_X)),
+                'y_coordinate': _coordinate(latitude, bool(flags & _NEGATIVE_ZERO_Y)),
+                'longitude': longitude,
+                'latitude': latitude,
+                'date': _ordinal_to_date(day_ordinal + date_delta),
+            }
+            offset += length
+            if flags & _HAS_CLASSES:
+                pos['hale_class'] = HALE_CLASSES[hale]
+                pos['mcintosh_class'] = mcintosh.rstrip(b'\0').decode('ascii') or None
+                pos['area'] = None if area == _MISSING else area
+                pos['spots'] = None if spots == _MISSING else spots
+            positions.append(pos)
+        sunspot_info.append({'noaaNumber': str(noaa_number).zfill(digits), 'latestPositions': positions})
+    return sunspot_info
@@ -0,0 +1,136 @@
+import threading
+from collections import namedtuple
+from datetime import datetime
+
+import numpy as np
+
+# Série agregada por período usada pelos gráficos de quantidade de manchas
+PeriodSeries = namedtuple('PeriodSeries', ['periods', 'counts', 'unique_counts', 'period_dates'])
+
+
+def _to_days(dates):
+    """Converte datas YYYY-MM-DD em dias desde 1970-01-01 (int64)."""
+    return np.array(dates, dtype='datetime64[D]').astype(np.int64)
+
+
+class SunspotObservationStore:
+    """Observações de manchas solares em colunas NumPy (dia, número NOAA, longitude, latitude).
+
+    Os dados são carregados sob demanda a partir do índice 'sunspot_regions' e
+    mantidos em memória; os dias novos ou atualizados neste processo são
+    aplicados com `update`. As linhas ficam na ordem de data e, dentro de cada
+    dia, na ordem da tabela do SolarMonitor.
+    """
+
+    def __init__(self, dao):
+        self.dao = dao
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._dates = set()
+        self.days = np.empty(0, dtype=np.int64)
+        self.noaa = np.empty(0, dtype=np.int64)
+        self.longitude = np.empty(0, dtype=np.int16)
+        self.latitude = np.empty(0, dtype=np.int16)
+
+    @staticmethod
+    def _columns(rows):
+        if not rows:
+            return (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64),
+                    np.empty(0, dtype=np.int16), np.empty(0, dtype=np.int16))
+        dates, noaa, longitude, latitude = zip(*rows)
+        return (_to_days(dates), np.array(noaa).astype(np.int64),
+                np.array(longitude, dtype=np.int16), np.array(latitude, dtype=np.int16))
+
+    def _replace_days(self, dates, rows):
+        """Substitui as observações das datas informadas mantendo a ordenação por dia."""
+        new_columns = self._columns(rows)
+        keep = ~np.isin(self.days, _to_days(list(dates)))
+        columns = [np.concatenate((old[keep], new)) for old, new in zip(
+            (self.days, self.noaa, self.longitude, self.latitude), new_columns)]
+        order = np.argsort(columns[0], kind='stable')
+        self.days, self.noaa, self.longitude, self.latitude = (column[order] for column in columns)
+        self._dates.update(dates)
+
+    def _ensure(self, dates):
+        with self._lock:
+            if not self._loaded:
+                self._dates = set(self.dao.fetch_stored_dates())
+                (self.days, self.noaa, self.longitude,
+                 self.latitude) = self._columns(self.dao.fetch_region_observations())
+                self._loaded = True
+            # Dias salvos por outro processo depois da carga
+            missing = [date for date in set(dates) if date not in self._dates]
+            if missing:
+                self._replace_days(missing, self.dao.fetch_region_observations(missing))
+
+    def update(self, days: dict):
+        """Aplica os dias {data: JSON} recém salvos no banco."""
+        if not days:
+            return
+        rows = [
+            (date, item['noaaNumber'], pos['longitude'], pos['latitude'])
+            for date, json_data in sorted(days.items())
+            for item in json_data or []
+            for pos in item['latestPositions']
+        ]
+        with self._lock:
+            if self._loaded:
+                self._replace_days(list(days), rows)
+
+    def period_series(self, dates, search_type):
+        """Agrega as observações das datas informadas por mês ('MONTHLY') ou ano ('YEARLY').
+
+        As contagens seguem as mesmas regras do gráfico de quantidade de manchas:
+        no modo mensal conta as observações do período (0 quando há apenas uma),
+        no anual a diferença entre o primeiro e o último número NOAA do período.
+        `unique_counts` é a quantidade de números NOAA distintos por período.
+        """
+        self._ensure(dates)
+        with self._lock:
+            days, noaa = self.days, self.noaa
+
+        # Datas repetidas na consulta contam mais de uma vez, como no fluxo original
+        selected, multiplicity = np.unique(_to_days(dates), return_counts=True)
+        if len(selected) == 0 or len(days) == 0:
+            return PeriodSeries([], [], [], [])
+        index = np.minimum(np.searchsorted(selected, days), len(selected) - 1)
+        match = selected[index] == days
+        days, noaa, weights = days[match], noaa[match], multiplicity[index[match]]
+        if len(days) == 0:
+            return PeriodSeries([], [], [], [])
+
+        day_values = days.astype('datetime64[D]')
+        if search_type == 'MONTHLY':
+            keys = day_values.astype('datetime64[M]').astype(np.int64)
+        else:
+            keys = day_values.astype('datetime64[Y]').astype(np.int64)
+        period_keys, inverse = np.unique(keys, return_inverse=True)
+
+        if search_type == 'MONTHLY':
+            totals = np.bincount(inverse, weights=weights).astype(np.int64)
+            counts = np.where(totals == 1, 0, totals)
+        else:
+            # Desempate pela ordem em que cada mancha aparece percorrendo os dias do mais recente
+            # para o mais antigo, igual ao agrupamento feito por data_equalizer
+            traversal = np.lexsort((np.arange(len(days)), -days))
+            numbers, first_seen = np.unique(noaa[traversal], return_index=True)
+            rank = first_seen[np.searchsorted(numbers, noaa)]
+            order = np.lexsort((rank, days, inverse))
+            sorted_inverse = inverse[order]
+            first = order[np.searchsorted(sorted_inverse, np.arange(len(period_keys)), side='left')]
+            last = order[np.searchsorted(sorted_inverse, np.arange(len(period_keys)), side='right') - 1]
+            counts = np.abs(noaa[first] - noaa[last])
+
+        pairs = np.unique(np.stack((inverse, noaa)), axis=1)
+        unique_counts = np.bincount(pairs[0], minlength=len(period_keys))
+
+        if search_type == 'MONTHLY':
+            period_values = period_keys.astype('datetime64[M]')
+            periods = [str(value) for value in period_values]
+            period_dates = [datetime.strptime(period, '%Y-%m') for period in periods]
+        else:
+            period_values = period_keys.astype('datetime64[Y]')
+            periods = [str(value) for value in period_values]
+            period_dates = [datetime.strptime(period, '%Y') for period in periods]
+
+        return PeriodSeries(periods, counts.tolist(), unique_counts.tolist(), period_dates)
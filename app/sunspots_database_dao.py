@@ -1,55 +1,270 @@
-import sqlite3
 import json
+import os
+import sys
+import time
+import database_migrations
+import sunspot_codec
+from database_pool import ConnectionPool
+
+# Limite de parâmetros por consulta IN (...) do SQLite
+_MAX_QUERY_PARAMS = 500
+
+# Arquivo do banco, relativo à pasta de execução
+DB_NAME = os.environ.get("SOLAIRE_DB_NAME", "sunspots_database_sqlite.db")
+
+# Salva os novos dias no formato binário compacto (sunspot_codec) em vez de JSON
+COMPACT_STORAGE = os.environ.get("SOLAIRE_COMPACT_STORAGE", "0") == "1"
+
+
+def _decode(sunspot_info, sunspot_blob):
+    """Converte uma linha de 'sunspots_data' (JSON ou formato compacto) de volta para dicionário."""
+    if sunspot_blob is not None:
+        return sunspot_codec.decode_day(sunspot_blob)
+    return json.loads(sunspot_info)  # Converte o JSON string de volta para dicionário
+
+
+def _encode(sunspot_info, compact):
+    """Retorna (JSON, blob) para salvar; dias que o formato compacto não representa ficam em JSON."""
+    blob = sunspot_codec.encode_day(sunspot_info) if compact else None
+    if blob is not None:
+        return None, blob
+    return json.dumps(sunspot_info), None  # Converte o dicionário em string JSON
 
 class SunspotsDatabaseDao:
-    def __init__(self, db_name: str = 'sunspots_database_sqlite.db'):
+    def __init__(self, db_name: str = DB_NAME, compact: bool = COMPACT_STORAGE):
         self.db_name = db_name
-        self.create_table()
+        self.compact = compact
+        self.schema_version = None
+        self.pool = ConnectionPool(db_name)
 
     def _create_connection(self):
-        """Cria uma nova conexão com o banco de dados."""
-        return sqlite3.connect(self.db_name)
-
-    def create_table(self):
-        with self._create_connection() as conn:
-            query = '''
-            CREATE TABLE IF NOT EXISTS sunspots_data (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                sunspot_date VARCHAR(10) NOT NULL,
-                sunspot_info JSON NOT NULL
-            )
-            '''
-            conn.cursor().execute(query)
-            conn.commit()
+        """Empresta uma conexão do pool (WAL) do banco de dados."""
+        return self.pool.connection()
+
+    def migrate(self):
+        """Cria ou atualiza o esquema do banco aplicando as migrações pendentes.
 
-    def fetch_data_by_date(self, date: str):
-        """Busca o JSON e a imagem da tabela 'sunspots_data' pelo campo sunspot_date."""
-        query = 'SELECT sunspot_info FROM sunspots_data WHERE sunspot_date = ?'
+        Não é chamado na criação do DAO: a API aplica as migrações ao iniciar e
+        os comandos abaixo antes de trabalhar no banco.
+        """
+        self.schema_version = database_migrations.migrate(self.db_name)
+        return self.schema_version
+
+    def fetch_image_url_by_date(self, date: str):
+        """Busca a URL do magnetograma salva junto com o JSON do dia."""
+        query = 'SELECT image_url FROM sunspots_data WHERE sunspot_date = ? AND image_url IS NOT NULL'
         with self._create_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute(query, (date,))
-            result = cursor.fetchone()
+            result = conn.execute(query, (date,)).fetchone()
             if result:
-                json_data = json.loads(result[0])  # Converte o JSON string de volta para dicionário
-                return json_data
+                return result[0]
         return None
 
-    def insert_data(self, sunspot_date: str, sunspot_info: dict):
-        """Insere dados na tabela 'sunspots_data'."""
-        query = 'INSERT INTO sunspots_data (sunspot_date, sunspot_info) VALUES (?, ?)'
-        json_info = json.dumps(sunspot_info)  # Converte o dicionário em string JSON
+    def fetch_data_by_dates(self, dates: list):
+        """Busca vários dias de uma vez e retorna {data: JSON} apenas para os dias armazenados."""
+        dates = list(dict.fromkeys(dates))
+        result = {}
+        with self._create_connection() as conn:
+            for start in range(0, len(dates), _MAX_QUERY_PARAMS):
+                chunk = dates[start:start + _MAX_QUERY_PARAMS]
+                placeholders = ', '.join('?' for _ in chunk)
+                query = (
+                    'SELECT sunspot_date, sunspot_info, sunspot_blob FROM sunspots_data '
+                    f'WHERE sunspot_date IN ({placeholders})'
+                )
+                for sunspot_date, sunspot_info, sunspot_blob in conn.execute(query, chunk):
+                    result[sunspot_date] = _decode(sunspot_info, sunspot_blob)
+        return result
+
+    def data_version(self, start: str, end: str):
+        """Identifica o estado dos dias entre `start` e `end`: muda sempre que um deles é inserido ou regravado."""
+        query = (
+            'SELECT COUNT(*), COALESCE(MAX(updated_at), 0) FROM sunspots_data '
+            'WHERE sunspot_date BETWEEN ? AND ?'
+        )
+        with self._create_connection() as conn:
+            count, updated_at = conn.execute(query, (start, end)).fetchone()
+        return f"{count}:{updated_at}"
+
+    def fetch_updated_at(self, dates: list):
+        """Retorna {data: horário (epoch) da última gravação} para os dias armazenados;
+        None para os dias salvos antes da coluna existir."""
+        dates = list(dict.fromkeys(dates))
+        result = {}
+        with self._create_connection() as conn:
+            for start in range(0, len(dates), _MAX_QUERY_PARAMS):
+                chunk = dates[start:start + _MAX_QUERY_PARAMS]
+                placeholders = ', '.join('?' for _ in chunk)
+                query = f'SELECT sunspot_date, updated_at FROM sunspots_data WHERE sunspot_date IN ({placeholders})'
+                result.update(conn.execute(query, chunk))
+        return result
+
+    def insert_data(self, sunspot_date: str, sunspot_info: dict, image_url: str = None):
+        """Insere ou atualiza os dados do dia na tabela 'sunspots_data'."""
+        self.insert_many([(sunspot_date, sunspot_info, image_url)])
+
+    def insert_many(self, rows: list):
+        """Insere ou atualiza vários dias, recebidos como (data, JSON, URL da imagem), em uma transação."""
+        query = (
+            'INSERT INTO sunspots_data (sunspot_date, sunspot_info, sunspot_blob, image_url, updated_at) '
+            'VALUES (?, ?, ?, ?, ?) '
+            'ON CONFLICT (sunspot_date) DO UPDATE SET sunspot_info = excluded.sunspot_info, '
+            'sunspot_blob = excluded.sunspot_blob, '
+            'image_url = COALESCE(excluded.image_url, sunspots_data.image_url), '
+            'updated_at = excluded.updated_at'
+        )
+        if not rows:
+            return
+        updated_at = time.time()
+        with self._create_connection() as conn:
+            conn.executemany(query, [
+                (sunspot_date, *_encode(sunspot_info, self.compact), image_url, updated_at)
+                for sunspot_date, sunspot_info, image_url in rows
+            ])
+            for sunspot_date, sunspot_info, _ in rows:
+                self._index_regions(conn, sunspot_date, sunspot_info)
+            conn.commit()
+
+    def _index_regions(self, conn, sunspot_date: str, sunspot_info: list):
+        """Atualiza o índice de manchas NOAA com as posições de um dia."""
+        conn.execute('DELETE FROM sunspot_regions WHERE sunspot_date = ?', (sunspot_date,))
+        rows = [
+            (item['noaaNumber'], sunspot_date, pos['position'], pos['x_coordinate'], pos['y_coordinate'],
+             pos['longitude'], pos['latitude'], pos['date'])
+            for item in sunspot_info or []
+            for pos in item['latestPositions']
+        ]
+        conn.executemany(
+            'INSERT INTO sunspot_regions (noaa_number, sunspot_date, position, x_coordinate, y_coordinate, '
+            'longitude, latitude, observed_date) VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows)
+
+    def fetch_region_positions(self, noaa_numbers: list):
+        """Retorna as posições diárias das manchas NOAA informadas, na ordem de data e da tabela original."""
+        placeholders = ', '.join('?' for _ in noaa_numbers)
+        query = (
+            'SELECT noaa_number, sunspot_date, position, x_coordinate, y_coordinate, longitude, latitude, '
+            f'observed_date FROM sunspot_regions WHERE noaa_number IN ({placeholders}) '
+            'ORDER BY sunspot_date, rowid'
+        )
+        with self._create_connection() as conn:
+            return conn.execute(query, list(noaa_numbers)).fetchall()
+
+    def fetch_region_observations(self, dates: list = None):
+        """Retorna (data, número NOAA, longitude, latitude) de todas as posições indexadas,
+        ou apenas das datas informadas, na ordem de data e da tabela original."""
+        query = 'SELECT sunspot_date, noaa_number, longitude, latitude FROM sunspot_regions'
+        with self._create_connection() as conn:
+            if dates is None:
+                return conn.execute(query + ' ORDER BY sunspot_date, rowid').fetchall()
+            rows = []
+            dates = list(dict.fromkeys(dates))
+            for start in range(0, len(dates), _MAX_QUERY_PARAMS):
+                chunk = dates[start:start + _MAX_QUERY_PARAMS]
+                placeholders = ', '.join('?' for _ in chunk)
+                rows.extend(conn.execute(
+                    query + f' WHERE sunspot_date IN ({placeholders}) ORDER BY sunspot_date, rowid', chunk))
+            return sorted(rows, key=lambda row: row[0])
+
+    def fetch_stored_dates(self, start: str = None, end: str = None):
+        """Retorna as datas presentes em 'sunspots_data', todas ou só as entre `start` e `end` (inclusive)."""
+        query = 'SELECT sunspot_date FROM sunspots_data'
+        with self._create_connection() as conn:
+            if start is None:
+                return [row[0] for row in conn.execute(query)]
+            return [row[0] for row in conn.execute(query + ' WHERE sunspot_date BETWEEN ? AND ?', (start, end))]
+
+    def fetch_region_bounds(self, noaa_numbers: list):
+        """Retorna (primeiro dia, último dia) em que as manchas aparecem no banco, ou None."""
+        if not noaa_numbers:
+            return None
+        placeholders = ', '.join('?' for _ in noaa_numbers)
+        query = (
+            'SELECT MIN(sunspot_date), MAX(sunspot_date) FROM sunspot_regions '
+            f'WHERE noaa_number IN ({placeholders})'
+        )
+        with self._create_connection() as conn:
+            first, last = conn.execute(query, list(noaa_numbers)).fetchone()
+        if first is None:
+            return None
+        return first, last
+
+    def backfill_region_index(self):
+        """Preenche o índice de manchas com todos os dias já armazenados. Retorna o número de dias."""
+        query = 'SELECT sunspot_date, sunspot_info, sunspot_blob FROM sunspots_data ORDER BY sunspot_date'
+        with self._create_connection() as conn:
+            rows = conn.execute(query).fetchall()
+            for sunspot_date, sunspot_info, sunspot_blob in rows:
+                self._index_regions(conn, sunspot_date, _decode(sunspot_info, sunspot_blob))
+            conn.commit()
+        return len(rows)
+
+    def convert_storage(self, compact: bool):
+        """Converte todos os dias para o formato compacto (ou de volta para JSON) e compacta o arquivo.
+        Retorna o número de dias convertidos."""
+        query = 'SELECT sunspot_date, sunspot_info, sunspot_blob FROM sunspots_data'
+        update = 'UPDATE sunspots_data SET sunspot_info = ?, sunspot_blob = ? WHERE sunspot_date = ?'
+        converted = 0
+        with self._create_connection() as conn:
+            for sunspot_date, sunspot_info, sunspot_blob in conn.execute(query).fetchall():
+                if (sunspot_blob is not None) == compact:
+                    continue
+                new_info, new_blob = _encode(_decode(sunspot_info, sunspot_blob), compact)
+                if (new_blob is not None) == compact:
+                    conn.execute(update, (new_info, new_blob, sunspot_date))
+                    converted += 1
+            conn.commit()
+            conn.execute('VACUUM')
+        return converted
+
+    def update_image_url(self, sunspot_date: str, image_url: str):
+        """Salva a URL do magnetograma para um dia já armazenado."""
+        query = 'UPDATE sunspots_data SET image_url = ? WHERE sunspot_date = ?'
+        with self._create_connection() as conn:
+            conn.execute(query, (image_url, sunspot_date))
+            conn.commit()
+
+    def acquire_lease(self, name: str, owner: str, ttl: float):
+        """Obtém ou renova por `ttl` segundos a tarefa exclusiva `name` para `owner`.
+
+        Retorna True se `owner` a detém: ninguém a detinha, a concessão anterior
+        expirou ou já era dele. Vale entre processos que usam o mesmo banco.
+        """
+        now = time.time()
+        query = (
+            'INSERT INTO leases (name, owner, expires_at) VALUES (?, ?, ?) '
+            'ON CONFLICT (name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at '
+            'WHERE leases.owner = excluded.owner OR leases.expires_at < ?'
+        )
         with self._create_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute(query, (sunspot_date, json_info))
+            cursor = conn.execute(query, (name, owner, now + ttl, now))
+            conn.commit()
+            return cursor.rowcount == 1
+
+    def release_lease(self, name: str, owner: str):
+        """Libera a tarefa `name` se ela pertence a `owner`."""
+        with self._create_connection() as conn:
+            conn.execute('DELETE FROM leases WHERE name = ? AND owner = ?', (name, owner))
             conn.commit()
 
     def close(self):
-        if self.conn:
-            self.conn.close()
+        self.pool.close()
 
     def __enter__(self):
-        self._create_connection()
         return self
 
     def __exit__(self, exc_type, exc_value, traceback):
         self.close()
+
+
+if __name__ == '__main__':
+    # Uso: python sunspots_database_dao.py (migrate | backfill-regions | compact | expand) [arquivo.db]
+    commands = ('migrate', 'backfill-regions', 'compact', 'expand')
+    if len(sys.argv) < 2 or sys.argv[1] not in commands:
+        sys.exit('Uso: python sunspots_database_dao.py (migrate | backfill-regions | compact | expand) [arquivo.db]')
+    dao = SunspotsDatabaseDao(*sys.argv[2:3])
+    dao.migrate()
+    if sys.argv[1] == 'migrate':
+        print(f"Esquema na versão {dao.schema_version}.")
+    elif sys.argv[1] == 'backfill-regions':
+        print(f"{dao.backfill_region_index()} dias indexados.")
+    else:
+        print(f"{dao.convert_storage(sys.argv[1] == 'compact')} dias convertidos.")
@@ -0,0 +1,193 @@
+"""Configuração dos testes: um servidor HTTP local faz o papel do SolarMonitor.
+
+Os módulos da API leem as variáveis SOLAIRE_* na importação, então o servidor
+é iniciado e as variáveis são definidas aqui, antes de qualquer teste importá-los.
+
+Uso (dentro da pasta /app):
+    python -m pytest tests
+"""
+import asyncio
+import datetime
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import cv2
+import numpy as np
+import pytest
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Manchas NOAA do servidor falso: (primeiro dia, último dia) em que aparecem na tabela
+REGIONS = {
+    "12000": ("2020-01-02", "2020-01-09"),
+    "12001": ("2020-01-01", "2020-01-20"),
+}
+# Dias cuja página não traz o magnetograma
+DAYS_WITHOUT_IMAGE = {"2020-01-25"}
+
+
+def _day_page(date):
+    day = datetime.date.fromisoformat(date)
+    rows = []
+    for number, (first, last) in REGIONS.items():
+        if not first <= date <= last:
+            continue
+        # Cada mancha anda 10 graus por dia de leste para oeste
+        longitude = -40 + 10 * (day - datetime.date.fromisoformat(first)).days
+        position = f"N10{'E' if longitude < 0 else 'W'}{abs(longitude):02d}"
+        rows.append(
+            f'<tr class="noaaresults"><td>{number}</td><td>{position} (100",200")</td><td>beta</td>'
+            f'<td>Dso</td><td>120</td><td>4</td><td><a href="#">C1.0</a></td></tr>')
+    compact = date.replace("-", "")
+    image = '' if date in DAYS_WITHOUT_IMAGE else f'<img src="data/{compact}/shmi_maglc_fd_{compact}.jpg">'
+    return (
+        '<html><body><div class="noaat"><table>' + ''.join(rows) + '</table></div>' + image +
+        f'<a href="full_disk.php?date={compact}&type=saia_00193_fd">saia_00193_fd</a>'
+        '</body></html>'
+    ).encode()
+
+
+def _day_image(date):
+    # Fundo branco com o quadro escuro do magnetograma e um ponto que muda de lugar a cada dia
+    image = np.full((240, 240, 3), 255, dtype=np.uint8)
+    cv2.rectangle(image, (20, 20), (219, 219), (0, 0, 0), -1)
+    offset = int(date[-2:]) * 6
+    cv2.circle(image, (30 + offset, 120), 8, (255, 255, 255), -1)
+    return cv2.imencode('.jpg', image)[1].tobytes()
+
+
+class StubSolarMonitor:
+    """Servidor HTTP local com as páginas e magnetogramas de REGIONS.
+
+    `fail(path, statuses)` faz as próximas requisições a `path` responderem com os status
+    informados, em ordem; `requests` registra (caminho, horário) de cada requisição recebida,
+    com a página de cada dia registrada como "/full_disk.php?date=YYYYMMDD".
+    """
+
+    def __init__(self):
+        self.requests = []
+        self._failures = {}
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub._handle(self)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def fail(self, path, statuses):
+        with self._lock:
+            self._failures[path] = list(statuses)
+
+    def fail_day(self, date, statuses):
+        """Como `fail`, mas só para a página do dia `date` (YYYY-MM-DD)."""
+        self.fail(self.day_path(date), statuses)
+
+    @staticmethod
+    def day_path(date):
+        return f"/full_disk.php?date={date.replace('-', '')}"
+
+    def count_day(self, date):
+        return self.count(self.day_path(date))
+
+    def reset(self):
+        with self._lock:
+            self.requests.clear()
+            self._failures.clear()
+
+    def count(self, path):
+        with self._lock:
+            return sum(1 for requested, _ in self.requests if requested == path or requested.startswith(path + "?"))
+
+    def _handle(self, handler):
+        url = urlsplit(handler.path)
+        path = url.path
+        if path == "/full_disk.php":
+            path = f"{path}?date={parse_qs(url.query)['date'][0]}"
+        with self._lock:
+            self.requests.append((path, time.monotonic()))
+            failures = self._failures.get(path) or self._failures.get(url.path)
+            status = failures.pop(0) if failures else 200
+
+        if status != 200:
+            body, content_type = b"error", "text/plain"
+        elif url.path == "/full_disk.php":
+            compact = parse_qs(url.query)["date"][0]
+            body, content_type = _day_page(f"{compact[:4]}-{compact[4:6]}-{compact[6:]}"), "text/html"
+        elif url.path.endswith(".jpg"):
+            compact = url.path.rsplit("_", 1)[1][:8]
+            body, content_type = _day_image(f"{compact[:4]}-{compact[4:6]}-{compact[6:]}"), "image/jpeg"
+        else:
+            status, body, content_type = 404, b"not found", "text/plain"
+
+        handler.send_response(status)
+        handler.send_header("Content-Type", content_type)
+        handler.send_header("Content-Length", str(len(body)))
+        handler.end_headers()
+        handler.wfile.write(body)
+
+
+_stub = StubSolarMonitor()
+_workdir = tempfile.mkdtemp(prefix="solaire-tests-")
+os.environ.update({
+    "SOLAIRE_BASE_URL": _stub.base_url,
+    "SOLAIRE_DB_NAME": os.path.join(_workdir, "sunspots.db"),
+    "SOLAIRE_IMAGE_CACHE_DIR": os.path.join(_workdir, "image_cache"),
+    "SOLAIRE_RENDER_CACHE_DIR": os.path.join(_workdir, "render_cache"),
+    "SOLAIRE_CPU_WORKERS": "0",
+    "SOLAIRE_PREFETCH_INTERVAL": "0",
+    "SOLAIRE_FETCH_BACKOFF": "0.01",
+    "SOLAIRE_FETCH_RATE_LIMIT": "0",
+})
+sys.path.insert(0, APP_DIR)
+
+
+@pytest.fixture(scope="session", autouse=True)
+def database():
+    """Aplica as migrações no banco temporário, como o startup da API faz."""
+    import utils
+    utils.db_dao.migrate()
+    return utils.db_dao
+
+
+@pytest.fixture(scope="session")
+def client():
+    """Cliente da API; o shutdown (que encerra os pools de execução) só roda no fim da sessão."""
+    from fastapi.testclient import TestClient
+    import main
+
+    with TestClient(main.app) as client:
+        yield client
+
+
+@pytest.fixture
+def run():
+    """Executa uma corrotina em um event loop novo e fecha o cliente HTTP criado para ele."""
+    import scrapping
+
+    def run(coroutine):
+        async def wrapper():
+            try:
+                return await coroutine
+            finally:
+                await scrapping.close_async_client()
+        return asyncio.run(wrapper())
+    return run
+
+
+@pytest.fixture
+def stub():
+    _stub.reset()
+    yield _stub
+    _stub.reset()
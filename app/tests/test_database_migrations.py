@@ -0,0 +1,83 @@
+import json
+import os
+import sqlite3
+
+import pytest
+
+import database_migrations
+from sunspots_database_dao import SunspotsDatabaseDao
+
+DAY = [{"noaaNumber": "12000", "latestPositions": [
+    {"position": "N10E40", "x_coordinate": "-40", "y_coordinate": "-10",
+     "longitude": -40, "latitude": -10, "date": "2020-1-2"}]}]
+
+
+def legacy_database(path):
+    """Banco no esquema anterior ao índice único, com dias repetidos."""
+    conn = sqlite3.connect(path)
+    for migration in database_migrations.MIGRATIONS[:3]:
+        migration(conn)
+    conn.execute('PRAGMA user_version = 3')
+    conn.executemany('INSERT INTO sunspots_data (sunspot_date, sunspot_info, image_url) VALUES (?, ?, ?)', [
+        ("2020-01-02", json.dumps([]), "http://example/old.jpg"),
+        ("2020-01-02", json.dumps(DAY), None),
+        ("2020-01-03", json.dumps([]), None),
+    ])
+    conn.commit()
+    conn.close()
+
+
+def test_creating_the_dao_does_not_touch_the_database(tmp_path):
+    path = tmp_path / "sunspots.db"
+
+    dao = SunspotsDatabaseDao(str(path))
+
+    assert not path.exists()
+    assert dao.schema_version is None
+    dao.close()
+
+
+def test_migrate_keeps_the_latest_row_of_each_day_and_adds_a_unique_index(tmp_path):
+    path = str(tmp_path / "sunspots.db")
+    legacy_database(path)
+
+    with SunspotsDatabaseDao(path) as dao:
+        assert dao.migrate() == len(database_migrations.MIGRATIONS)
+
+        assert sorted(dao.fetch_stored_dates()) == ["2020-01-02", "2020-01-03"]
+        # A linha mais recente vence, mas a URL da imagem da duplicata é preservada
+        assert dao.fetch_data_by_dates(["2020-01-02"]) == {"2020-01-02": DAY}
+        assert dao.fetch_image_url_by_date("2020-01-02") == "http://example/old.jpg"
+        # Os dias já salvos entram no índice de manchas
+        assert [row[:2] for row in dao.fetch_region_positions(["12000"])] == [("12000", "2020-01-02")]
+
+    conn = sqlite3.connect(path)
+    with pytest.raises(sqlite3.IntegrityError):
+        conn.execute("INSERT INTO sunspots_data (sunspot_date, sunspot_info) VALUES ('2020-01-03', '[]')")
+    conn.close()
+
+
+def test_migrate_is_idempotent_and_inserts_upsert_by_date(tmp_path):
+    path = str(tmp_path / "sunspots.db")
+
+    with SunspotsDatabaseDao(path) as dao:
+        version = dao.migrate()
+        assert dao.migrate() == version
+        dao.insert_data("2020-01-02", [], "http://example/a.jpg")
+        dao.insert_data("2020-01-02", DAY)
+
+        assert dao.fetch_stored_dates() == ["2020-01-02"]
+        assert dao.fetch_data_by_dates(["2020-01-02"]) == {"2020-01-02": DAY}
+        assert dao.fetch_image_url_by_date("2020-01-02") == "http://example/a.jpg"
+
+
+def test_bundled_database_is_already_migrated():
+    path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                        "sunspots_database_sqlite.db")
+    # Somente leitura: o teste não pode alterar o arquivo versionado
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        assert database_migrations.schema_version(conn) == len(database_migrations.MIGRATIONS)
+        assert conn.execute('SELECT COUNT(*) = COUNT(DISTINCT sunspot_date) FROM sunspots_data').fetchone() == (1,)
+    finally:
+        conn.close()
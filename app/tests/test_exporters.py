@@ -0,0 +1,91 @@
+import io
+import json
+
+import pyarrow.parquet as pq
+import pytest
+from fastapi.testclient import TestClient
+
+import exporters
+import main
+
+
+def position(day, longitude):
+    return {"position": f"N10E{abs(longitude):02d}", "day": day, "x_coordinate": str(longitude),
+            "y_coordinate": "-10", "longitude": longitude, "latitude": -10, "date": "2020-1-2"}
+
+
+# Duas buscas que leram a mesma posição de 12000 em 2020-01-02
+CONTENT = [
+    {"noaaNumber": "12000", "latestPositions": [position("2020-01-03", -30), position("2020-01-02", -40)]},
+    {"noaaNumber": "12001", "latestPositions": [position("2020-01-02", -20)]},
+    {"noaaNumber": "12000", "latestPositions": [position("2020-01-02", -40), position("2020-01-04", -20)]},
+]
+EXPECTED_ROWS = [
+    ("12000", "N10E30", "2020-01-03", "-30", "-10", -30, -10),
+    ("12000", "N10E40", "2020-01-02", "-40", "-10", -40, -10),
+    ("12001", "N10E20", "2020-01-02", "-20", "-10", -20, -10),
+    ("12000", "N10E20", "2020-01-04", "-20", "-10", -20, -10),
+]
+
+
+def test_rows_drop_repeated_positions_and_keep_first_seen_order():
+    assert list(exporters.rows(CONTENT)) == EXPECTED_ROWS
+
+
+def test_batches_keep_the_order_and_the_deduplication_across_chunks():
+    assert list(exporters._batches(CONTENT, size=3)) == [EXPECTED_ROWS[:3], EXPECTED_ROWS[3:]]
+    assert [row for batch in exporters._batches(CONTENT, size=1) for row in batch] == EXPECTED_ROWS
+
+
+@pytest.mark.parametrize("name", ["csv", "txt", "jsonl", "parquet"])
+def test_every_format_has_the_same_rows(name):
+    data = exporters.EXPORTERS[name].to_bytes(CONTENT)
+
+    if name == "csv":
+        rows = [tuple(line.split(",")) for line in data.decode("utf-8").splitlines()[1:]]
+        expected = [tuple(map(str, row)) for row in EXPECTED_ROWS]
+    elif name == "txt":
+        rows = [tuple(line.split()) for line in data.decode("utf-8").splitlines()[1:]]
+        expected = [tuple(map(str, row)) for row in EXPECTED_ROWS]
+    elif name == "jsonl":
+        rows = [tuple(json.loads(line).values()) for line in data.decode("utf-8").splitlines()]
+        expected = EXPECTED_ROWS
+    else:
+        rows = [tuple(row.values()) for row in pq.read_table(io.BytesIO(data)).to_pylist()]
+        expected = EXPECTED_ROWS
+    assert rows == expected
+
+
+def test_parquet_accepts_the_period_index_as_day():
+    # Em /api/v2 o 'day' de cada posição é o índice do dia no período (data_equalizer)
+    content = [{"noaaNumber": "12001", "latestPositions": [position(0, -40), position(1, -30)]}]
+
+    table = pq.read_table(io.BytesIO(exporters.EXPORTERS["parquet"].to_bytes(content)))
+
+    assert table.column("Dia").to_pylist() == ["0", "1"]
+    assert table.column("Longitude").to_pylist() == [-40, -30]
+
+
+def test_period_parquet_export(stub, client):
+    response = client.get("/api/v2/solar-monitor/sunspots/export",
+                          params={"initial_date": "2020-01-01", "final_date": "2020-01-31", "format": "parquet"})
+
+    assert response.status_code == 200
+    table = pq.read_table(io.BytesIO(response.content))
+    assert table.column("Mancha").to_pylist() == ["12001"]
+
+
+def test_export_errors_become_http_errors_before_streaming(stub, client, monkeypatch):
+    def broken(content):
+        raise ValueError("broken exporter")
+        yield b""
+
+    monkeypatch.setattr(exporters.EXPORTERS["parquet"], "chunks", broken)
+    # Sem o contexto, o cliente reaproveita os pools iniciados pela fixture `client`
+    failing_client = TestClient(main.app, raise_server_exceptions=False)
+
+    response = failing_client.get("/api/v2/solar-monitor/sunspots/export",
+                                  params={"initial_date": "2020-01-01", "final_date": "2020-01-31",
+                                          "format": "parquet"})
+
+    assert response.status_code == 500
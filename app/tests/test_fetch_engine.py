@@ -0,0 +1,130 @@
+import csv
+import io
+import json
+import zipfile
+
+import httpx
+import pytest
+
+import scrapping
+import utils
+
+
+def test_fetch_days_async_parses_each_day_from_one_download(stub, run):
+    snapshots = run(scrapping.fetch_days_async(["2020-01-02", "2020-01-03", "2020-01-02"]))
+
+    assert list(snapshots) == ["2020-01-02", "2020-01-03"]
+    numbers = [entry["NOAA Number"] for entry in snapshots["2020-01-03"]["table"]]
+    assert numbers == ["12000", "12001"]
+    assert snapshots["2020-01-03"]["image_url"] == (
+        f"{stub.base_url}/data/20200103/shmi_maglc_fd_20200103.jpg")
+    assert stub.count("/full_disk.php") == 2
+
+
+@pytest.mark.parametrize("statuses", [[429], [503], [500, 502]])
+def test_get_html_async_retries_rate_limited_and_server_errors(stub, run, statuses):
+    stub.fail("/data/20200104/shmi_maglc_fd_20200104.jpg", statuses)
+
+    image = run(scrapping.download_img_bytes_async(
+        f"{stub.base_url}/data/20200104/shmi_maglc_fd_20200104.jpg"))
+
+    assert image[:2] == b"\xff\xd8"
+    assert stub.count("/data/20200104/shmi_maglc_fd_20200104.jpg") == len(statuses) + 1
+
+
+def test_get_html_async_raises_after_the_configured_retries(stub, run):
+    stub.fail("/full_disk.php", [503] * (scrapping.FETCH_RETRIES + 1))
+
+    with pytest.raises(httpx.HTTPStatusError):
+        run(scrapping.get_html_async(scrapping.solar_monitor_url.format("20200105")))
+
+    assert stub.count("/full_disk.php") == scrapping.FETCH_RETRIES + 1
+
+
+@pytest.mark.parametrize("date, statuses", [
+    ("2020-01-06", [503] * (scrapping.FETCH_RETRIES + 1)),
+    ("2020-01-07", [404]),
+])
+def test_error_pages_are_never_saved_as_days_without_sunspots(stub, run, date, statuses):
+    stub.fail("/full_disk.php", statuses)
+
+    with pytest.raises(httpx.HTTPStatusError):
+        run(utils.cache_and_get_solar_monitor_info_from_days_async([date], data_only=True))
+    assert utils.db_dao.fetch_stored_dates(date, date) == []
+
+    # Quando o SolarMonitor volta a responder, o dia é baixado e salvo com as manchas
+    days = run(utils.cache_and_get_solar_monitor_info_from_days_async([date], data_only=True))
+    assert [item["noaaNumber"] for item in days[date][0]] == ["12000", "12001"]
+    assert utils.db_dao.fetch_stored_dates(date, date) == [date]
+
+
+def test_download_images_async_returns_none_for_days_without_an_image_url(stub, run):
+    url = f"{stub.base_url}/data/20200104/shmi_maglc_fd_20200104.jpg"
+
+    images = run(utils.download_images_async([None, url, "not a url"]))
+
+    assert images[0] is None
+    assert images[1][:2] == b"\xff\xd8"
+    assert images[2] is None
+    assert stub.count("/data/20200104/shmi_maglc_fd_20200104.jpg") == 1
+
+
+def test_rate_limiter_spaces_requests_to_the_same_host(stub, run, monkeypatch):
+    monkeypatch.setattr(scrapping, "rate_limiter", scrapping.HostRateLimiter(20))
+
+    run(scrapping.fetch_days_async([f"2020-02-{day:02d}" for day in range(1, 6)]))
+
+    times = sorted(requested_at for _, requested_at in stub.requests)
+    assert len(times) == 5
+    # 20 requisições por segundo: 4 intervalos de 50 ms entre a primeira e a última (com folga
+    # para a variação da rede, medida no servidor)
+    assert times[-1] - times[0] >= 0.18
+
+
+def test_gif_endpoint_streams_one_frame_per_day_of_the_region(stub, client):
+    response = client.get("/api/v1/solar-monitor/sunspots/gif",
+                          params={"date": "2020-01-05", "sunspots": ["12000"]})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "image/gif"
+    assert response.content[:6] == b"GIF89a"
+    assert response.content.endswith(b";")
+    # Um bloco de controle gráfico por quadro: 2020-01-02 a 2020-01-09
+    assert response.content.count(b"\x21\xf9\x04") == 8
+
+
+def test_zip_endpoint_contains_tables_graphs_and_gif(stub, client):
+    response = client.get("/api/v1/solar-monitor/sunspots/zip",
+                          params={"date": "2020-01-05", "sunspots": ["12000"]})
+
+    assert response.status_code == 200
+    archive = zipfile.ZipFile(io.BytesIO(response.content))
+    assert sorted(archive.namelist()) == ["fourier.png", "gif.gif", "grafico.png", "planilha.csv", "tabela.txt"]
+    assert archive.read("gif.gif")[:6] == b"GIF89a"
+    assert archive.read("grafico.png")[:4] == b"\x89PNG"
+    rows = list(csv.reader(io.StringIO(archive.read("planilha.csv").decode("utf-8"))))
+    assert len(rows) == 1 + 8
+    assert {row[2] for row in rows[1:]} == {f"2020-01-{day:02d}" for day in range(2, 10)}
+
+
+def test_export_endpoints(stub, client):
+    response = client.get("/api/v1/solar-monitor/sunspots/export",
+                          params={"date": "2020-01-05", "sunspots": ["12000"], "format": "jsonl"})
+    assert response.status_code == 200
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert sorted(line["Dia"] for line in lines) == [f"2020-01-{day:02d}" for day in range(2, 10)]
+    assert {line["Mancha"] for line in lines} == {"12000"}
+    assert {line["Longitude"] for line in lines} == set(range(-40, 40, 10))
+
+    response = client.get("/api/v2/solar-monitor/sunspots/export",
+                          params={"search_type": "MONTHLY", "initial_date": "2020-01-01",
+                                  "final_date": "2020-01-31", "format": "csv"})
+    assert response.status_code == 200
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    # O período mensal usa o primeiro e o último dia do mês; em 31/01 não há manchas
+    assert [(row["Mancha"], row["Posição"], row["Longitude"], row["Latitude"]) for row in rows] == [
+        ("12001", 'N10E40 (100",200")', "-40", "-10")]
+
+    response = client.get("/api/v2/solar-monitor/sunspots/export",
+                          params={"initial_date": "2020-01-01", "final_date": "2020-01-31", "format": "xlsx"})
+    assert response.status_code == 400
@@ -0,0 +1,44 @@
+import cv2
+import numpy as np
+import pytest
+
+from image_pyramid import image_pyramid
+
+
+def decode(content):
+    return cv2.imdecode(np.frombuffer(content, np.uint8), cv2.IMREAD_COLOR)
+
+
+@pytest.mark.parametrize("params", [{}, {"size": "thumbnail"}, {"size": "medium"}, {"pre_process": True}])
+def test_jpeg_of_a_day_without_image_is_not_found(stub, client, params):
+    response = client.get("/api/v1/solar-monitor/jpeg", params={"date": "2020-01-25", **params})
+
+    assert response.status_code == 404
+
+
+def test_thumbnail_is_served_with_an_etag(stub, client):
+    response = client.get("/api/v1/solar-monitor/jpeg", params={"date": "2020-01-24", "size": "thumbnail"})
+
+    assert response.status_code == 200
+    assert max(decode(response.content).shape[:2]) <= 256
+    cached = client.get("/api/v1/solar-monitor/jpeg", params={"date": "2020-01-24", "size": "thumbnail"},
+                        headers={"If-None-Match": response.headers["ETag"]})
+    assert cached.status_code == 304
+
+
+def test_contact_sheet_draws_a_grey_cell_for_a_day_without_image(stub, client):
+    response = client.get("/api/v1/solar-monitor/contact-sheet",
+                          params={"date": "2020-01-24", "number_of_days": 3, "columns": 3})
+
+    assert response.status_code == 200
+    sheet = decode(response.content)
+    height, width = sheet.shape[0], sheet.shape[1] // 3
+    # Centro de cada célula: o magnetograma falso é escuro no meio; a célula sem imagem é cinza
+    centers = [sheet[height // 2 - 20:height // 2, column * width + 20:column * width + 60]
+               for column in range(3)]
+    assert np.abs(centers[1].astype(int) - 64).max() <= 8
+    assert centers[0].mean() < 32 and centers[2].mean() < 32
+
+
+def test_pyramid_returns_nothing_for_a_missing_image(run):
+    assert run(image_pyramid.get("2020-01-25", None, "thumbnail")) == (None, None)
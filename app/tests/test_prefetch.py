@@ -0,0 +1,79 @@
+import datetime
+import time
+
+import pytest
+
+import prefetch
+import scrapping
+import utils
+from prefetch import PREFETCH_LEASE, PrefetchScheduler
+from sunspots_database_dao import SunspotsDatabaseDao
+
+
+@pytest.fixture
+def scheduler():
+    # Só o dia de hoje na janela recente; o backfill começa logo abaixo do cursor definido em cada teste
+    return PrefetchScheduler(interval=60, days=1, backfill_per_cycle=3, backfill_start="2020-03-01")
+
+
+def test_backfill_cursor_walks_down_once_and_skips_stored_days(scheduler):
+    scheduler.backfill_per_cycle = 2
+    scheduler.backfill_start = "2020-04-01"
+    utils.db_dao.insert_data("2020-04-03", [])
+
+    assert scheduler._next_backfill("2020-04-06") == ["2020-04-05", "2020-04-04"]
+    assert scheduler._next_backfill("2020-04-06") == ["2020-04-02", "2020-04-01"]
+    # O histórico já foi percorrido: nenhum dia é consultado de novo
+    assert scheduler._next_backfill("2020-04-06") == []
+    assert scheduler.stats()["backfill"]["cursor"] == "2020-03-31"
+
+
+def test_backfill_retries_a_day_that_failed_upstream_instead_of_storing_it(scheduler, stub, run, monkeypatch):
+    scheduler._cursor = datetime.date(2020, 3, 3)
+    stub.fail_day("2020-03-02", [503] * (scrapping.FETCH_RETRIES + 1))
+
+    run(scheduler.run_cycle())
+
+    assert utils.db_dao.fetch_stored_dates("2020-03-01", "2020-03-03") == ["2020-03-01", "2020-03-03"]
+    attempts, retry_at = scheduler._failed["2020-03-02"]
+    assert attempts == 1
+    assert retry_at - time.time() == pytest.approx(prefetch.BACKFILL_RETRY_DELAY, abs=60)
+
+    # Antes da espera acabar o dia não é pedido de novo
+    requests = stub.count_day("2020-03-02")
+    run(scheduler.run_cycle())
+    assert stub.count_day("2020-03-02") == requests
+
+    # Uma nova falha dobra a espera
+    scheduler._failed["2020-03-02"] = (attempts, 0)
+    stub.fail_day("2020-03-02", [503] * (scrapping.FETCH_RETRIES + 1))
+    run(scheduler.run_cycle())
+    attempts, retry_at = scheduler._failed["2020-03-02"]
+    assert attempts == 2
+    assert retry_at - time.time() == pytest.approx(2 * prefetch.BACKFILL_RETRY_DELAY, abs=60)
+    assert utils.db_dao.fetch_stored_dates("2020-03-02", "2020-03-02") == []
+
+    # Quando o SolarMonitor volta, o dia é salvo com as manchas e sai da lista de falhas
+    scheduler._failed["2020-03-02"] = (attempts, 0)
+    run(scheduler.run_cycle())
+    assert scheduler._failed == {}
+    assert utils.db_dao.fetch_stored_dates("2020-03-02", "2020-03-02") == ["2020-03-02"]
+    assert scheduler.backfilled == 3
+
+
+def test_lease_has_a_single_owner_until_it_expires_or_is_released(database, scheduler):
+    other = PrefetchScheduler(interval=60)
+    with SunspotsDatabaseDao(database.db_name) as other_process:
+        assert database.acquire_lease(PREFETCH_LEASE, scheduler.owner, 60)
+        assert not other_process.acquire_lease(PREFETCH_LEASE, other.owner, 60)
+        # O dono renova a própria concessão
+        assert database.acquire_lease(PREFETCH_LEASE, scheduler.owner, -1)
+        # Expirada, outro processo assume
+        assert other_process.acquire_lease(PREFETCH_LEASE, other.owner, 60)
+        assert not database.acquire_lease(PREFETCH_LEASE, scheduler.owner, 60)
+
+        other.leader = True
+        other.shutdown()
+        assert not other.leader
+        assert database.acquire_lease(PREFETCH_LEASE, scheduler.owner, 60)
+    database.release_lease(PREFETCH_LEASE, scheduler.owner)
@@ -0,0 +1,105 @@
+import os
+import threading
+
+import utils
+from render_cache import RenderCache, make_key
+
+
+def test_async_cache_reads_and_writes_run_off_the_event_loop(tmp_path, run):
+    cache = RenderCache(str(tmp_path))
+    threads = []
+    get, put = cache.get, cache.put
+    cache.get = lambda key: threads.append(threading.current_thread()) or get(key)
+    cache.put = lambda key, data: threads.append(threading.current_thread()) or put(key, data)
+
+    async def render():
+        return b"graphic"
+
+    assert run(cache.get_or_render_async("key", render)) == b"graphic"
+    assert run(cache.get_or_render_async("key", render)) == b"graphic"
+
+    assert len(threads) == 3
+    assert threading.main_thread() not in threads
+
+
+def test_memory_evicts_the_least_recently_used_and_falls_back_to_disk(tmp_path):
+    cache = RenderCache(str(tmp_path), memory_bytes=10)
+    cache.put("a", b"aaaa")
+    cache.put("b", b"bbbb")
+    assert cache.get("a") == b"aaaa"
+    cache.put("c", b"cccc")
+
+    # "b" era o menos usado: saiu da memória, mas continua no disco
+    assert list(cache._memory) == ["a", "c"]
+    assert cache.get("b") == b"bbbb"
+    assert cache.stats()["disk_hits"] == 1
+
+
+def test_entries_larger_than_the_memory_limit_go_only_to_disk(tmp_path):
+    cache = RenderCache(str(tmp_path), memory_bytes=4)
+    cache.put("big", b"too large")
+
+    assert cache.stats()["memory_entries"] == 0
+    assert cache.get("big") == b"too large"
+
+
+def test_disk_evicts_the_least_recently_used_files(tmp_path):
+    cache = RenderCache(str(tmp_path), memory_bytes=0, disk_bytes=10)
+    cache.put("a", b"aaaa")
+    cache.put("b", b"bbbb")
+    assert cache.get("a") == b"aaaa"
+    cache.put("c", b"cccc")
+
+    assert sorted(os.listdir(tmp_path)) == ["a", "c"]
+    assert cache.get("b") is None
+    assert cache.stats()["disk_bytes"] == 8
+
+
+def test_disk_entries_survive_a_new_instance(tmp_path):
+    RenderCache(str(tmp_path)).put("key", b"graphic")
+
+    cache = RenderCache(str(tmp_path))
+
+    assert cache.get("key") == b"graphic"
+    assert cache.stats()["disk_hits"] == 1
+
+
+def test_key_ignores_list_order_and_follows_the_data_version():
+    key = make_key("sunspots", {"sunspots": ["12001", "12000"]}, "1:10")
+
+    assert key == make_key("sunspots", {"sunspots": ["12000", "12001", "12000"]}, "1:10")
+    assert key != make_key("sunspots", {"sunspots": ["12000", "12001"]}, "1:11")
+    assert key != make_key("sunspots-amount", {"sunspots": ["12000", "12001"]}, "1:10")
+
+
+AMOUNT = "/api/v1/solar-monitor/sunspots-amount"
+PERIOD = {"search_type": "MONTHLY", "initial_date": "2020-01-01", "final_date": "2020-01-31"}
+
+
+def test_closed_period_graphic_is_revalidated_without_loading_the_period(stub, client, monkeypatch):
+    response = client.get(AMOUNT, params=PERIOD)
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+
+    async def unexpected(*args, **kwargs):
+        raise AssertionError("o período não deveria ser carregado")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(utils, "get_period_series_async", unexpected)
+        cached = client.get(AMOUNT, params=PERIOD, headers={"If-None-Match": etag})
+        weak = client.get(AMOUNT, params=PERIOD, headers={"If-None-Match": f'"other", W/{etag}'})
+
+    assert (cached.status_code, cached.content, cached.headers["ETag"]) == (304, b"", etag)
+    assert weak.status_code == 304
+
+
+def test_etag_changes_when_a_day_of_the_period_is_saved_again(stub, client):
+    etag = client.get(AMOUNT, params=PERIOD).headers["ETag"]
+
+    stored = utils.db_dao.fetch_stored_dates("2020-01-01", "2020-01-31")[0]
+    utils.db_dao.insert_data(stored, utils.db_dao.fetch_data_by_dates([stored])[stored])
+    response = client.get(AMOUNT, params=PERIOD, headers={"If-None-Match": etag})
+
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    assert response.content
@@ -0,0 +1,14 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import lazy_imports
+
+
+def test_cpu_workers_start_with_the_graphics_stack_loaded():
+    # Mesmo inicializador do pool de executors.cpu_executor
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"),
+                             initializer=lazy_imports.preload_worker) as pool:
+        report = pool.submit(lazy_imports.startup_report).result()
+
+    assert {"matplotlib.pyplot", "scipy.optimize", "cv2"} <= set(report["loaded"])
+    assert "easyocr" in report["not_loaded"]
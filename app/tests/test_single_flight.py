@@ -0,0 +1,100 @@
+import asyncio
+
+import pytest
+
+import utils
+from single_flight import SingleFlight
+
+
+def test_concurrent_calls_with_the_same_key_share_one_execution():
+    flight = SingleFlight("test")
+    calls = []
+
+    async def work(key):
+        calls.append(key)
+        await asyncio.sleep(0.01)
+        return key.upper()
+
+    async def main():
+        return await asyncio.gather(*(flight.do(key, lambda key=key: work(key)) for key in "aaab"))
+
+    assert asyncio.run(main()) == ["A", "A", "A", "B"]
+    assert sorted(calls) == ["a", "b"]
+    assert flight.stats() == {"leaders": 2, "followers": 2, "in_flight": 0}
+
+
+def test_followers_receive_the_same_exception_and_nothing_is_remembered():
+    flight = SingleFlight("test")
+    calls = []
+
+    async def fail():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        raise ValueError("upstream")
+
+    async def main():
+        results = await asyncio.gather(flight.do("key", fail), flight.do("key", fail), return_exceptions=True)
+        # Depois de terminar, a chave é executada de novo
+        with pytest.raises(ValueError):
+            await flight.do("key", fail)
+        return results
+
+    results = asyncio.run(main())
+    assert [type(result) for result in results] == [ValueError, ValueError]
+    assert len(calls) == 2
+
+
+def test_cancelling_one_caller_does_not_cancel_the_work_for_the_others():
+    flight = SingleFlight("test")
+
+    async def work():
+        await asyncio.sleep(0.05)
+        return "done"
+
+    async def main():
+        first = asyncio.ensure_future(flight.do("key", work))
+        second = asyncio.ensure_future(flight.do("key", work))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        return await second, first.cancelled()
+
+    assert asyncio.run(main()) == ("done", True)
+
+
+def test_concurrent_requests_for_a_new_day_download_and_save_it_once(stub, run, monkeypatch):
+    saved = []
+    save = utils._save_snapshots
+    monkeypatch.setattr(utils, "_save_snapshots", lambda snapshots, json_by_date: saved.append(list(snapshots))
+                        or save(snapshots, json_by_date))
+
+    assert utils.db_dao.fetch_stored_dates("2020-05-12", "2020-05-12") == []
+
+    async def main():
+        return await asyncio.gather(*(
+            utils.cache_and_get_solar_monitor_info_from_days_async(["2020-05-12"], data_only=True)
+            for _ in range(5)))
+
+    results = run(main())
+
+    assert stub.count_day("2020-05-12") == 1
+    assert saved == [["2020-05-12"]]
+    assert all(result == results[0] for result in results)
+
+
+@pytest.mark.parametrize("key, flight_key", [("cached", None), (None, "http://test/graphic")])
+def test_concurrent_requests_for_a_graphic_render_it_once(tmp_path, key, flight_key):
+    from render_cache import RenderCache
+
+    cache = RenderCache(str(tmp_path))
+    renders = []
+
+    async def render():
+        renders.append(1)
+        await asyncio.sleep(0.01)
+        return b"png"
+
+    async def main():
+        return await asyncio.gather(*(cache.get_or_render_async(key, render, flight_key) for _ in range(4)))
+
+    assert asyncio.run(main()) == [b"png"] * 4
+    assert len(renders) == 1
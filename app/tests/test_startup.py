@@ -0,0 +1,35 @@
+import os
+import subprocess
+import sys
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_importing_the_api_writes_nothing(tmp_path):
+    env = {**os.environ,
+           "SOLAIRE_DB_NAME": str(tmp_path / "sunspots.db"),
+           "SOLAIRE_IMAGE_CACHE_DIR": str(tmp_path / "image_cache"),
+           "SOLAIRE_RENDER_CACHE_DIR": str(tmp_path / "render_cache")}
+    env.pop("SOLAIRE_OCR_CACHE_DB", None)
+
+    subprocess.run([sys.executable, "-c", "import main"], cwd=APP_DIR, env=env, check=True)
+
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_caches_are_created_on_first_use(tmp_path):
+    from image_cache import ImageCache
+    from ocr_service import OcrService
+    from render_cache import RenderCache
+
+    image_cache = ImageCache(str(tmp_path / "image_cache"))
+    ocr = OcrService(workers=0, db_name=str(tmp_path / "ocr" / "ocr.db"))
+    render_cache = RenderCache(str(tmp_path / "render_cache"))
+    assert list(tmp_path.iterdir()) == []
+
+    image_cache.put("2020-01-02", "shmi_maglc", b"jpeg")
+    assert image_cache.get("2020-01-02", "shmi_maglc") == b"jpeg"
+    assert ocr._fetch(["missing"]) == {}
+    render_cache.put("key", b"png")
+    assert RenderCache(str(tmp_path / "render_cache")).get("key") == b"png"
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["image_cache", "ocr", "render_cache"]
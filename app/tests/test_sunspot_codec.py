@@ -0,0 +1,92 @@
+import json
+import os
+import sqlite3
+
+import pytest
+
+import sunspot_codec
+from sunspots_database_dao import SunspotsDatabaseDao
+
+
+def position(**fields):
+    pos = {"position": 'N10E40 (100",200")', "day": "2020-01-02", "x_coordinate": "-40", "y_coordinate": "-10",
+           "longitude": -40, "latitude": -10, "date": "2020-01-02"}
+    pos.update(fields)
+    return pos
+
+
+CLASSES = {"hale_class": "beta-gamma", "mcintosh_class": "Dso", "area": 120, "spots": 4}
+
+DAYS = {
+    "empty": [],
+    "without classes": [{"noaaNumber": "12000", "latestPositions": [position()]}],
+    "with classes": [{"noaaNumber": "12000", "latestPositions": [position(**CLASSES)]}],
+    "missing classes": [{"noaaNumber": "12000", "latestPositions": [
+        position(hale_class=None, mcintosh_class=None, area=None, spots=None)]}],
+    "negative zero": [{"noaaNumber": "12000", "latestPositions": [
+        position(x_coordinate="-00", y_coordinate="-00", longitude=0, latitude=0)]}],
+    "leading zeros and several regions": [
+        {"noaaNumber": "09876", "latestPositions": [position(), position(day="2020-01-03", date="2020-01-01")]},
+        {"noaaNumber": "12001", "latestPositions": [position(position="S05W12", x_coordinate="12",
+                                                             y_coordinate="05", longitude=12, latitude=5)]},
+    ],
+}
+
+
+@pytest.mark.parametrize("day", DAYS.values(), ids=DAYS.keys())
+def test_round_trip_is_exact(day):
+    blob = sunspot_codec.encode_day(day)
+
+    assert blob is not None
+    assert sunspot_codec.decode_day(blob) == day
+    assert len(blob) < len(json.dumps(day)) or day == []
+
+
+@pytest.mark.parametrize("day", [
+    [{"noaaNumber": "12000", "latestPositions": [position(hale_class="unknown", mcintosh_class="Dso",
+                                                          area=1, spots=1)]}],
+    [{"noaaNumber": "12000", "latestPositions": [position(longitude=40000)]}],
+    [{"noaaNumber": "12000", "latestPositions": [position(x_coordinate="-4")]}],
+    [{"noaaNumber": "12000", "latestPositions": [position(day="2020-1-2")]}],
+    [{"noaaNumber": "AR1", "latestPositions": []}],
+])
+def test_records_the_format_cannot_represent_stay_as_json(day):
+    assert sunspot_codec.encode_day(day) is None
+
+
+def test_decode_rejects_other_data():
+    with pytest.raises(ValueError):
+        sunspot_codec.decode_day(b"XX\x01\x00\x00")
+
+
+def test_every_bundled_day_round_trips_or_stays_json():
+    path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                        "sunspots_database_sqlite.db")
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        rows = conn.execute("SELECT sunspot_info FROM sunspots_data WHERE sunspot_info IS NOT NULL").fetchall()
+    finally:
+        conn.close()
+
+    encoded = 0
+    for (sunspot_info,) in rows:
+        day = json.loads(sunspot_info)
+        blob = sunspot_codec.encode_day(day)
+        if blob is not None:
+            assert sunspot_codec.decode_day(blob) == day
+            encoded += 1
+    assert encoded > 0
+
+
+def test_dao_converts_between_json_and_compact_storage(tmp_path):
+    day = DAYS["with classes"]
+    with SunspotsDatabaseDao(str(tmp_path / "sunspots.db"), compact=True) as dao:
+        dao.migrate()
+        dao.insert_data("2020-01-02", day)
+        assert dao.fetch_data_by_dates(["2020-01-02"]) == {"2020-01-02": day}
+
+        assert dao.convert_storage(compact=False) == 1
+        assert dao.fetch_data_by_dates(["2020-01-02"]) == {"2020-01-02": day}
+        assert dao.convert_storage(compact=True) == 1
+        assert dao.convert_storage(compact=True) == 0
+        assert dao.fetch_data_by_dates(["2020-01-02"]) == {"2020-01-02": day}
@@ -3,17 +3,32 @@ import scrapping
 import json
 from fastapi import HTTPException
 import calendar
+import copy
 import json
 import scrapping
-from image_utils import image_encode
-import io
-import csv
-import tempfile
-from tabulate import tabulate
 import pytz
 from sunspots_database_dao import SunspotsDatabaseDao
-import requests
+from image_cache import ImageCache
+from render_cache import RenderCache, make_key
+from sunspot_store import SunspotObservationStore
+from single_flight import SingleFlight
+import httpx
+import os
+import time
+import executors
+import exporters
 db_dao = SunspotsDatabaseDao()
+image_cache = ImageCache()
+sunspot_store = SunspotObservationStore(db_dao)
+render_cache = RenderCache()
+day_flight = SingleFlight("days")
+
+# Quantidade de dias buscados em paralelo a cada passo do backtracking
+BACKTRACKING_WINDOW = int(os.environ.get("SOLAIRE_BACKTRACKING_WINDOW", 7))
+# Limite para o salto sugerido pelo índice de tempo de vida das manchas
+MAX_REGION_LIFETIME_DAYS = 31
+# Segundos em que os dados salvos de hoje e de ontem (ainda incompletos no SolarMonitor) valem
+RECENT_DAYS_TTL = int(os.environ.get("SOLAIRE_RECENT_DAYS_TTL", 3600))
 
 
 def date_sanity_check(date_obj):
@@ -26,99 +41,165 @@ def date_sanity_check(date_obj):
     return date_obj
 
 
-def sunspot_backtracking(initial_date, sunspots):
-    content, _ = cache_and_get_solar_monitor_info_from_day(initial_date, data_only=True)
-    right_half = get_negative_days_arr(initial_date, 0)
-    left_half = get_positive_days_arr(initial_date, 0)
-    full_content = {}
+def is_closed_period(final_date):
+    """Indica se um período que termina em `final_date` já acabou (antes de hoje em São Paulo)."""
+    tz = pytz.timezone('America/Sao_Paulo')
+    final_date = datetime.datetime.strptime(final_date, "%Y-%m-%d").date()
+    return final_date < datetime.datetime.now(tz).date()
+
 
-    while True:
-        matching_content = is_sunspot_on(sunspots, content)
-        full_content[right_half] = matching_content
-        if matching_content == []:
-            right_half = get_positive_days_arr(right_half, 1)
-            break
-        right_half = get_negative_days_arr(right_half, 1)
-        content, _ = cache_and_get_solar_monitor_info_from_day(right_half, data_only=True)
-
-    content, _ = cache_and_get_solar_monitor_info_from_day(
-        initial_date, data_only=True)  # Reinicia o conteúdo para a data inicial
-
-    while True:
-        matching_content = is_sunspot_on(sunspots, content)
-        full_content[left_half] = matching_content
-        if matching_content == []:
-            left_half = get_negative_days_arr(left_half, 1)
-            break
-        left_half = get_positive_days_arr(left_half, 1)
-        if date_sanity_check(left_half) is None:
-            left_half = get_negative_days_arr(left_half, 1)
-            break
-        content, _ = cache_and_get_solar_monitor_info_from_day(left_half, data_only=True)
+def recent_dates():
+    """Ontem e hoje (em São Paulo): os dias cujos dados ainda podem mudar."""
+    today = datetime.datetime.now(pytz.timezone('America/Sao_Paulo')).date()
+    return [str(today - datetime.timedelta(days=1)), str(today)]
+
+
+def graphic_cache_key(endpoint, params, first_date, last_date):
+    """Chave do gráfico no cache de renderização, ou None quando o período inclui hoje
+    (os dados do dia ainda podem mudar)."""
+    if not is_closed_period(last_date):
+        return None
+    return make_key(endpoint, params, db_dao.data_version(first_date, last_date))
+
+
+def _backtracking_window(initial_date, known_bound, window):
+    # Salta direto para o limite conhecido (mais o dia de fronteira) quando o índice o conhece
+    if known_bound is None:
+        return window
+    span = abs(how_many_days_between(initial_date, known_bound)) + 1
+    return max(window, min(span, MAX_REGION_LIFETIME_DAYS))
+
+
+async def sunspot_backtracking_async(initial_date, sunspots, window=BACKTRACKING_WINDOW):
+    """Encontra o intervalo contínuo de dias em que alguma das manchas aparece.
+
+    Os dias vizinhos são buscados em janelas de `window` dias, em paralelo, nas
+    duas direções; a busca para no primeiro dia sem nenhuma das manchas e o
+    restante da janela é descartado.
+    """
+    days_content = await cache_and_get_solar_monitor_info_from_days_async([initial_date], data_only=True)
+    initial_matching = is_sunspot_on(sunspots, days_content[initial_date][0])
+    if initial_matching:
+        indexed = await executors.run_io(_indexed_backtracking, initial_date, sunspots, initial_matching)
+        if indexed is not None:
+            return indexed
+    known_bounds = await executors.run_io(db_dao.fetch_region_bounds, sunspots) if initial_matching else None
+    search = _backtracking_search(initial_date, sunspots, initial_matching, known_bounds, window)
+    try:
+        days = next(search)
+        while True:
+            days = search.send(await cache_and_get_solar_monitor_info_from_days_async(days, data_only=True))
+    except StopIteration as result:
+        return result.value
+
+
+def _indexed_backtracking(initial_date, sunspots, initial_matching):
+    """Resolve o backtracking com uma consulta ao índice sunspot_regions, sem carregar os dias.
+
+    Só responde quando todos os dias percorridos estão no banco e nenhum deles é
+    hoje ou ontem (que podem ter expirado); caso contrário retorna None e a busca
+    por janelas é usada. As posições montadas a partir do índice trazem os campos
+    usados pelos gráficos e exportações, mas não as classes, área e número de manchas.
+    """
+    by_date = {}
+    for noaa_number, sunspot_date, position, x_coordinate, y_coordinate, longitude, latitude, observed_date \
+            in db_dao.fetch_region_positions(sunspots):
+        items = by_date.setdefault(sunspot_date, {})
+        item = items.setdefault(noaa_number, {'noaaNumber': noaa_number, 'latestPositions': []})
+        item['latestPositions'].append({'position': position,
+                                        'day': sunspot_date,
+                                        'x_coordinate': x_coordinate,
+                                        'y_coordinate': y_coordinate,
+                                        'longitude': longitude,
+                                        'latitude': latitude,
+                                        'date': observed_date})
+    if not by_date:
+        return None
+    stored = set(db_dao.fetch_stored_dates(get_negative_days_arr(min(by_date), 1),
+                                           get_positive_days_arr(max(by_date), 1)))
+    unsafe = set(recent_dates())
+
+    def walk(next_day):
+        # Percorre os dias até o primeiro sem nenhuma das manchas; None se algum não estiver no banco
+        current = initial_date
+        while True:
+            day = next_day(current, 1)
+            if date_sanity_check(day) is None:
+                return current, None
+            if day not in stored or day in unsafe:
+                return None
+            matching = list(by_date.get(day, {}).values())
+            full_content[day] = matching
+            if not matching:
+                return current, day
+            current = day
+
+    full_content = {initial_date: initial_matching}
+    backward = walk(get_negative_days_arr)
+    forward = backward and walk(get_positive_days_arr)
+    if forward is None:
+        return None
+    return backward[0], forward[0], full_content
+
+
+def _backtracking_search(initial_date, sunspots, initial_matching, known_bounds, window):
+    """Gerador com a lógica do backtracking: produz as janelas de dias a buscar, recebe
+    {data: (json, imagem)} de cada uma e retorna (primeiro dia, último dia, conteúdo)."""
+    full_content = {initial_date: initial_matching}
+
+    right_half = get_positive_days_arr(initial_date, 1)
+    if initial_matching != []:
+        step = _backtracking_window(initial_date, known_bounds and known_bounds[0], window)
+        current = initial_date
+        done = False
+        while not done:
+            days = [get_negative_days_arr(current, i) for i in range(1, step + 1)]
+            batch = yield days
+            for day in days:
+                matching_content = is_sunspot_on(sunspots, batch[day][0])
+                full_content[day] = matching_content
+                if matching_content == []:
+                    right_half = get_positive_days_arr(day, 1)
+                    done = True
+                    break
+            current = days[-1]
+            step = window
+
+    left_half = get_negative_days_arr(initial_date, 1)
+    if initial_matching != []:
+        step = _backtracking_window(initial_date, known_bounds and known_bounds[1], window)
+        current = initial_date
+        done = False
+        while not done:
+            days = []
+            for i in range(1, step + 1):
+                day = get_positive_days_arr(current, i)
+                if date_sanity_check(day) is None:
+                    break
+                days.append(day)
+            if not days:
+                left_half = current
+                break
+            batch = yield days
+            for day in days:
+                matching_content = is_sunspot_on(sunspots, batch[day][0])
+                full_content[day] = matching_content
+                if matching_content == []:
+                    left_half = get_negative_days_arr(day, 1)
+                    done = True
+                    break
+            current = days[-1]
+            step = window
 
     return right_half, left_half, full_content
 
 
 def create_text_table(content, bytes_io):
-    with tempfile.NamedTemporaryFile(delete=False) as temp_file:
-        # Prepare the data for tabulate
-        table_data = []
-        for item in content:
-            noaa_number = item['noaaNumber']
-            positions = item['latestPositions']
-            for pos in positions:
-                position = pos['position']
-                day = pos['day']
-                x_coordinate = pos['x_coordinate']
-                y_coordinate = pos['y_coordinate']
-                longitude = pos['longitude']
-                latitude = pos['latitude']
-                if ([noaa_number, position, day, x_coordinate, y_coordinate, longitude, latitude]) not in table_data:
-                    table_data.append(
-                        [noaa_number, position, day, x_coordinate, y_coordinate, longitude, latitude])
-
-        # Generate the table using tabulate
-        table = tabulate(table_data, headers=[
-                         "Mancha", "Posição", "Dia", "Coordenada X", "Coordenada Y", "Longitude", "Latitude"], tablefmt="plain")
-
-        # Write the formatted table to the temporary file
-        with open(temp_file.name, 'w', encoding='utf-8') as f:
-            f.write(table)
-
-        # Copy the content to BytesIO
-        with open(temp_file.name, 'rb') as file:
-            bytes_io.write(file.read())
+    exporters.EXPORTERS['txt'].write(content, bytes_io)
 
 
 def create_csv(full_content, bytes_io):
-    with tempfile.NamedTemporaryFile(delete=False) as temp_file:
-        with io.TextIOWrapper(temp_file, newline='', write_through=True) as csv_file:
-            # Set CSV file headers
-            fieldnames = ['Mancha', 'Posição', 'Dia', 'Coordenada X',
-                          'Coordenada Y', 'Longitude', 'Latitude']
-            writer = csv.DictWriter(csv_file, fieldnames=fieldnames)
-
-            # Write headers to the CSV file
-            writer.writeheader()
-
-            # Iterate over the data and write each line to the CSV file
-            for item in full_content:
-                noaa_number = item['noaaNumber']
-                positions = item['latestPositions']
-                for pos in positions:
-                    writer.writerow({
-                        'Mancha': noaa_number,
-                        'Posição': pos['position'],
-                        'Dia': pos['day'],
-                        'Coordenada X': pos['x_coordinate'],
-                        'Coordenada Y': pos['y_coordinate'],
-                        'Longitude': pos['longitude'],
-                        'Latitude': pos['latitude']
-                    })
-
-        # Copy the content to BytesIO
-        with open(temp_file.name, 'rb') as file:
-            bytes_io.write(file.read())
+    exporters.EXPORTERS['csv'].write(full_content, bytes_io)
 
 
 def is_sunspot_on(sunspots, table_contents):
@@ -128,47 +209,155 @@ def is_sunspot_on(sunspots, table_contents):
         item for item in table_contents if item['noaaNumber'] in sunspots]
     return table_contents
 
-def download_images(images, days_arr):
-    downloaded_images = []
-    
-    for image in images:
+
+async def download_images_async(images):
+    """Baixa as imagens em paralelo; dias sem URL de imagem (None) ou com URL inválida recebem None."""
+    async def download(image):
         try:
-            downloaded_image = scrapping.download_img(image)
-            downloaded_images.append(downloaded_image)
-        except requests.exceptions.MissingSchema or ValueError:
-            downloaded_images.append(None)
-    
-    return downloaded_images
-
-
-def cache_and_get_solar_monitor_info_from_day(date, data_only = False):
-    json_data = db_dao.fetch_data_by_date(date)
-    # Convert date to appropriate format
-    formatted_date = datetime.datetime.strptime(date, "%Y-%m-%d")
-    # Return cached data if both JSON and image are present
-    if json_data is None:
-        # Fetch new solar monitor information
-        solar_monitor_info = get_solar_monitor_info([date])
-        table_contents_aux = convert_table_contents_to_json(solar_monitor_info)
+            return await scrapping.download_img_bytes_async(image)
+        except (httpx.InvalidURL, httpx.UnsupportedProtocol):
+            return None
+
+    urls = [image for image in images if image is not None]
+    downloaded_images = await scrapping.gather_concurrently(download, urls)
+    return [downloaded_images[image] if image is not None else None for image in images]
+
+
+def _expired_dates(dates, json_by_date, max_age):
+    """Dias recentes já salvos há mais de `max_age` segundos, que devem ser baixados de novo."""
+    recent = [date for date in recent_dates() if date in json_by_date and json_by_date[date] is not None]
+    if not recent:
+        return set()
+    now = time.time()
+    return {date for date, updated_at in db_dao.fetch_updated_at(recent).items()
+            if updated_at is None or now - updated_at > max_age}
+
+
+def _unique_dates(dates):
+    # Validate the date format before doing any I/O
+    for date in dates:
+        datetime.datetime.strptime(date, "%Y-%m-%d")
+    return list(dict.fromkeys(dates))
+
+
+def _save_snapshots(snapshots, json_by_date):
+    """Converte as páginas baixadas em JSON, salva no banco e retorna {data: URL da imagem}."""
+    image_urls = {}
+    new_rows = []
+    for date, snapshot in snapshots.items():
+        image_urls[date] = snapshot['image_url']
         json_data = []
-        process_positions(table_contents_aux, json_data, [date])
+        process_positions([snapshot['table']], json_data, [date])
+        new_rows.append((date, json_data, snapshot['image_url']))
+        json_by_date[date] = json_data
+
+    # Save data to the database together with the image URL
+    db_dao.insert_many(new_rows)
+    sunspot_store.update({date: json_data for date, json_data, _ in new_rows})
+    return image_urls
+
+
+def _cached_images(dates, image_urls, expired=()):
+    """Retorna {data: JPEG} do cache de imagens e completa `image_urls` com as URLs salvas no banco.
+
+    A imagem dos dias em `expired` que acabaram de ser baixados de novo é ignorada, para buscar a atual.
+    """
+    # Return the original JPEG bytes from the image cache when available
+    images = {}
+    for date in dates:
+        if date in expired and date in image_urls:
+            continue
+        image = image_cache.get(date, scrapping.image_type)
+        if image is not None:
+            images[date] = image
+        elif date not in image_urls:
+            # Reuse the stored image URL so the page is not scraped again
+            image_urls[date] = db_dao.fetch_image_url_by_date(date)
+    return images
+
+
+def _save_image_urls(snapshots, image_urls):
+    for date, snapshot in snapshots.items():
+        image_urls[date] = snapshot['image_url']
+        if snapshot['image_url'] is not None:
+            db_dao.update_image_url(date, snapshot['image_url'])
+
+
+def _cache_images(dates, downloaded, images):
+    for date, image in zip(dates, downloaded):
+        if image is not None:
+            image_cache.put(date, scrapping.image_type, image)
+            images[date] = image
+
+
+async def _fetch_day_async(date):
+    """Baixa e salva um dia; chamadas simultâneas para o mesmo dia (de requisições diferentes)
+    compartilham a mesma busca e gravação. Retorna (json, URL da imagem)."""
+    async def fetch():
+        snapshot = await scrapping.get_day_snapshot_async(*date.split("-"))
+        json_by_date = {}
+        image_urls = await executors.run_io(_save_snapshots, {date: snapshot}, json_by_date)
+        return json_by_date[date], image_urls[date]
+
+    return await day_flight.do(date, fetch)
+
+
+async def cache_and_get_solar_monitor_info_from_days_async(dates, data_only = False, max_age = RECENT_DAYS_TTL):
+    """Busca vários dias de uma vez, retornando {data: (json, imagem)}.
+
+    Os dias ausentes do banco e as imagens que não estão no cache são baixados
+    em paralelo pelo cliente httpx; o acesso ao banco e aos caches roda no pool
+    de threads de I/O. Hoje e ontem são baixados de novo quando foram salvos há
+    mais de `max_age` segundos.
+    """
+    dates = _unique_dates(dates)
+
+    stored = await executors.run_io(db_dao.fetch_data_by_dates, dates)
+    json_by_date = {date: stored.get(date) for date in dates}
+    expired = await executors.run_io(_expired_dates, dates, json_by_date, max_age)
+
+    missing = [date for date in dates if json_by_date[date] is None or date in expired]
+    fetched = await scrapping.gather_concurrently(_fetch_day_async, missing)
+    image_urls = {}
+    for date, (json_data, image_url) in fetched.items():
+        json_by_date[date] = json_data
+        image_urls[date] = image_url
 
-       
-        # Save data to the database, only insert the image if it's valid
-        db_dao.insert_data(date, json_data)
-    
     if data_only:
-        return json_data, None
+        return {date: (json_by_date[date], None) for date in dates}
+
+    images = await executors.run_io(_cached_images, dates, image_urls, expired)
+    to_download = [date for date in dates if date not in images]
+    unknown = [date for date in to_download if image_urls[date] is None and date not in missing]
+    snapshots = await scrapping.fetch_days_async(unknown)
+    await executors.run_io(_save_image_urls, snapshots, image_urls)
 
-    # Fetch solar monitor images
-    images = get_solar_monitor_images(formatted_date)
-    image = download_images(images, [formatted_date])[0]  # Download image for the date
+    downloaded = await download_images_async([image_urls[date] for date in to_download])
+    await executors.run_io(_cache_images, to_download, downloaded, images)
 
-    # Encode the image if it exists
-    if image is not None:
-        image = image_encode(image)
+    return {date: (json_by_date[date], images.get(date)) for date in dates}
 
-    return json_data, image
+
+async def get_period_series_async(dates, search_type):
+    """Garante que os dias estão no banco e agrega as manchas por mês ou ano."""
+    await cache_and_get_solar_monitor_info_from_days_async(dates, data_only=True)
+    return await executors.run_io(sunspot_store.period_series, dates, search_type)
+
+
+async def get_days_content_async(dates):
+    """Retorna {índice: json} para cada data, na ordem recebida."""
+    return _days_content(dates, await cache_and_get_solar_monitor_info_from_days_async(dates, data_only=True))
+
+
+def _days_content(dates, days_content):
+    full_content = {}
+    seen = set()
+    for count, date in enumerate(dates):
+        json_data = days_content[date][0]
+        # Datas repetidas recebem uma cópia, pois data_equalizer altera as posições
+        full_content[count] = copy.deepcopy(json_data) if date in seen else json_data
+        seen.add(date)
+    return full_content
 
 
 
@@ -280,30 +469,26 @@ def get_negative_days_arr(initial_date, number_of_days):
     return str(initial_date - datetime.timedelta(days=number_of_days)).replace(" 00:00:00", "")
 
 
-def get_solar_monitor_images(date: datetime.datetime):
-    current_date_str = date.strftime("%Y-%m-%d")
-    return [scrapping.get_table_image_from_date(current_date_str.split("-")[0],
-                                                current_date_str.split("-")[1],
-                                                current_date_str.split("-")[2])]
-
-
-def get_solar_monitor_info(date_arr):
-    table_contents = []
+def convert_table_contents_to_json(table_contents):
+    return [json.loads(table_content) for table_content in table_contents]
 
-    for day in date_arr:
-        table_contents.append(scrapping.get_table_content_from_date(day.split("-")[0],
-                                                                    day.split(
-                                                                        "-")[1],
-                                                                    day.split("-")[2]))
 
-    return table_contents
+def _parse_class(value):
+    value = (value or '').strip()
+    return None if value in ('', '-') else value
 
 
-def convert_table_contents_to_json(table_contents):
-    return [json.loads(table_content) for table_content in table_contents]
+def _parse_count(value):
+    value = (value or '').strip()
+    return int(value) if value.isdigit() else None
 
 
 def process_positions(table_contents_aux, result, days_arr):
+    # Index the existing entries by NOAA number (first occurrence wins, as in a linear search)
+    items_by_number = {}
+    for item in result:
+        items_by_number.setdefault(item['noaaNumber'], item)
+
     for i, table_content in enumerate(table_contents_aux):
         for entry in table_content:
             number = entry['NOAA Number']
@@ -313,27 +498,28 @@ def process_positions(table_contents_aux, result, days_arr):
             date = entry['Date']
             longitude = int(x_coordinate)
             latitude = int(y_coordinate)
+            hale_class = _parse_class(entry.get('Hale Class'))
+            mcintosh_class = _parse_class(entry.get('McIntosh Class'))
+            area = _parse_count(entry.get('Sunspot Area [millionths]'))
+            spots = _parse_count(entry.get('Number of Spots'))
 
             day = days_arr[i]  # Corresponding day to the current item
-            found = False
-            for item in result:
-                if item['noaaNumber'] == number:
-                    item['latestPositions'].append({'position': position, 'day': day, 'x_coordinate': x_coordinate,
-                                                    'y_coordinate': y_coordinate,
-                                                    'longitude': longitude,
-                                                    'latitude': latitude,
-                                                    'date': date})
-                    found = True
-                    break
-            if not found:
-                result.append({'noaaNumber': number, 'latestPositions':
-                               [{'position': position,
-                                 'day': day,
-                                 'x_coordinate': x_coordinate,
-                                 'y_coordinate': y_coordinate,
-                                 'longitude': longitude,
-                                 'latitude': latitude,
-                                 'date': date}]})
+            item = items_by_number.get(number)
+            if item is None:
+                item = {'noaaNumber': number, 'latestPositions': []}
+                result.append(item)
+                items_by_number[number] = item
+            item['latestPositions'].append({'position': position,
+                                            'day': day,
+                                            'x_coordinate': x_coordinate,
+                                            'y_coordinate': y_coordinate,
+                                            'longitude': longitude,
+                                            'latitude': latitude,
+                                            'date': date,
+                                            'hale_class': hale_class,
+                                            'mcintosh_class': mcintosh_class,
+                                            'area': area,
+                                            'spots': spots})
 
 
 def data_equalizer(data: dict):
@@ -343,18 +529,19 @@ def data_equalizer(data: dict):
             for position in item['latestPositions']:
                 position['day'] = date
     grouped_data = []
+    groups_by_number = {}
 
     for positions in data.values():
         for position_info in positions:
             noaa_number = position_info['noaaNumber']
             positions_list = position_info['latestPositions']
-            if not any(d['noaaNumber'] == noaa_number for d in grouped_data):
-                grouped_data.append(
-                    {'noaaNumber': noaa_number, 'latestPositions': positions_list})
+            group = groups_by_number.get(noaa_number)
+            if group is None:
+                group = {'noaaNumber': noaa_number, 'latestPositions': positions_list}
+                groups_by_number[noaa_number] = group
+                grouped_data.append(group)
             else:
-                for item in grouped_data:
-                    if item['noaaNumber'] == noaa_number:
-                        item['latestPositions'].extend(positions_list)
+                group['latestPositions'].extend(positions_list)
     return grouped_data
 
 
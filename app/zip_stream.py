@@ -0,0 +1,64 @@
+import io
+import time
+import zipfile
+
+
+class _Sink(io.RawIOBase):
+    """Destino sem seek para o zipfile: guarda os bytes escritos até serem retirados."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+class ZipStream:
+    """Monta um ZIP incrementalmente, sem manter o arquivo inteiro em memória.
+
+    Cada método devolve os bytes do arquivo produzidos até aquele ponto, prontos
+    para serem enviados; como o destino não tem seek, o zipfile grava o tamanho
+    de cada membro depois dos dados (data descriptor).
+    """
+
+    def __init__(self, compression=zipfile.ZIP_STORED):
+        self._sink = _Sink()
+        self._zip = zipfile.ZipFile(self._sink, 'w', compression)
+
+    def _info(self, name):
+        info = zipfile.ZipInfo(name, date_time=time.localtime()[:6])
+        info.compress_type = self._zip.compression
+        return info
+
+    def add(self, name, data):
+        """Adiciona um membro completo."""
+        self._zip.writestr(self._info(name), data)
+        return self._sink.drain()
+
+    def open(self, name):
+        """Abre um membro para escrita em partes; use write/close_member para obter os bytes."""
+        self._member = self._zip.open(self._info(name), 'w')
+        return self._sink.drain()
+
+    def write(self, data):
+        self._member.write(data)
+        return self._sink.drain()
+
+    def close_member(self):
+        self._member.close()
+        self._member = None
+        return self._sink.drain()
+
+    def close(self):
+        """Finaliza o arquivo (diretório central)."""
+        self._zip.close()
+        return self._sink.drain()